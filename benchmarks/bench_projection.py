@@ -0,0 +1,72 @@
+"""
+对比 select() 实例化Model 与 select_tuples/select_namedtuples/select_dicts 投影查询的耗时和内存
+使用内存SQLite代替MySQL，无需网络：
+    python benchmarks/bench_projection.py [行数]
+"""
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from peewee import SqliteDatabase, AutoField, CharField, IntegerField, DateTimeField
+
+from lightcone.database import BaseModel
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+FIELDS = ["id", "name", "score", "created"]
+
+# 与pymysql一致，由驱动直接返回datetime，避免peewee在SQLite上逐行strptime掩盖对比结果
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+db = SqliteDatabase(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+
+
+class Item(BaseModel):
+    id = AutoField()
+    name = CharField(max_length=64)
+    score = IntegerField()
+    created = DateTimeField()
+
+
+def setup():
+    db.bind([Item])
+    db.create_tables([Item])
+    now = datetime.now()
+    rows = [{"name": f"item-{i}", "score": i, "created": now} for i in range(ROWS)]
+    with db.atomic():
+        for start in range(0, ROWS, 500):
+            Item.insert_many(rows[start:start + 500]).execute()
+
+
+def model_rows():
+    fields = [Item._meta.fields[name] for name in FIELDS]
+    return [{"id": m.id, "name": m.name, "score": m.score, "created": int(m.created.timestamp())}
+            for m in Item.select(*fields)]
+
+
+def measure(name, func):
+    # 耗时和内存分开测量，避免tracemalloc的开销影响计时
+    begin = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - begin
+    del result
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<22}{len(result):>8} rows{elapsed * 1000:>10.1f} ms{peak / 1024 / 1024:>10.2f} MiB")
+    return elapsed
+
+
+def main():
+    setup()
+    baseline = measure("model -> dict", model_rows)
+    for name, func in (("select_tuples", lambda: Item.select_tuples(FIELDS)),
+                       ("select_namedtuples", lambda: Item.select_namedtuples(FIELDS)),
+                       ("select_dicts", lambda: Item.select_dicts(FIELDS))):
+        elapsed = measure(name, func)
+        print(f"{'':<22}x{baseline / elapsed:.1f} faster")
+
+
+if __name__ == "__main__":
+    main()
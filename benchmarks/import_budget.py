@@ -0,0 +1,83 @@
+"""
+检查 lightcone 的导入耗时预算，并确认导入时没有读取配置文件、没有创建数据库连接池
+在空的临时目录中执行，没有任何配置文件：
+    python benchmarks/import_budget.py --budget-ms 100
+超出预算或导入时读取了配置，返回码为1
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+
+IMPORT_SCRIPT = """
+import lightcone
+import lightcone.database
+from lightcone.database import BaseModel, DEFERRED_MYSQL
+from lightcone.utils.config import _CONFIGS
+from peewee import CharField
+
+
+class BudgetCheck(BaseModel):
+    name = CharField()
+
+
+loaded = [name for name, config in _CONFIGS.items() if config.loaded]
+assert not loaded, f"导入时读取了配置：{loaded}"
+assert DEFERRED_MYSQL.obj is None, "导入时创建了数据库连接池"
+"""
+
+
+def measure(python):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [env.get("PYTHONPATH"), SRC_DIR]))
+    with tempfile.TemporaryDirectory() as empty_dir:
+        completed = subprocess.run([python, "-X", "importtime", "-c", IMPORT_SCRIPT],
+                                   cwd=empty_dir, env=env, capture_output=True, text=True)
+    own_us = 0
+    total_us = 0
+    errors = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            if line.strip():
+                errors.append(line)
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        self_us, cumulative_us, module = int(parts[0]), int(parts[1]), parts[2].strip()
+        if module.startswith("lightcone"):
+            own_us += self_us
+        if module == "lightcone":
+            total_us = cumulative_us
+    return completed.returncode, own_us / 1000, total_us / 1000, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="lightcone import time budget")
+    parser.add_argument("--budget-ms", type=float, default=100, help="lightcone 自身模块的导入耗时预算（毫秒）")
+    parser.add_argument("--total-budget-ms", type=float, help="包含依赖在内的总导入耗时预算（毫秒）")
+    parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args(argv)
+
+    returncode, own_ms, total_ms, errors = measure(args.python)
+    if returncode != 0:
+        print("\n".join(errors))
+        print("导入失败")
+        return 1
+    print(f"lightcone modules: {own_ms:.1f}ms (budget {args.budget_ms:.1f}ms)")
+    print(f"import lightcone (cumulative): {total_ms:.1f}ms")
+    failed = own_ms > args.budget_ms
+    if args.total_budget_ms is not None and total_ms > args.total_budget_ms:
+        failed = True
+    if failed:
+        print("超出导入耗时预算")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
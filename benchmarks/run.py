@@ -0,0 +1,251 @@
+"""
+lightcone 热点路径的进程内基准测试，无需网络和MySQL：
+    请求使用 stubs.request.FakeRequest 代替 sanic Request
+    指令、Pipe、Action 使用 stubs 下的桩实现，配置见 config/
+    BaseModel 绑定到内存SQLite
+
+用法：
+    python benchmarks/run.py -o result.json                   运行并保存结果
+    python benchmarks/run.py -c baseline.json -t 0.1          与基线对比，变慢超过10%时返回码为1
+    python benchmarks/run.py -k rest -k json                  只运行名称包含关键字的用例
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_DIR = os.path.join(BENCH_DIR, "config")
+# 结果文件和基线文件相对于执行命令时的目录
+INVOCATION_DIR = os.getcwd()
+
+# lightcone 在导入时按当前目录读取配置
+os.chdir(CONFIG_DIR)
+sys.path.insert(0, BENCH_DIR)
+try:
+    import lightcone  # noqa
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+
+import sqlite3  # noqa: E402
+
+from peewee import SqliteDatabase, AutoField, CharField, IntegerField, DateTimeField  # noqa: E402
+
+from lightcone.core.action import load_action  # noqa: E402
+from lightcone.database import BaseModel  # noqa: E402
+from lightcone.gate.rest import REST  # noqa: E402
+from lightcone.gate.stream import stream_call_command  # noqa: E402
+from lightcone.utils.jsonencoder import dg_json_dumps  # noqa: E402
+from lightcone.utils.tools import params_dict_from_request  # noqa: E402
+from stubs.commands.stream import EVENTS_PER_CALL  # noqa: E402
+from stubs.request import FakeRequest  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(name, number=1000, unit="call", per_call=1):
+    """
+    注册用例，被装饰的函数返回一个无参的可调用对象，每次调用执行一次被测操作
+    :param number:      每轮调用次数
+    :param unit:        吞吐的计量单位
+    :param per_call:    每次调用处理的单位数，如流式指令每次推送的事件数
+    """
+    def decorator(func):
+        BENCHMARKS[name] = {"setup": func, "number": number, "unit": unit, "per_call": per_call}
+        return func
+    return decorator
+
+
+def _body(size):
+    # 构造接近指定字节数的JSON请求体
+    items = max(1, size // 32)
+    return json.dumps({"__command_id": "bench_echo",
+                       "__method": "get",
+                       "items": [{"id": i, "name": f"item-{i:08d}"} for i in range(items)]}).encode()
+
+
+@benchmark("rest.call_from_request", number=2000)
+def bench_rest_call():
+    request = FakeRequest(args={"__command_id": "bench_echo", "__method": "get", "page": "1"})
+    return lambda: REST.call_from_reqeust(request)
+
+
+@benchmark("rest.call_from_request.unknown_command", number=2000)
+def bench_rest_unknown():
+    request = FakeRequest(args={"__command_id": "bench_missing", "__method": "get"})
+    return lambda: REST.call_from_reqeust(request)
+
+
+@benchmark("stream.call_command", number=200, unit="event", per_call=EVENTS_PER_CALL)
+def bench_stream():
+    loop = asyncio.new_event_loop()
+
+    def run():
+        request = FakeRequest(args={"command_id": "bench_stream", "method": "get"})
+        loop.run_until_complete(stream_call_command(request))
+    return run
+
+
+@benchmark("action.load_action", number=2000)
+def bench_load_action():
+    request = FakeRequest(args={"__action": "echo"})
+    return lambda: load_action(request)
+
+
+for _size in (256, 16 * 1024, 256 * 1024):
+    def _register(size):
+        @benchmark(f"params_dict_from_request.{size}b", number=max(20, 200000 // size), unit="byte", per_call=size)
+        def bench_params():
+            request = FakeRequest(args={"page": "1"}, body=_body(size))
+            return lambda: params_dict_from_request(request)
+    _register(_size)
+
+
+@benchmark("dg_json_dumps", number=500)
+def bench_json_dumps():
+    now = datetime.now()
+    data = {"code": 200,
+            "result": [{"id": i, "name": f"item-{i}", "score": i * 1.5, "created": now, "deleted": None}
+                       for i in range(100)]}
+    return lambda: dg_json_dumps(data)
+
+
+_sqlite = None
+
+
+class BenchItem(BaseModel):
+    id = AutoField()
+    name = CharField(max_length=64)
+    score = IntegerField(default=0)
+    created = DateTimeField(null=True)
+    modified = DateTimeField(null=True)
+
+
+def _database():
+    global _sqlite
+    if _sqlite is None:
+        _sqlite = SqliteDatabase(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+        _sqlite.bind([BenchItem])
+        _sqlite.create_tables([BenchItem])
+        BenchItem.insert_many([{"name": f"item-{i}", "score": i} for i in range(1000)]).execute()
+    return _sqlite
+
+
+@benchmark("basemodel.update_or_create.update", number=500)
+def bench_update_or_create():
+    _database()
+    item = BenchItem.get_by_id(1)
+
+    def run():
+        item.score += 1
+        item.update_or_create()
+    return run
+
+
+@benchmark("basemodel.update_or_create.create", number=500)
+def bench_update_or_create_insert():
+    _database()
+    return lambda: BenchItem(name="new").update_or_create()
+
+
+@benchmark("basemodel.select_dicts", number=50, unit="row", per_call=1000)
+def bench_select_dicts():
+    _database()
+    return lambda: BenchItem.select_dicts(["id", "name", "score", "created"])
+
+
+def run_benchmark(name, spec, repeat):
+    func = spec["setup"]()
+    number = spec["number"]
+    for _ in range(max(1, number // 10)):
+        func()
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - begin) / number)
+    median = statistics.median(timings)
+    return {"number": number,
+            "repeat": repeat,
+            "median_s": median,
+            "min_s": min(timings),
+            "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "unit": spec["unit"],
+            "throughput": spec["per_call"] / median if median > 0 else 0.0,
+            }
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线逐项对比中位数耗时，返回变慢超过阈值的用例
+    """
+    regressions = []
+    base_results = baseline.get("results", {})
+    print(f"\n{'benchmark':<45}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in results.items():
+        base = base_results.get(name)
+        if base is None:
+            print(f"{name:<45}{'-':>12}{_format_time(result['median_s']):>12}{'new':>10}")
+            continue
+        change = result["median_s"] / base["median_s"] - 1 if base["median_s"] > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<45}{_format_time(base['median_s']):>12}{_format_time(result['median_s']):>12}"
+              f"{change * 100:>9.1f}%{flag}")
+    return regressions
+
+
+def _format_time(seconds):
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds * 1e6:.1f}us"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="lightcone benchmarks")
+    parser.add_argument("-o", "--output", help="结果输出的JSON文件")
+    parser.add_argument("-c", "--compare", help="对比的基线JSON文件")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1, help="判定变慢的比例，默认0.1")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="每个用例的轮数，默认5")
+    parser.add_argument("-k", "--keyword", action="append", help="只运行名称包含关键字的用例，可重复")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, spec in BENCHMARKS.items():
+        if args.keyword and not any(keyword in name for keyword in args.keyword):
+            continue
+        result = run_benchmark(name, spec, args.repeat)
+        results[name] = result
+        print(f"{name:<45}{_format_time(result['median_s']):>12}"
+              f"{result['throughput']:>14.0f} {result['unit']}/s")
+
+    report = {"meta": {"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "timestamp": int(time.time()),
+                       },
+              "results": results,
+              }
+    if args.output:
+        with open(os.path.join(INVOCATION_DIR, args.output), "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(os.path.join(INVOCATION_DIR, args.compare)) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 个用例变慢超过 {args.threshold * 100:.0f}%：{', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
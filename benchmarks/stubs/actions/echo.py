@@ -0,0 +1,7 @@
+from lightcone.core import Action, ActionResponseCode
+
+
+class Echo(Action):
+    def render(self) -> None:
+        self.result = {"ok": True}
+        self.response_code = ActionResponseCode.SUCCESS
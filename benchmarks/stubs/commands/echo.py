@@ -0,0 +1,15 @@
+from lightcone.core import Command
+
+
+class Echo(Command):
+    """
+    原样返回参数，用于测量Gate本身的开销
+    """
+
+    def run(self, param, method) -> bool:
+        self.result = param
+        return True
+
+    async def async_run(self, param, method) -> bool:
+        self.result = param
+        return True
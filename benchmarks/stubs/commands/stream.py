@@ -0,0 +1,19 @@
+from lightcone.core import Command
+
+# 每次调用推送的事件数
+EVENTS_PER_CALL = 100
+EVENT_MESSAGE = "x" * 64
+
+
+class Stream(Command):
+    """
+    通过 stream_callback 连续推送事件，用于测量流式输出的吞吐
+    """
+
+    def run(self, param, method) -> bool:
+        return False
+
+    async def async_run(self, param, method) -> bool:
+        for _ in range(EVENTS_PER_CALL):
+            await self.stream_callback(EVENT_MESSAGE)
+        return True
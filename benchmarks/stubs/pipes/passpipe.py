@@ -0,0 +1,6 @@
+from lightcone.gate.base.pipe import Pipe, PipeReturnStatus
+
+
+class Passpipe(Pipe):
+    def run(self, cmd, response=None) -> PipeReturnStatus:
+        return PipeReturnStatus.PASS
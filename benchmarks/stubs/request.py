@@ -0,0 +1,42 @@
+import uuid
+
+
+class FakeStreamResponse:
+    """
+    代替 sanic 的 HTTPResponse 流式响应，只统计发送的数据量
+    """
+
+    def __init__(self):
+        self.status = 200
+        self.headers = {}
+        self.sent = 0
+        self.events = 0
+
+    async def send(self, data):
+        self.sent += len(data)
+        self.events += 1
+
+    async def eof(self):
+        pass
+
+
+class FakeRequest:
+    """
+    代替 sanic.request.Request，只提供 lightcone 用到的属性
+    """
+
+    def __init__(self, args=None, form=None, body=b"", ip="127.0.0.1", headers=None):
+        self.id = uuid.uuid4()
+        self.method = "POST"
+        self.path = "/"
+        self.args = args or {}
+        self.form = form or {}
+        self.body = body
+        self.ip = ip
+        self.headers = headers or {}
+        self.stream_response = None
+
+    async def respond(self, content_type=None, headers=None):
+        self.stream_response = FakeStreamResponse()
+        self.stream_response.headers.update(headers or {})
+        return self.stream_response
@@ -1,3 +1,8 @@
-from lightcone.core.action import load_action as action_handler
+from lightcone.core.action import async_load_action as action_handler
 from .gate.rest import rest_call_command as rest_command_handler
+from .gate.rest import rest_upload_command as rest_upload_handler
 from .gate.stream import stream_call_command as stream_command_handler
+from .utils.compression import compression_middleware
+from .utils.metrics import metrics_handler
+from .utils.profiler import profiler_handler
+from .bootstrap import bootstrap, setup_app, use_fork_start_method
@@ -0,0 +1,213 @@
+import gc
+import os
+import time
+
+import inspect
+
+from gramai.utils import load_class, concat
+from sanic import Sanic
+
+from lightcone.core import Command
+from lightcone.core.action import build_action_registry
+from lightcone.database.mysql import DEFERRED_MYSQL
+from lightcone.gate.base.gate import PROJ, pipe_config, command_config
+from lightcone.gate.base.pipe import Pipe
+from lightcone.gate.base.schema import compile_schema, SchemaError
+from lightcone.utils.compression import compression_middleware
+from lightcone.utils.metrics import METRICS
+from lightcone.utils.log import LOG_WRITER
+from lightcone.utils.tools import logging
+
+WORKER_SHARED_BYTES = METRICS.gauge("lightcone_worker_shared_bytes", "worker与其他进程共享的内存（字节）", ("pid",))
+WORKER_PRIVATE_BYTES = METRICS.gauge("lightcone_worker_private_bytes", "worker独占的内存（字节）", ("pid",))
+WORKER_FIRST_REQUEST_SECONDS = METRICS.gauge("lightcone_worker_first_request_seconds",
+                                             "worker处理第一个请求的耗时（秒）", ("pid",))
+
+_worker_state = {"first_started": None, "served": False}
+
+
+def bootstrap(strict=False, freeze=True) -> dict:
+    """
+    在主进程fork worker之前调用：
+        读取全部配置，导入并校验 commands.json 中的指令、pipes.json 中的Pipe、web.action 下的Action
+        关闭主进程中可能已创建的数据库连接，保证连接只在worker中建立
+        gc.freeze() 把已导入的对象移出GC扫描范围，减少worker中写时复制导致的内存复制
+    :param strict: True-存在无法加载的指令、Pipe或Action时抛出异常
+    :param freeze: 是否执行 gc.freeze()
+    :return: 预加载报告
+    """
+    started = time.perf_counter()
+    for config in (PROJ, pipe_config, command_config):
+        config.load()
+
+    errors = []
+    commands = _load_commands(errors)
+    pipes = _load_pipes(errors)
+    actions, action_errors = build_action_registry()
+    errors.extend(f"action {module}: {e}" for module, e in action_errors)
+
+    if DEFERRED_MYSQL.obj is not None and hasattr(DEFERRED_MYSQL.obj, "close_all"):
+        # 连接不能跨进程共享，fork前关闭主进程中的连接
+        DEFERRED_MYSQL.obj.close_all()
+
+    if freeze and hasattr(gc, "freeze"):
+        gc.collect()
+        gc.freeze()
+
+    report = {"commands": commands,
+              "pipes": pipes,
+              "actions": len(actions),
+              "errors": errors,
+              "seconds": time.perf_counter() - started,
+              "frozen": gc.get_freeze_count() if freeze and hasattr(gc, "get_freeze_count") else 0,
+              }
+    logging.info(f"预加载完成：{commands} 个指令，{pipes} 个Pipe，{len(actions)} 个Action，"
+                 f"{len(errors)} 个错误，耗时 {report['seconds'] * 1000:.0f}ms")
+    for error in errors:
+        logging.error(f"预加载失败：{error}")
+    if strict and errors:
+        raise ImportError(f"预加载失败：{'; '.join(errors)}")
+    return report
+
+
+def use_fork_start_method():
+    """
+    把 sanic worker 的启动方式设置为 fork（默认spawn无法共享主进程已导入的模块和预加载的结果）
+    Sanic.start_method 是类属性，对进程中的所有 Sanic 应用生效，应在入口处、app.run 之前调用：
+        if __name__ == "__main__":
+            use_fork_start_method()
+            app.run(workers=4)
+    """
+    Sanic.start_method = "fork"
+
+
+def setup_app(app, strict=False, freeze=True, compress=True, async_logging=True):
+    """
+    为 sanic app 注册预加载：
+        主进程启动时（fork之前）执行 bootstrap
+        worker处理完第一个请求时，记录该请求的耗时和worker的内存共享情况
+    worker的启动方式是进程全局的设置，不在这里修改，需要在入口处调用 use_fork_start_method
+    :param compress: 是否注册按 Accept-Encoding 压缩响应的中间件
+    :param async_logging: 是否在worker中由后台线程写日志，请求处理中只把日志放入队列
+    """
+
+    def main_process_start(*_):
+        if Sanic.start_method != "fork":
+            logging.warning("worker未使用fork启动，无法共享预加载的模块，请在入口处调用 use_fork_start_method()")
+        bootstrap(strict=strict, freeze=freeze)
+
+    async def first_request(request):
+        _ = request
+        if _worker_state["first_started"] is None:
+            _worker_state["first_started"] = time.perf_counter()
+
+    async def first_response(request, response):
+        _ = request
+        if not _worker_state["served"]:
+            _worker_state["served"] = True
+            report_worker()
+
+    def start_log_writer(*_):
+        LOG_WRITER.start()
+
+    def stop_log_writer(*_):
+        LOG_WRITER.stop()
+
+    app.register_listener(main_process_start, "main_process_start")
+    if async_logging:
+        app.register_listener(start_log_writer, "before_server_start")
+        app.register_listener(stop_log_writer, "after_server_stop")
+    app.register_middleware(first_request, "request")
+    app.register_middleware(first_response, "response")
+    if compress:
+        app.register_middleware(compression_middleware, "response")
+    return app
+
+
+def report_worker() -> dict:
+    """
+    记录当前worker第一个请求的耗时和内存共享情况（Linux下读取 /proc/self/smaps_rollup）
+    """
+    pid = str(os.getpid())
+    report = {"pid": pid}
+    if _worker_state["first_started"] is not None:
+        report["first_request_seconds"] = time.perf_counter() - _worker_state["first_started"]
+        WORKER_FIRST_REQUEST_SECONDS.set((pid,), report["first_request_seconds"])
+
+    memory = memory_usage()
+    if memory:
+        report.update(memory)
+        WORKER_SHARED_BYTES.set((pid,), memory["shared_bytes"])
+        WORKER_PRIVATE_BYTES.set((pid,), memory["private_bytes"])
+    logging.info(f"worker {pid}：{report}")
+    return report
+
+
+def memory_usage() -> dict:
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return {}
+    values = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+            values[parts[0][:-1]] = int(parts[1]) * 1024
+    shared = values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0)
+    private = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return {"rss_bytes": values.get("Rss", 0),
+            "pss_bytes": values.get("Pss", 0),
+            "shared_bytes": shared,
+            "private_bytes": private,
+            }
+
+
+def _load_commands(errors) -> int:
+    try:
+        commands = command_config.to_dict()
+    except Exception as e:
+        errors.append(f"commands.json: {e}")
+        return 0
+    loaded = 0
+    for command_id, item in commands.items():
+        if not isinstance(item, dict):
+            continue
+        try:
+            command_class = load_class(item.get("module"), item.get("class", ""))
+            valid = inspect.isclass(command_class) and issubclass(command_class, Command)
+        except Exception as e:
+            errors.append(f"command {command_id}: {item.get('module')}.{item.get('class')}: {e}")
+            continue
+        if not valid:
+            errors.append(f"command {command_id}: {item.get('module')}.{item.get('class')}")
+            continue
+        if item.get("params") is not None:
+            try:
+                compile_schema(item["params"])
+            except (SchemaError, KeyError, TypeError) as e:
+                errors.append(f"command {command_id} params: {e}")
+                continue
+        loaded += 1
+    return loaded
+
+
+def _load_pipes(errors) -> int:
+    try:
+        pipes = pipe_config.to_dict()
+    except Exception as e:
+        errors.append(f"pipes.json: {e}")
+        return 0
+    names = set()
+    for item in pipes.values():
+        if isinstance(item, dict):
+            for stage in ("before", "after"):
+                names.update(item.get(stage) or [])
+    loaded = 0
+    for pipe in sorted(names):
+        module_name = concat(PROJ.get("web.pipe"), pipe.lower(), ".")
+        if load_class(module_name, pipe.split(".")[-1], Pipe) is None:
+            errors.append(f"pipe {pipe}: {module_name}")
+            continue
+        loaded += 1
+    return loaded
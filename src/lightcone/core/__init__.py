@@ -1,2 +1,2 @@
-from .action import Action, ActionResponseCode
+from .action import Action, ActionResponseCode, build_action_registry
 from .command import Command
\ No newline at end of file
@@ -1,17 +1,25 @@
+import asyncio
 from abc import abstractmethod
+from contextlib import contextmanager
 from enum import Enum
 from typing import cast
 
-from gramai.utils.config import Config
-from gramai.utils import load_class, concat
 from sanic.request import Request
 from sanic.response import JSONResponse
 
+from lightcone.core.registry import ClassRegistry
+from lightcone.utils.config import lazy_config
+from lightcone.utils.deadline import deadline_scope, deadline_exceeded, request_timeout
+from lightcone.utils.log import log_scope
+from lightcone.utils.tracing import trace_request, span
 from lightcone.utils.jsonencoder import r_json
+from lightcone.utils.memory import MEMORY
+from lightcone.utils.profiler import PROFILER, KIND_ACTION
+from lightcone.utils.recorder import RECORDER
 from lightcone.utils.tools import get_param_from_request
 from lightcone.utils.tools import logging
 
-PROJ = Config("proj.ini")
+PROJ = lazy_config("proj.ini")
 
 
 class ActionResponseCode(Enum):
@@ -36,6 +44,8 @@ class Action:
     返回结果要求必须是字符串、数字或其他符合JSON规范的类型，存入 self.result
     可以把处理结以外的信息通过 self.message 传递
     可以通过 self.request 获取完整请求实例
+    需要访问数据库或HTTP后端的Action可以改为重写 render_async（以及 before_method_async/after_method_async），
+    由 async_load_action 在事件循环中 await 执行；只重写 render 的Action会被放入线程池执行
     """
 
     def __init__(self, request: Request):
@@ -49,6 +59,25 @@ class Action:
     def render(self) -> None:
         pass
 
+    async def render_async(self) -> None:
+        """
+        异步渲染，重写后该Action按异步方式执行，render 不再被调用
+        """
+
+    async def before_method_async(self) -> bool:
+        """
+        异步Action在render_async之前运行，默认直接调用 before_method
+        before_method 中有阻塞操作时应重写本方法
+        """
+        return self.before_method()
+
+    async def after_method_async(self) -> bool:
+        """
+        异步Action在render_async之后运行，默认直接调用 after_method
+        after_method 中有阻塞操作时应重写本方法
+        """
+        return self.after_method()
+
     def before_method(self) -> bool:
         """
         在render之前运行
@@ -67,6 +96,17 @@ class Action:
         _ = self
         return True
 
+    @property
+    def is_async(self) -> bool:
+        return type(self).render_async is not Action.render_async
+
+    @staticmethod
+    def deadline_exceeded() -> bool:
+        """
+        请求头声明的截止时间已过或客户端已断开
+        """
+        return deadline_exceeded()
+
     @property
     def request(self):
         return self._request
@@ -76,47 +116,99 @@ class Action:
         raise AttributeError("只读属性")
 
 
+# Action注册表，名称为 __action 参数的小写形式，如 user.login -> {web.action}.user.login.Login
+ACTION_REGISTRY = ClassRegistry(base=Action,
+                                prefix_getter=lambda: PROJ.get("web.action"),
+                                class_name_getter=lambda name: name.split(".")[-1].capitalize())
+
+
+def build_action_registry(strict=False):
+    """
+    启动时扫描 web.action 包，导入全部Action并生成只读注册表
+    之后 load_action 只查表，未注册的名称直接返回404，不再尝试导入
+    应在主进程（fork worker之前）调用，如 sanic 的 main_process_start 监听
+    :param strict: True-存在无法导入的Action模块时抛出异常
+    :return: (名称->Action类 的只读映射, 导入错误列表)
+    """
+    return ACTION_REGISTRY.build(strict=strict)
+
+
 def build_response(code: ActionResponseCode, message: str, result=None, success=False) -> JSONResponse:
     return r_json({"code": code.value, "success": success, "message": message, "result": result})
 
 
 def load_action(request: Request) -> JSONResponse:
+    with _action_scope(request):
+        action_name, current_action = _instantiate_action(request)
+        if current_action is None:
+            return build_response(code=ActionResponseCode.ACTION_NOT_FOUND,
+                                  message=MESSAGE_NOT_FOUND)
+        return _profiled_run_action(action_name, current_action)
+
+
+async def async_load_action(request: Request) -> JSONResponse:
+    """
+    异步版本的 load_action
+    重写了 render_async 的Action在事件循环中依次 await 前置方法、render_async、后置方法
+    只实现了 render 的Action整体放入线程池执行，不阻塞事件循环
+    """
+    with _action_scope(request):
+        return await _async_load_action(request)
+
+
+@contextmanager
+def _action_scope(request: Request):
+    """
+    load_action 和 async_load_action 共用的请求级上下文：请求录制、截止时间、日志上下文和trace
+    """
+    with RECORDER.record(KIND_ACTION, request, "__action"), deadline_scope(request_timeout(request), request), \
+            log_scope(request_id=request.id), trace_request(request):
+        yield
+
+
+async def _async_load_action(request: Request) -> JSONResponse:
+    action_name, current_action = _instantiate_action(request)
+    if current_action is None:
+        return build_response(code=ActionResponseCode.ACTION_NOT_FOUND,
+                              message=MESSAGE_NOT_FOUND)
+    if current_action.is_async:
+        with PROFILER.profile(KIND_ACTION, action_name.lower(), loop_wide=True), \
+                MEMORY.track(KIND_ACTION, action_name.lower()), span(f"action {action_name}"):
+            return await _async_run_action(action_name, current_action)
+    return await asyncio.to_thread(_profiled_run_action, action_name, current_action)
+
+
+def _instantiate_action(request: Request):
     action_name = None
     action_class = None
     try:
         action_name = get_param_from_request(request, "__action")
-        class_name = action_name.lower().split(".")[-1].capitalize()
-        module_name = concat(PROJ.get("web.action"), action_name.lower(), ".")
-        action_class = load_class(module_name, class_name, Action)
+        action_class = ACTION_REGISTRY.get(action_name)
     except Exception as e:
         logging.warning(f"加载Action失败：{e}")
 
     if action_class is None:
-        return build_response(code=ActionResponseCode.ACTION_NOT_FOUND,
-                              message=MESSAGE_NOT_FOUND)
+        return action_name, None
 
     current_action = None
     try:
         current_action = cast(Action, action_class(request))
     except Exception as e:
         logging.warning(f"实例化Action失败：{e}")
+    return action_name, current_action
 
-    if current_action is None:
-        return build_response(code=ActionResponseCode.ACTION_NOT_FOUND,
-                              message=MESSAGE_NOT_FOUND)
 
+def _profiled_run_action(action_name, current_action: Action) -> JSONResponse:
+    with PROFILER.profile(KIND_ACTION, action_name.lower()), MEMORY.track(KIND_ACTION, action_name.lower()), \
+            span(f"action {action_name}"):
+        return _run_action(action_name, current_action)
+
+
+def _run_action(action_name, current_action: Action) -> JSONResponse:
     try:
         # 前置方法运行失败
         if current_action.before_method() is False:
-            response_code = current_action.response_code
-            if response_code is not None:
-                logging.warning(f"Action {action_name} before methods running with an error.")
-                return build_response(code=response_code,
-                                      message=current_action.response_message)
-            else:
-                logging.error(f"Action {action_name} before methods running with an unexpected error.")
-                return build_response(code=ActionResponseCode.RUNNING_ERROR,
-                                      message=current_action.response_message)
+            return _build_method_failed_response(action_name, current_action, "before")
 
         current_action.render()
         response_code = current_action.response_code
@@ -125,21 +217,52 @@ def load_action(request: Request) -> JSONResponse:
 
         # 后置方法运行失败
         if current_action.after_method() is False:
-            response_code = current_action.response_code
-            if response_code is not None:
-                logging.warning(f"Action {action_name} after methods running with an error.")
-                return build_response(code=response_code,
-                                      message=current_action.response_message)
-            else:
-                logging.error(f"Action {action_name} after methods running with an unexpected error.")
-                return build_response(code=ActionResponseCode.RUNNING_ERROR,
-                                      message=current_action.response_message)
+            return _build_method_failed_response(action_name, current_action, "after")
+    except Exception as e:
+        logging.error(f"Action执行异常：{e}")
+        return build_response(code=ActionResponseCode.UNEXPECTED_ERROR,
+                              message=MESSAGE_UNEXPECTED
+                              )
+
+    return _build_result_response(action_name, response_code, message, result)
+
+
+async def _async_run_action(action_name, current_action: Action) -> JSONResponse:
+    try:
+        # 前置方法运行失败
+        if await current_action.before_method_async() is False:
+            return _build_method_failed_response(action_name, current_action, "before")
+
+        await current_action.render_async()
+        response_code = current_action.response_code
+        message = current_action.response_message
+        result = current_action.result
+
+        # 后置方法运行失败
+        if await current_action.after_method_async() is False:
+            return _build_method_failed_response(action_name, current_action, "after")
     except Exception as e:
         logging.error(f"Action执行异常：{e}")
         return build_response(code=ActionResponseCode.UNEXPECTED_ERROR,
                               message=MESSAGE_UNEXPECTED
                               )
 
+    return _build_result_response(action_name, response_code, message, result)
+
+
+def _build_method_failed_response(action_name, current_action: Action, stage: str) -> JSONResponse:
+    response_code = current_action.response_code
+    if response_code is not None:
+        logging.warning(f"Action {action_name} {stage} methods running with an error.")
+        return build_response(code=response_code,
+                              message=current_action.response_message)
+    else:
+        logging.error(f"Action {action_name} {stage} methods running with an unexpected error.")
+        return build_response(code=ActionResponseCode.RUNNING_ERROR,
+                              message=current_action.response_message)
+
+
+def _build_result_response(action_name, response_code, message, result) -> JSONResponse:
     if response_code.value == ActionResponseCode.SUCCESS.value:
         return build_response(code=ActionResponseCode.SUCCESS,
                               success=True,
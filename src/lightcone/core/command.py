@@ -1,6 +1,8 @@
 from abc import abstractmethod, ABC
 from typing import final
 
+from lightcone.utils.deadline import deadline_exceeded, remaining
+
 
 class Command(ABC):
     """
@@ -28,6 +30,30 @@ class Command(ABC):
         """
             异步执行指令，需要被重写。
         """
+
+    def version_key(self, param, method):
+        """
+        可选重写：返回结果的版本标识（如数据的更新时间、版本号），用于生成 ETag
+        在 commands.json 中配置了 "etag": true 的指令，客户端缓存的版本与之相同时直接返回304，不再执行 run
+        必须比执行 run 的代价小得多；返回None时按响应内容计算 ETag
+        """
+        _ = self, param, method
+        return None
+
+    @staticmethod
+    def deadline_exceeded() -> bool:
+        """
+        请求的截止时间已过或客户端已断开，耗时较长的同步指令应定期检查并尽早返回
+        """
+        return deadline_exceeded()
+
+    @staticmethod
+    def remaining_time():
+        """
+        距离截止时间的秒数，没有截止时间时返回None
+        """
+        return remaining()
+
     @property
     @final
     def command_id(self):
@@ -0,0 +1,104 @@
+import importlib
+import inspect
+import pkgutil
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+from gramai.utils import load_class, concat
+
+from lightcone.utils.tools import logging
+
+# 未预加载时，找不到的类名最多缓存的数量，防止随机名称撑爆内存
+MISSING_CACHE_SIZE = 1024
+
+
+class ClassRegistry:
+    """
+    按 "包前缀.名称" 规则加载类的注册表
+        预加载：build() 扫描整个包，导入全部模块，生成只读的 名称->类 映射，之后只查表、不再导入
+        未预加载：首次访问时按名称导入并缓存，导入失败的名称进入否定缓存，不会反复尝试导入
+    在主进程启动时调用 build()，fork出来的worker进程可以共享已导入的模块
+    """
+
+    def __init__(self, base, prefix_getter, class_name_getter):
+        """
+        :param base:                类必须继承的基类
+        :param prefix_getter:       返回包前缀的函数，调用时才读取配置
+        :param class_name_getter:   根据名称（小写、点分）返回类名的函数
+        """
+        self._base = base
+        self._prefix_getter = prefix_getter
+        self._class_name_getter = class_name_getter
+        self._lock = threading.Lock()
+        self._classes = None
+        self._resolved = {}
+        self._missing = OrderedDict()
+
+    @property
+    def built(self) -> bool:
+        return self._classes is not None
+
+    @property
+    def classes(self):
+        return self._classes if self._classes is not None else MappingProxyType(dict(self._resolved))
+
+    def build(self, strict=False):
+        """
+        扫描包前缀下的全部模块，返回 (只读映射, 错误列表)
+        :param strict: True-存在无法导入的模块时抛出异常，用于启动时尽早发现拼写或依赖错误
+        """
+        prefix = self._prefix_getter()
+        classes = {}
+        errors = []
+        package = importlib.import_module(prefix)
+        package_paths = getattr(package, "__path__", None) or []
+        for module_info in pkgutil.walk_packages(package_paths, f"{prefix}."):
+            if module_info.ispkg:
+                continue
+            name = module_info.name[len(prefix) + 1:].lower()
+            try:
+                module = importlib.import_module(module_info.name)
+            except Exception as e:
+                errors.append((module_info.name, e))
+                logging.error(f"预加载模块 {module_info.name} 失败：{e}")
+                continue
+            target = getattr(module, self._class_name_getter(name), None)
+            if inspect.isclass(target) and issubclass(target, self._base) and target is not self._base:
+                classes[name] = target
+
+        if strict and errors:
+            raise ImportError(f"预加载 {prefix} 失败：{', '.join(module for module, _ in errors)}")
+
+        with self._lock:
+            self._classes = MappingProxyType(classes)
+            self._missing.clear()
+        logging.info(f"预加载 {prefix}：{len(classes)} 个类，{len(errors)} 个错误")
+        return self._classes, errors
+
+    def get(self, name):
+        if not name:
+            return None
+        name = name.lower()
+        if self._classes is not None:
+            return self._classes.get(name)
+
+        target = self._resolved.get(name)
+        if target is not None or name in self._missing:
+            return target
+
+        try:
+            module_name = concat(self._prefix_getter(), name, ".")
+            target = load_class(module_name, self._class_name_getter(name), self._base)
+        except Exception as e:
+            logging.warning(f"加载 {name} 失败：{e}")
+            target = None
+
+        with self._lock:
+            if target is None:
+                self._missing[name] = True
+                while len(self._missing) > MISSING_CACHE_SIZE:
+                    self._missing.popitem(last=False)
+            else:
+                self._resolved[name] = target
+        return target
@@ -1,2 +1,4 @@
 from .basemodel import BaseModel
-from .mysql import MySQL
+from .mysql import MySQL, DeferredDatabase, DEFERRED_MYSQL
+from .writebehind import flush_write_behind, write_behind_metrics
+from .negativecache import clear_negative_cache
@@ -1,14 +1,31 @@
+from collections import namedtuple
+
 from peewee import DoesNotExist
 from peewee import Model
+from peewee import Node
+from peewee import DateTimeField, TimestampField, UUIDField, BinaryUUIDField
 
 from gramai.utils import is_dict
-from lightcone.database.mysql import MySQL
+from lightcone.database.mysql import DEFERRED_MYSQL
+from lightcone.database.negativecache import get_negative_cache, normalize_key
+from lightcone.database.writebehind import get_write_behind_buffer
+from lightcone.utils.jsonencoder import dg_json_value
+from lightcone.utils.sharedcache import get_shared_cache
 from lightcone.utils.tools import logging
 
+# 投影查询中需要转换为JSON友好形式的字段类型
+_PROJECTION_CONVERT_FIELDS = (DateTimeField, TimestampField, UUIDField, BinaryUUIDField)
+# 投影查询的namedtuple类型缓存，key为 (Model, 字段名元组)
+_PROJECTION_NAMEDTUPLES = {}
+# 行缓存默认使用的共享缓存
+_ROW_CACHE_NAME = "rows"
+_ROW_CACHE_TTL = 60
+
 
 class BaseModel(Model):
     class Meta:
-        database = MySQL().conn
+        # 延迟到第一次查询时才创建连接池，定义Model不再依赖 mysql.ini
+        database = DEFERRED_MYSQL
 
     @classmethod
     def insert_exclude_fields(cls) -> list:
@@ -56,6 +73,9 @@ class BaseModel(Model):
             primary_key_value = insert[primary_key_field_name]
         if is_dict(__data) and primary_key_field_name in __data:  # __data的优先级更高
             primary_key_value = __data[primary_key_field_name]
+        # 写入的值不再是"确定不存在"
+        cls._record_exists_present(__data)
+        cls._record_exists_present(insert)
         # 把主键值记录在返回的query中，供插入成功后使用
         insert_query = super().insert(__data, **insert)
         insert_query.primary_key_value = primary_key_value
@@ -77,19 +97,238 @@ class BaseModel(Model):
             if is_dict(update) and exclude_key in update:
                 del update[exclude_key]
 
+        cls._record_exists_present(__data)
+        cls._record_exists_present(update)
         return super().update(__data, **update)
 
+    @classmethod
+    def insert_many(cls, rows, fields=None):
+        """
+        重写insert_many方法，批量写入的值同步到 exists 的否定缓存
+        """
+        if cls.exists_cache_options():
+            rows = list(rows)
+            for row in rows:
+                if is_dict(row):
+                    cls._record_exists_present(row)
+                elif fields is not None:
+                    cls._record_exists_present(dict(zip(fields, row)))
+                else:
+                    cls._record_exists_present(dict(zip(cls._meta.sorted_fields, row)))  # noqa
+        return super().insert_many(rows, fields)
+
+    @classmethod
+    def write_behind_options(cls):
+        """
+        写缓冲配置，默认返回None（不启用）
+        子类返回字典即启用 insert_deferred / increase_deferred 的异步批量写入：
+            max_size:       缓冲条数达到该值时立即刷新，默认500
+            interval:       定时刷新间隔（秒），默认1.0
+            max_pending:    缓冲上限，超过后在调用方同步刷新，默认10000
+            batch_size:     单条 insert 语句的最大行数，默认500
+            max_retries:    刷新失败后放回缓冲重试的次数，连续失败超过后丢弃，默认3
+        e.g.
+        class AuditLog(BaseModel):
+            @classmethod
+            def write_behind_options(cls):
+                return {"max_size": 200, "interval": 0.5}
+        """
+        return None
+
+    @classmethod
+    def insert_deferred(cls, __data=None, **insert):
+        """
+        延迟插入：数据先进入写缓冲，由后台线程合并为多行 INSERT 写入，不返回主键
+        未启用写缓冲时同步执行 insert
+        """
+        data = dict(__data) if is_dict(__data) else {}
+        data.update(insert)
+        for exclude_key in cls.insert_exclude_fields():
+            data.pop(exclude_key, None)
+        cls._filter_dict_by_attrs(data)
+
+        buffer = cls._write_behind_buffer()
+        if buffer is None:
+            return cls.insert(**data).execute()
+        cls._record_exists_present(data)
+        buffer.add_insert(data)
+        return None
+
+    @classmethod
+    def increase_deferred(cls, primary_key_value, **deltas):
+        """
+        延迟累加计数器：同一主键、同一字段的增量在缓冲中合并，刷新时执行 field = field + delta
+        未启用写缓冲时同步执行 update
+        e.g.
+        Article.increase_deferred(1000, view_count=1, like_count=2)
+        """
+        deltas = {field: delta for field, delta in deltas.items() if field in cls._meta.fields}  # noqa
+        if not deltas:
+            return None
+
+        buffer = cls._write_behind_buffer()
+        if buffer is None:
+            data = {field: cls._meta.fields[field] + delta for field, delta in deltas.items()}  # noqa
+            return cls.update(**data).where(cls._meta.primary_key == primary_key_value).execute()  # noqa
+        buffer.add_counter(primary_key_value, deltas)
+        return None
+
+    @classmethod
+    def _write_behind_buffer(cls):
+        options = cls.write_behind_options()
+        if not is_dict(options):
+            return None
+        return get_write_behind_buffer(cls, **options)
+
+    @classmethod
+    def exists_cache_options(cls):
+        """
+        exists 的否定缓存配置，默认返回None（不启用）
+        子类返回 {字段名: 配置} 即对该字段的单字段 exists 查询启用缓存，"确定不存在"的值不再查询数据库：
+            type:               "absent"（默认）-TTL有效期内的不存在集合 / "bloom"-从数据表加载的布隆过滤器
+            ttl:                absent，不存在记录的有效期（秒），默认30
+            max_size:           absent，最大记录数，默认100000
+            capacity:           bloom，预期容量，默认1000000
+            error_rate:         bloom，误判率，默认0.01
+            rebuild_interval:   bloom，从数据表重建的间隔（秒），默认600
+        bloom 要求数据库按字节比较字段值，MySQL 上不区分大小写的字符串字段会退回 absent，见 bloom_supported
+        这类字段的 absent 缓存在写入时按 fold_key 失效折叠后相同的值（写入 "ABC" 后 "abc" 不再被认为不存在）
+        本进程内经 insert/insert_many/update/insert_deferred 写入的值会立即同步到缓存
+        其他进程或绕过BaseModel的写入，在 ttl / rebuild_interval 后可见，也可调用 clear_negative_cache 主动清理
+        e.g.
+        class Order(BaseModel):
+            @classmethod
+            def exists_cache_options(cls):
+                return {"order_no": {"type": "bloom", "capacity": 5000000}}
+        """
+        return None
+
     @classmethod
     def exists(cls, **kwargs):
+        cache = None
+        cache_key = None
+        if len(kwargs) == 1:
+            field_name, value = next(iter(kwargs.items()))
+            cache = cls._exists_cache(field_name)
+            if cache is not None:
+                cache_key = cls._exists_cache_key(field_name, value)
+                if cache_key is None:
+                    cache = None
+                elif cache.known_absent(cache_key):
+                    return False
+
         try:
             query = cls.select()
             for field, value in kwargs.items():
                 query = query.where(getattr(cls, field) == value)
-                return query.exists()
+            result = query.exists()
         except Exception as e:
             logging.info(f"查询出错：{e}")
             return False
 
+        if cache is not None and not result:
+            cache.record_absent(cache_key)
+        return result
+
+    @classmethod
+    def _exists_cache(cls, field_name):
+        options = cls.exists_cache_options()
+        if not is_dict(options) or field_name not in options:
+            return None
+        return get_negative_cache(cls, field_name, options.get(field_name) or {})
+
+    @classmethod
+    def _exists_cache_key(cls, field_name, value):
+        """
+        统一用 normalize_key 转换为缓存key，与布隆过滤器从数据表加载的值一致，避免 1 和 "1" 被当作不同的值
+        """
+        field = cls._meta.fields.get(field_name)  # noqa
+        if field is None or isinstance(value, Node) or value is None:
+            return None
+        try:
+            return normalize_key(field, value)
+        except Exception as e:
+            _ = e
+            return None
+
+    @classmethod
+    def _record_exists_present(cls, data):
+        if not is_dict(data):
+            return
+        options = cls.exists_cache_options()
+        if not is_dict(options):
+            return
+        for key, value in data.items():
+            field_name = key if isinstance(key, str) else getattr(key, "name", None)
+            cache = cls._exists_cache(field_name) if field_name in options else None
+            if cache is None:
+                continue
+            cache_key = cls._exists_cache_key(field_name, value)
+            if cache_key is None:
+                # 写入值为表达式等无法确定的值，清空该字段缓存
+                cache.clear()
+            else:
+                cache.record_present(cache_key)
+
+    @classmethod
+    def row_cache_options(cls):
+        """
+        按主键读取的跨worker行缓存配置，默认返回None（不启用）
+        子类返回配置字典即可通过 get_cached 读取，行数据保存在共享内存中，所有worker共用：
+            ttl:    有效期（秒），默认60
+            name:   使用的共享缓存名称，默认 rows
+        本进程内经 save/delete_instance/update_by_pk/update_or_create 修改的行会立即失效
+        其他方式的修改（如 update().where() 批量更新）在 ttl 后可见，也可调用 invalidate_cached 主动失效
+        e.g.
+        class User(BaseModel):
+            @classmethod
+            def row_cache_options(cls):
+                return {"ttl": 300}
+        """
+        return None
+
+    @classmethod
+    def get_cached(cls, primary_key_value):
+        """
+        按主键读取一行，优先读取共享缓存，不存在时返回None
+        未启用行缓存时等同于 get_or_none
+        """
+        options = cls.row_cache_options()
+        if not is_dict(options):
+            return cls.get_or_none(cls._meta.primary_key == primary_key_value)  # noqa
+        cache = get_shared_cache(options.get("name") or _ROW_CACHE_NAME)
+        key = cls._row_cache_key(primary_key_value)
+        data = cache.get(key)
+        if data is not None:
+            instance = cls(__no_default__=1, **data)
+            instance._dirty.clear()  # noqa
+            return instance
+        instance = cls.get_or_none(cls._meta.primary_key == primary_key_value)  # noqa
+        if instance is not None:
+            cache.set(key, dict(instance.__data__), options.get("ttl", _ROW_CACHE_TTL))
+        return instance
+
+    @classmethod
+    def invalidate_cached(cls, primary_key_value):
+        options = cls.row_cache_options()
+        if is_dict(options) and primary_key_value is not None:
+            get_shared_cache(options.get("name") or _ROW_CACHE_NAME).delete(cls._row_cache_key(primary_key_value))
+
+    @classmethod
+    def _row_cache_key(cls, primary_key_value):
+        field = cls._meta.primary_key  # noqa
+        return f"{cls._meta.table_name}:{field.db_value(primary_key_value)}"  # noqa
+
+    def save(self, force_insert=False, only=None):
+        result = super().save(force_insert=force_insert, only=only)
+        self.invalidate_cached(self._pk)
+        return result
+
+    def delete_instance(self, recursive=False, delete_nullable=False):
+        result = super().delete_instance(recursive=recursive, delete_nullable=delete_nullable)
+        self.invalidate_cached(self._pk)
+        return result
+
     @classmethod
     def get_or_instantiate(cls, defaults=None, override=False, **kwargs):
         """
@@ -139,9 +378,102 @@ class BaseModel(Model):
                         logging.error(f"覆盖更新查询结果异常：{e}")
             return result
         except DoesNotExist:
-            logging.info(f"数据库没查到，实例化一个。SQL：{query}")
+            logging.info("数据库没查到，实例化一个。SQL：%s", query, key="model_instantiate", model=cls.__name__)
             return cls(**defaults)
 
+    @classmethod
+    def select_tuples(cls, fields=None, order_by=None, limit=None, offset=None, **kwargs) -> list:
+        """
+        按字段列表投影查询，每行返回一个tuple，不实例化Model
+        字段顺序与 fields 一致，datetime/UUID 已转换为 dg_json_dumps 的输出形式
+
+        :param.fields:      字段名（或Field）列表，为空时返回全部字段
+        :param.order_by:    排序字段，同 select().order_by()
+        :param.limit:       返回条数
+        :param.offset:      偏移量
+        :param.kwargs:      等值查询条件，同 get_or_instantiate
+        e.g.
+        rows = MyClass.select_tuples(["id", "field_1"], status=1, limit=100)
+        -> [(1, "value_1"), (2, "value_2")]
+        """
+        _, rows = cls._projection(fields, order_by, limit, offset, **kwargs)
+        return list(rows)
+
+    @classmethod
+    def select_namedtuples(cls, fields=None, order_by=None, limit=None, offset=None, **kwargs) -> list:
+        """
+        按字段列表投影查询，每行返回一个namedtuple，不实例化Model
+        参数同 select_tuples，namedtuple 类型按 (Model, 字段列表) 缓存复用
+
+        e.g.
+        rows = MyClass.select_namedtuples(["id", "field_1"], status=1)
+        -> rows[0].id, rows[0].field_1
+        """
+        names, rows = cls._projection(fields, order_by, limit, offset, **kwargs)
+        row_class = cls._projection_namedtuple(names)
+        return [row_class._make(row) for row in rows]
+
+    @classmethod
+    def select_dicts(cls, fields=None, order_by=None, limit=None, offset=None, **kwargs) -> list:
+        """
+        按字段列表投影查询，每行返回一个dict，不实例化Model
+        参数同 select_tuples，返回结果可直接交给 r_json 序列化
+
+        e.g.
+        rows = MyClass.select_dicts(["id", "created"], status=1)
+        -> [{"id": 1, "created": 1700000000}]
+        """
+        names, rows = cls._projection(fields, order_by, limit, offset, **kwargs)
+        return [dict(zip(names, row)) for row in rows]
+
+    @classmethod
+    def _projection(cls, fields, order_by, limit, offset, **kwargs):
+        """
+        构造投影查询，返回 (字段名元组, 行迭代器)
+        使用 tuples().iterator()，既不实例化Model也不在query上缓存结果
+        """
+        if fields is None:
+            field_objects = list(cls._meta.sorted_fields)  # noqa
+        else:
+            field_objects = [cls._meta.fields[field] if isinstance(field, str) else field  # noqa
+                             for field in fields]
+        names = tuple(field.name for field in field_objects)
+
+        query = cls.select(*field_objects)
+        for field, value in kwargs.items():
+            query = query.where(getattr(cls, field) == value)
+        if order_by is not None:
+            query = query.order_by(*order_by) if isinstance(order_by, (list, tuple)) else query.order_by(order_by)
+        if limit is not None:
+            query = query.limit(limit)
+        if offset is not None:
+            query = query.offset(offset)
+
+        # 只对可能返回 datetime/UUID 的列做转换，其余列原样透传
+        converting = [index for index, field in enumerate(field_objects)
+                      if isinstance(field, _PROJECTION_CONVERT_FIELDS)]
+        rows = query.tuples().iterator()
+        if not converting:
+            return names, rows
+        return names, cls._convert_rows(rows, converting)
+
+    @staticmethod
+    def _convert_rows(rows, converting):
+        for row in rows:
+            row = list(row)
+            for index in converting:
+                row[index] = dg_json_value(row[index])
+            yield tuple(row)
+
+    @classmethod
+    def _projection_namedtuple(cls, names):
+        key = (cls, names)
+        row_class = _PROJECTION_NAMEDTUPLES.get(key)
+        if row_class is None:
+            row_class = namedtuple(f"{cls.__name__}Row", names)
+            _PROJECTION_NAMEDTUPLES[key] = row_class
+        return row_class
+
     def update_by_pk(self, defaults=None, **kwargs):
         """
         进行主键更新，把当前实例的数据update进数据库
@@ -184,8 +516,9 @@ class BaseModel(Model):
                     normalized_data[key] = defaults[key]
             try:
                 update = cls.update(**normalized_data).where(primary_key_field == primary_key_value)
-                logging.info(f"update: {update}")
+                logging.info("update: %s", update, key="model_update", model=cls.__name__)
                 update.execute()
+                cls.invalidate_cached(primary_key_value)
                 # 更新完成，在读取一次结果
                 return cls.get_by_id(primary_key_value)
             except Exception as e:
@@ -249,8 +582,9 @@ class BaseModel(Model):
         if data_exists:
             try:
                 update = cls.update(**normalized_data).where(primary_key_field == primary_key_value)
-                logging.info(f"update: {update}")
+                logging.info("update: %s", update, key="model_update", model=cls.__name__)
                 update.execute()
+                cls.invalidate_cached(primary_key_value)
                 updated_data = cls.get_by_id(primary_key_value)
             except Exception as e:
                 logging.info(f"更新失败:{e}")
@@ -259,10 +593,10 @@ class BaseModel(Model):
             try:
                 # 执行插入操作
                 insert = cls.insert(**normalized_data)
-                logging.info(f"insert: {insert}")
+                logging.info("insert: %s", insert, key="model_insert", model=cls.__name__)
                 pk_inserted = insert.execute()
                 primary_key_value = insert.primary_key_value or pk_inserted
-                logging.info(f"新插入数据主键：{primary_key_value}")
+                logging.info("新插入数据主键：%s", primary_key_value, key="model_insert_pk", model=cls.__name__)
                 updated_data = cls.get_by_id(primary_key_value)
             except Exception as e:
                 logging.error(f"插入失败:{e}")
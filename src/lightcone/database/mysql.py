@@ -1,17 +1,29 @@
 import importlib
+import re
+import threading
 
 from gramai.utils.cache import singleton
-from gramai.utils.config import Config
+from peewee import DatabaseProxy
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.deadline import remaining, DeadlineExceeded
+from lightcone.utils.tracing import span, SPAN_KIND_CLIENT
+
+_SELECT_PATTERN = re.compile(r"^\s*SELECT\s", re.IGNORECASE)
+# 事务控制语句：截止时间已过也必须执行，否则事务无法回滚或释放保存点，连接带着未结束的事务回到连接池
+_TRANSACTION_CONTROL_PATTERN = re.compile(r"^\s*(BEGIN|START\s+TRANSACTION|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|SET|XA)\b",
+                                          re.IGNORECASE)
 
 
 @singleton
 class MySQL:
     def __init__(self, ):
         # 读取配置
-        db_config = Config("mysql.ini")
+        db_config = lazy_config("mysql.ini")
         # 配置连接池
         pool_module = importlib.import_module('playhouse.pool')
-        self._conn = pool_module.PooledMySQLDatabase(
+        database_class = with_tracing(with_execution_deadline(pool_module.PooledMySQLDatabase))
+        self._conn = database_class(
             database=db_config.get("mysql.database"),
             user=db_config.get("mysql.user"),
             password=db_config.get("mysql.password"),
@@ -25,3 +37,85 @@ class MySQL:
     @property
     def conn(self):
         return self._conn
+
+
+def apply_execution_deadline(sql: str) -> str:
+    """
+    按当前请求剩余的时间给SELECT语句加上 MAX_EXECUTION_TIME 提示，截止时间已过时不再执行查询或写入
+    MySQL 只对只读的SELECT语句支持该提示，其他语句原样返回
+    事务控制语句（ROLLBACK、RELEASE SAVEPOINT 等）始终执行
+    """
+    timeout = remaining()
+    if timeout is None or _TRANSACTION_CONTROL_PATTERN.match(sql):
+        return sql
+    if timeout <= 0:
+        raise DeadlineExceeded()
+    if "MAX_EXECUTION_TIME" in sql or not _SELECT_PATTERN.match(sql):
+        return sql
+    milliseconds = max(1, int(timeout * 1000))
+    start = sql.upper().index("SELECT") + len("SELECT")
+    return f"{sql[:start]} /*+ MAX_EXECUTION_TIME({milliseconds}) */{sql[start:]}"
+
+
+def with_execution_deadline(database_class):
+    """
+    生成 database_class 的子类，执行的SQL带上当前请求截止时间对应的 MAX_EXECUTION_TIME
+    """
+
+    class DeadlineDatabase(database_class):
+        def execute_sql(self, sql, *args, **kwargs):
+            return super().execute_sql(apply_execution_deadline(sql), *args, **kwargs)
+
+    DeadlineDatabase.__name__ = f"Deadline{database_class.__name__}"
+    return DeadlineDatabase
+
+
+def with_tracing(database_class):
+    """
+    生成 database_class 的子类，在被采样的请求中为每条SQL记录一个span（只记录SQL语句，不记录参数）
+    """
+
+    class TracingDatabase(database_class):
+        def execute_sql(self, sql, *args, **kwargs):
+            with span("sql", SPAN_KIND_CLIENT, {"db.system": "mysql", "db.statement": sql}):
+                return super().execute_sql(sql, *args, **kwargs)
+
+    TracingDatabase.__name__ = f"Tracing{database_class.__name__}"
+    return TracingDatabase
+
+
+class DeferredDatabase(DatabaseProxy):
+    """
+    延迟初始化的数据库代理，作为 Model.Meta.database 使用
+    定义Model时不会读取 mysql.ini 或创建连接池，第一次执行查询时才通过 factory 创建数据库实例
+    也可以提前调用 initialize(database) 指定其他数据库（如测试时使用SQLite）
+    """
+    __slots__ = ('obj', '_callbacks', '_Model', '_factory', '_lock')
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def resolve(self):
+        if self.obj is None:
+            with self._lock:
+                if self.obj is None:
+                    self.initialize(self._factory())
+        return self.obj
+
+    def __enter__(self):
+        return self.resolve().__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.resolve().__exit__(exc_type, exc_val, exc_tb)
+
+    def __getattr__(self, attr):
+        if attr in self.__slots__:
+            # 未赋值的slot（如 _Model），不触发初始化
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+
+# BaseModel 默认使用的数据库
+DEFERRED_MYSQL = DeferredDatabase(lambda: MySQL().conn)
@@ -0,0 +1,298 @@
+import hashlib
+import math
+import threading
+import time
+import unicodedata
+from collections import deque
+
+from peewee import CharField, TextField, PostgresqlDatabase, SqliteDatabase
+
+from lightcone.utils.tools import logging
+
+# 缓存类型
+CACHE_TYPE_ABSENT = "absent"
+CACHE_TYPE_BLOOM = "bloom"
+
+# 默认配置，可通过 BaseModel.exists_cache_options() 覆盖
+DEFAULT_ABSENT_TTL = 30  # "确定不存在"记录的有效期（秒）
+DEFAULT_ABSENT_MAX_SIZE = 100000  # "确定不存在"记录的最大条数，超出后淘汰最早的记录
+DEFAULT_BLOOM_CAPACITY = 1000000  # 布隆过滤器预期容量
+DEFAULT_BLOOM_ERROR_RATE = 0.01  # 布隆过滤器误判率
+DEFAULT_BLOOM_REBUILD_INTERVAL = 600  # 布隆过滤器从数据表重建的间隔（秒）
+BLOOM_RECENT_SIZE = 4096  # 重建时补入的最近写入值数量，覆盖加载数据表期间尚未提交的写入
+
+
+class NegativeCache:
+    """
+    BaseModel.exists 的否定缓存基类，只回答"确定不存在"，其余情况都需要查询数据库
+    本进程内通过 BaseModel 的 insert/insert_many/update 写入的值会调用 record_present 保持正确
+    """
+
+    def known_absent(self, value) -> bool:
+        return False
+
+    def record_absent(self, value):
+        pass
+
+    def record_present(self, value):
+        pass
+
+    def clear(self):
+        pass
+
+
+class AbsentCache(NegativeCache):
+    """
+    带TTL的"确定不存在"集合
+    exists 查询为 False 的值在 ttl 秒内直接返回 False，本进程写入该值时立即失效
+    其他进程的写入最多在 ttl 秒后可见
+    fold 用于排序规则不区分大小写等的字段（见 fold_key）：写入一个值时，折叠后相同的记录全部失效，
+    如写入 "ABC" 后 "abc" 不再被认为不存在
+    """
+
+    def __init__(self, ttl=DEFAULT_ABSENT_TTL, max_size=DEFAULT_ABSENT_MAX_SIZE, fold=None):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._fold = fold
+        self._lock = threading.Lock()
+        self._expires = {}
+        # 折叠后的key -> 记录的值
+        self._groups = {}
+
+    def known_absent(self, value) -> bool:
+        expire_at = self._expires.get(value)
+        if expire_at is None:
+            return False
+        if expire_at < time.monotonic():
+            with self._lock:
+                self._discard(value)
+            return False
+        return True
+
+    def record_absent(self, value):
+        with self._lock:
+            self._discard(value)
+            self._expires[value] = time.monotonic() + self._ttl
+            if self._fold is not None:
+                self._groups.setdefault(self._fold(value), set()).add(value)
+            while len(self._expires) > self._max_size:
+                # dict保持插入顺序，淘汰最早写入的记录
+                self._discard(next(iter(self._expires)))
+
+    def record_present(self, value):
+        with self._lock:
+            if self._fold is None:
+                self._expires.pop(value, None)
+                return
+            for absent in self._groups.pop(self._fold(value), ()):
+                self._expires.pop(absent, None)
+
+    def clear(self):
+        with self._lock:
+            self._expires.clear()
+            self._groups.clear()
+
+    def _discard(self, value):
+        if self._expires.pop(value, None) is None or self._fold is None:
+            return
+        folded = self._fold(value)
+        group = self._groups.get(folded)
+        if group is not None:
+            group.discard(value)
+            if not group:
+                del self._groups[folded]
+
+
+class BloomFilter(NegativeCache):
+    """
+    从数据表加载的布隆过滤器，不在过滤器中的值确定不存在
+    首次使用时通过 loader 读取全表字段值构建，之后每 rebuild_interval 秒重建一次，
+    以便纳入其他进程的写入并清理已删除的值；写入量超过容量时也会提前重建
+    构建和重建都在后台线程中进行，不阻塞查询；首次构建完成前所有值都需要查询数据库
+    写入和查询的值都需要先经过 normalize_key，保证同一行的值得到相同的key
+    """
+
+    def __init__(self, loader, capacity=DEFAULT_BLOOM_CAPACITY, error_rate=DEFAULT_BLOOM_ERROR_RATE,
+                 rebuild_interval=DEFAULT_BLOOM_REBUILD_INTERVAL):
+        self._loader = loader
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        # (bits, size, hash_count)，整体替换，读取时无需加锁
+        self._state = None
+        self._count = 0
+        self._built_at = 0.0
+        self._rebuilding = False
+        self._recent = deque(maxlen=BLOOM_RECENT_SIZE)
+
+    def known_absent(self, value) -> bool:
+        self._ensure_built()
+        state = self._state
+        if state is None:
+            return False
+        return not self._contains(state, value)
+
+    def record_present(self, value):
+        with self._lock:
+            self._recent.append(value)
+            if self._state is not None:
+                self._add(self._state, value)
+                self._count += 1
+
+    def clear(self):
+        with self._lock:
+            self._state = None
+            self._built_at = 0.0
+
+    def rebuild(self) -> bool:
+        """
+        同步从数据表重建，其他线程正在重建时直接返回False
+        """
+        with self._lock:
+            if self._rebuilding:
+                # 其他线程正在重建，先沿用旧的过滤器
+                return False
+            self._rebuilding = True
+        return self._load()
+
+    def _load(self) -> bool:
+        try:
+            values = list(self._loader())
+        except Exception as e:
+            logging.warning(f"构建布隆过滤器失败：{e}")
+            with self._lock:
+                self._rebuilding = False
+                self._built_at = time.monotonic()  # 失败后等待一个重建间隔再重试，避免每次查询都加载全表
+            return False
+
+        capacity = max(self._capacity, len(values) * 2)
+        size = max(8, int(-capacity * math.log(self._error_rate) / (math.log(2) ** 2)))
+        hash_count = max(1, round(size / capacity * math.log(2)))
+        state = (bytearray((size + 7) // 8), size, hash_count)
+        for value in values:
+            self._add(state, value)
+        with self._lock:
+            # 加载期间写入（或尚未提交）的值可能不在查询结果中，补入最近写入的值
+            for value in self._recent:
+                self._add(state, value)
+            self._state = state
+            self._capacity = capacity
+            self._count = len(values)
+            self._built_at = time.monotonic()
+            self._rebuilding = False
+        return True
+
+    def _ensure_built(self):
+        if self._rebuilding:
+            return
+        if self._state is None and self._built_at and time.monotonic() - self._built_at < self._rebuild_interval:
+            # 上次构建失败，等待下一个重建周期
+            return
+        if (self._state is None
+                or self._count > self._capacity
+                or time.monotonic() - self._built_at > self._rebuild_interval):
+            with self._lock:
+                if self._rebuilding:
+                    return
+                self._rebuilding = True
+            # 加载全表可能需要数秒，放到后台线程，查询继续使用旧的过滤器（或直接查库）
+            threading.Thread(target=self._load, name="bloom-rebuild", daemon=True).start()
+
+    @staticmethod
+    def _positions(value, size, hash_count):
+        digest = hashlib.blake2b(repr(value).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % size for i in range(hash_count)]
+
+    @classmethod
+    def _add(cls, state, value):
+        bits, size, hash_count = state
+        for position in cls._positions(value, size, hash_count):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    @classmethod
+    def _contains(cls, state, value) -> bool:
+        bits, size, hash_count = state
+        for position in cls._positions(value, size, hash_count):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+# 已创建的否定缓存，key为 (Model类, 字段名)
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_negative_cache(model, field_name, options) -> NegativeCache:
+    key = (model, field_name)
+    cache = _CACHES.get(key)
+    if cache is None:
+        with _CACHES_LOCK:
+            cache = _CACHES.get(key)
+            if cache is None:
+                cache = _build_cache(model, field_name, dict(options))
+                _CACHES[key] = cache
+    return cache
+
+
+def clear_negative_cache(model=None):
+    """
+    清空否定缓存，在绕过 BaseModel 直接写库（如运维脚本、原生SQL）后调用
+    """
+    for (cache_model, _), cache in list(_CACHES.items()):
+        if model is None or cache_model is model:
+            cache.clear()
+
+
+def normalize_key(field, value):
+    """
+    把查询参数或从数据表读出的值统一转换为缓存key：先转为Python值再转为数据库值，最后转为字符串
+    如 UUIDField 的 uuid.UUID 与 hex 字符串、IntegerField 的 1 与 "1" 得到相同的key
+    """
+    return str(field.db_value(field.python_value(field.db_value(value))))
+
+
+def bloom_supported(model, field) -> bool:
+    """
+    布隆过滤器要求数据库按字节比较字段值：
+    MySQL 的字符串默认排序规则不区分大小写（部分还忽略末尾空格），"ABC" 能查到 "abc" 的行，
+    但两者的key不同，会被误判为不存在；这类字段只能使用 absent 缓存，或为字段指定 _bin 排序规则
+    """
+    if not isinstance(field, (CharField, TextField)):
+        return True
+    collation = (getattr(field, "collation", None) or "").lower()
+    if collation:
+        return collation == "binary" or collation.endswith("_bin")
+    database = model._meta.database  # noqa
+    database = getattr(database, "obj", database)  # DatabaseProxy
+    # SQLite 和 PostgreSQL 默认按字节比较
+    return isinstance(database, (SqliteDatabase, PostgresqlDatabase))
+
+
+def fold_key(value) -> str:
+    """
+    按最宽松的排序规则折叠缓存key：忽略大小写、重音和末尾空格
+    只用于 absent 缓存的失效，折叠得比数据库更宽松只会多失效一些记录，不会产生错误的"不存在"
+    """
+    value = unicodedata.normalize("NFKD", value.rstrip(" "))
+    return "".join(c for c in value if not unicodedata.combining(c)).casefold()
+
+
+def _build_cache(model, field_name, options) -> NegativeCache:
+    cache_type = options.pop("type", CACHE_TYPE_ABSENT)
+    field = model._meta.fields[field_name]  # noqa
+    supported = bloom_supported(model, field)
+    if cache_type == CACHE_TYPE_BLOOM:
+        if supported:
+            def loader():
+                return (normalize_key(field, row[0]) for row in model.select(field).tuples().iterator())
+
+            return BloomFilter(loader, **options)
+        logging.error(f"{model.__name__}.{field_name} 的排序规则不区分大小写或末尾空格，不能使用 bloom 缓存，"
+                      f"改用 absent 缓存")
+        for key in ("capacity", "error_rate", "rebuild_interval"):
+            options.pop(key, None)
+    return AbsentCache(fold=None if supported else fold_key, **options)
@@ -0,0 +1,276 @@
+import atexit
+import os
+import threading
+import time
+import weakref
+
+from lightcone.utils.metrics import METRICS
+from lightcone.utils.tools import logging
+
+# 默认配置，可通过 BaseModel.write_behind_options() 覆盖
+DEFAULT_MAX_SIZE = 500  # 缓冲条数达到该值时立即触发刷新
+DEFAULT_INTERVAL = 1.0  # 定时刷新间隔（秒）
+DEFAULT_MAX_PENDING = 10000  # 缓冲上限，超过后在调用方同步刷新，防止内存无限增长
+DEFAULT_BATCH_SIZE = 500  # 单条 insert 语句的最大行数
+DEFAULT_MAX_RETRIES = 3  # 刷新失败后数据放回缓冲重试的次数，连续失败超过后丢弃
+
+FLUSH_SECONDS = METRICS.histogram("lightcone_write_behind_flush_seconds", "写缓冲刷新耗时（秒）", ("model",))
+QUEUE_DEPTH = METRICS.gauge("lightcone_write_behind_depth", "写缓冲中等待写入的条数", ("model",))
+
+
+class WriteBehindBuffer:
+    """
+    Model的写缓冲，收集插入和计数器累加，由后台线程批量写入数据库
+        插入：按字段组合分组，合并为多行 INSERT
+        计数器：按 (主键, 字段) 合并增量，在一个事务中执行 UPDATE ... SET field = field + delta
+    后台线程在首次写入时启动（fork之后的worker进程中），进程退出时自动刷新
+    刷新失败的数据放回缓冲，连续失败 max_retries 次或放回后超过 max_pending 时丢弃
+    """
+
+    def __init__(self, model, max_size=DEFAULT_MAX_SIZE, interval=DEFAULT_INTERVAL,
+                 max_pending=DEFAULT_MAX_PENDING, batch_size=DEFAULT_BATCH_SIZE, max_retries=DEFAULT_MAX_RETRIES):
+        self._model = model
+        self._max_size = max_size
+        self._interval = interval
+        self._max_pending = max_pending
+        self._batch_size = batch_size
+        self._max_retries = max_retries
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._inserts = []
+        self._counters = {}
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+        # 指标
+        self._flush_count = 0
+        self._flush_failed = 0
+        self._flush_seconds_total = 0.0
+        self._flush_seconds_last = 0.0
+        self._flush_seconds_max = 0.0
+        self._rows_written = 0
+        _INSTANCES.add(self)
+
+    @property
+    def model(self):
+        return self._model
+
+    @property
+    def depth(self) -> int:
+        return len(self._inserts) + len(self._counters)
+
+    def add_insert(self, data: dict):
+        with self._lock:
+            self._inserts.append(data)
+        self._after_add()
+
+    def add_counter(self, primary_key_value, deltas: dict):
+        with self._lock:
+            for field, delta in deltas.items():
+                key = (primary_key_value, field)
+                self._counters[key] = self._counters.get(key, 0) + delta
+        self._after_add()
+
+    def flush(self) -> int:
+        """
+        把缓冲中的数据写入数据库，返回写入（或更新）的条数
+        写入失败时（整批在一个事务中，已回滚）把数据放回缓冲等待下次刷新；
+        连续失败超过 max_retries 次或缓冲已满时丢弃，避免失败数据无限积压
+        """
+        with self._flush_lock:
+            with self._lock:
+                inserts, self._inserts = self._inserts, []
+                counters, self._counters = self._counters, {}
+            if not inserts and not counters:
+                return 0
+
+            written = 0
+            begin = time.perf_counter()
+            try:
+                with self._model._meta.database.atomic():  # noqa
+                    written += self._flush_inserts(inserts)
+                    written += self._flush_counters(counters)
+                self._failures = 0
+            except Exception as e:
+                self._flush_failed += 1
+                written = 0
+                self._requeue(inserts, counters, e)
+            elapsed = time.perf_counter() - begin
+
+            self._flush_count += 1
+            self._rows_written += written
+            self._flush_seconds_total += elapsed
+            self._flush_seconds_last = elapsed
+            self._flush_seconds_max = max(self._flush_seconds_max, elapsed)
+            FLUSH_SECONDS.observe((self._model.__name__,), elapsed)
+            return written
+
+    def stop(self):
+        """
+        停止后台线程并刷新剩余数据
+        """
+        self._stopped = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=max(self._interval, 1.0) * 5)
+        self._thread = None
+        self.flush()
+
+    def metrics(self) -> dict:
+        return {"model": self._model.__name__,
+                "depth": self.depth,
+                "flush_count": self._flush_count,
+                "flush_failed": self._flush_failed,
+                "rows_written": self._rows_written,
+                "flush_seconds_total": self._flush_seconds_total,
+                "flush_seconds_last": self._flush_seconds_last,
+                "flush_seconds_max": self._flush_seconds_max,
+                }
+
+    def _requeue(self, inserts, counters, error):
+        self._failures += 1
+        with self._lock:
+            if self._failures <= self._max_retries and self.depth + len(inserts) + len(counters) <= self._max_pending:
+                # 放回缓冲头部，保持插入顺序；计数增量与期间新增的增量合并
+                self._inserts[:0] = inserts
+                for key, delta in counters.items():
+                    self._counters[key] = self._counters.get(key, 0) + delta
+                requeued = True
+            else:
+                requeued = False
+        if requeued:
+            logging.warning(f"{self._model.__name__} 写缓冲刷新失败（第 {self._failures} 次），"
+                            f"{len(inserts)} 条插入、{len(counters)} 条计数更新放回缓冲：{error}")
+        else:
+            logging.error(f"{self._model.__name__} 写缓冲刷新失败（第 {self._failures} 次），"
+                          f"丢弃 {len(inserts)} 条插入、{len(counters)} 条计数更新：{error}")
+            # 已丢弃的数据不再占用重试次数，之后的数据重新计数
+            self._failures = 0
+
+    def _after_fork(self):
+        # fork时其他线程可能正持有锁，子进程中的锁永远不会被释放，需要重新创建；
+        # 继承的缓冲数据由父进程负责写入，子进程丢弃，避免重复写入
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._inserts = []
+        self._counters = {}
+        self._thread = None
+        self._failures = 0
+
+    def _after_add(self):
+        depth = self.depth
+        if depth >= self._max_pending:
+            # 后台线程跟不上，在调用方同步刷新形成反压
+            logging.warning(f"{self._model.__name__} 写缓冲积压 {depth} 条，同步刷新")
+            self.flush()
+            return
+        self._ensure_thread()
+        if depth >= self._max_size:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # fork之后子进程里的线程不存在，需要按pid重新启动
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run,
+                                            name=f"write-behind-{self._model.__name__}",
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"{self._model.__name__} 写缓冲后台刷新异常：{e}")
+
+    def _flush_inserts(self, inserts) -> int:
+        # insert_many 要求每行字段一致，按字段组合分组
+        groups = {}
+        for row in inserts:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        written = 0
+        for rows in groups.values():
+            for start in range(0, len(rows), self._batch_size):
+                batch = rows[start:start + self._batch_size]
+                self._model.insert_many(batch).execute()
+                written += len(batch)
+        return written
+
+    def _flush_counters(self, counters) -> int:
+        # 同一主键的多个字段合并为一条 UPDATE
+        updates = {}
+        for (primary_key_value, field), delta in counters.items():
+            if delta:
+                updates.setdefault(primary_key_value, {})[field] = delta
+        primary_key_field = self._model._meta.primary_key  # noqa
+        for primary_key_value, deltas in updates.items():
+            data = {}
+            for field, delta in deltas.items():
+                model_field = self._model._meta.fields[field]  # noqa
+                data[field] = model_field + delta
+            self._model.update(data).where(primary_key_field == primary_key_value).execute()
+        return len(updates)
+
+
+# 已启用写缓冲的Model，key为Model类
+_BUFFERS = {}
+_BUFFERS_LOCK = threading.Lock()
+# 全部写缓冲（包括未通过 get_write_behind_buffer 创建的），fork后在子进程中重建锁
+_INSTANCES = weakref.WeakSet()
+
+
+def get_write_behind_buffer(model, **options) -> WriteBehindBuffer:
+    buffer = _BUFFERS.get(model)
+    if buffer is None:
+        with _BUFFERS_LOCK:
+            buffer = _BUFFERS.get(model)
+            if buffer is None:
+                buffer = WriteBehindBuffer(model, **options)
+                _BUFFERS[model] = buffer
+    return buffer
+
+
+def flush_write_behind():
+    """
+    刷新全部写缓冲，可在 sanic 的 before_server_stop 监听中调用
+    """
+    for buffer in list(_BUFFERS.values()):
+        try:
+            buffer.stop()
+        except Exception as e:
+            logging.error(f"{buffer.model.__name__} 写缓冲关闭刷新异常：{e}")
+
+
+def write_behind_metrics() -> list:
+    return [buffer.metrics() for buffer in list(_BUFFERS.values())]
+
+
+def _after_fork_in_child():
+    global _BUFFERS_LOCK
+    _BUFFERS_LOCK = threading.Lock()
+    for buffer in list(_INSTANCES):
+        buffer._after_fork()  # noqa
+
+
+def _collect_queue_depth():
+    for buffer in list(_BUFFERS.values()):
+        QUEUE_DEPTH.set((buffer.model.__name__,), buffer.depth)
+
+
+METRICS.add_collector(_collect_queue_depth)
+atexit.register(flush_write_behind)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
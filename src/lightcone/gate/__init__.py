@@ -2,5 +2,7 @@ from .base.response import CommandResponse, CommandResponseCode
 from .base.response import build_no_right_response, build_error_response, build_success_response
 from .base.response import build_no_command_response, build_protocol_not_support_response
 from .base.response import build_bad_request_response, build_fail_response
+from .base.response import build_overload_response, build_timeout_response, build_busy_response
+from .base.response import build_not_modified_response
 from .rest import REST
 from .rpc import RPC
@@ -0,0 +1,366 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.metrics import METRICS
+
+PROJ = lazy_config("proj.ini")
+command_config = lazy_config("commands.json")
+
+# 指令优先级：全局并发达到 admission.max_in_flight 的相应比例后，开始拒绝该优先级的指令
+PRIORITY_CRITICAL = "critical"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BATCH = "batch"
+PRIORITY_THRESHOLDS = {PRIORITY_CRITICAL: 1.0, PRIORITY_NORMAL: 0.8, PRIORITY_BATCH: 0.5}
+
+# 拒绝原因
+REASON_CONCURRENCY = "concurrency"
+REASON_RATE = "rate"
+REASON_CALLER_RATE = "caller_rate"
+REASON_OVERLOAD = "overload"
+
+DEFAULT_RETRY_AFTER = 1.0  # 并发超限时建议的重试间隔（秒）
+MAX_CALLER_BUCKETS = 10000  # 每个指令最多保留的调用方令牌桶数量
+
+REJECTED = METRICS.counter("lightcone_gate_rejected_total", "准入控制拒绝的指令数", ("command_id", "reason"))
+
+
+class TokenBucket:
+    """
+    令牌桶，rate 为每秒补充的令牌数，burst 为桶容量
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        """
+        取一个令牌，成功返回0，失败返回需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else DEFAULT_RETRY_AFTER
+
+    def refund(self):
+        """
+        归还 take 取走的令牌，用于后续检查拒绝了请求的情况
+        """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class Ticket:
+    """
+    准入结果，admitted 为 False 时 reason 和 retry_after 给出拒绝原因和建议的重试间隔
+    准入成功的 Ticket 必须在指令执行结束后 release
+    """
+
+    def __init__(self, limiter=None, admitted=True, reason=None, retry_after=None):
+        self._limiter = limiter
+        self.admitted = admitted
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def release(self):
+        limiter, self._limiter = self._limiter, None
+        if limiter is not None:
+            limiter.release()
+
+
+class CommandLimiter:
+    """
+    单个指令的准入控制，配置来自 commands.json 中该指令的 limits：
+        concurrency:    最大并发数
+        queue_timeout:  并发满时最多排队等待的秒数，默认0（立即拒绝）；在事件循环线程中同步调用时不等待
+                        排队按先来先得：有调用在排队时，新的调用也需要排队，释放的名额直接交给最早的排队者
+        rate / burst:   指令整体的令牌桶
+        caller_key:     从参数中读取调用方标识的key，如 token、uid
+        caller_rate / caller_burst: 每个调用方的令牌桶
+        priority:       critical / normal（默认） / batch，全局过载时 batch 最先被拒绝
+        retry_after:    并发超限时建议的重试间隔（秒）
+    """
+
+    def __init__(self, command_id, limits):
+        self.command_id = command_id
+        self.concurrency = int(limits.get("concurrency") or 0)
+        self.queue_timeout = float(limits.get("queue_timeout") or 0)
+        self.priority = limits.get("priority") or PRIORITY_NORMAL
+        self.retry_after = float(limits.get("retry_after") or DEFAULT_RETRY_AFTER)
+        self.bucket = TokenBucket(limits["rate"], limits.get("burst")) if limits.get("rate") else None
+        self.caller_key = limits.get("caller_key")
+        self.caller_rate = limits.get("caller_rate")
+        self.caller_burst = limits.get("caller_burst")
+        self._caller_buckets = OrderedDict()
+        self._in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def check_rate(self, param):
+        """
+        检查令牌桶，返回 (拒绝原因, 建议重试间隔)，通过时返回 (None, None)
+        """
+        # 先检查调用方的令牌桶，避免单个调用方超限的请求消耗指令整体的令牌
+        caller_bucket = None
+        if self.caller_key and self.caller_rate and isinstance(param, dict):
+            caller = param.get(self.caller_key)
+            if caller is not None:
+                caller_bucket = self._caller_bucket(str(caller))
+                wait = caller_bucket.take()
+                if wait > 0:
+                    return REASON_CALLER_RATE, wait
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait > 0:
+                # 请求最终被拒绝，归还调用方的令牌
+                if caller_bucket is not None:
+                    caller_bucket.refund()
+                return REASON_RATE, wait
+        return None, None
+
+    def try_acquire(self) -> bool:
+        if self.concurrency <= 0:
+            return True
+        with self._lock:
+            if self._in_flight >= self.concurrency or self._waiters:
+                return False
+            self._in_flight += 1
+            return True
+
+    def acquire(self, timeout) -> bool:
+        """
+        同步排队等待并发名额，最多等待 timeout 秒
+        """
+        if self.try_acquire():
+            return True
+        waiter = _ThreadWaiter()
+        if self._enqueue(waiter):
+            return True
+        waiter.event.wait(timeout)
+        return self._leave_queue(waiter)
+
+    async def async_acquire(self, timeout) -> bool:
+        """
+        在事件循环中排队等待并发名额，最多等待 timeout 秒
+        """
+        if self.try_acquire():
+            return True
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        if self._enqueue(waiter):
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._leave_queue(waiter):
+                self.release()
+            raise
+        return self._leave_queue(waiter)
+
+    def release(self):
+        if self.concurrency <= 0:
+            return
+        with self._lock:
+            if self._waiters:
+                # 名额直接交给最早的排队者，_in_flight 不变
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self._in_flight = max(0, self._in_flight - 1)
+
+    def _enqueue(self, waiter) -> bool:
+        """
+        加入等待队列，加入前名额已空出时直接取得名额并返回True
+        """
+        with self._lock:
+            if self._in_flight < self.concurrency and not self._waiters:
+                self._in_flight += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _leave_queue(self, waiter) -> bool:
+        """
+        结束等待，返回是否已经取得名额；超时和取得名额同时发生时以取得名额为准
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            return False
+
+    def _caller_bucket(self, caller) -> TokenBucket:
+        with self._lock:
+            bucket = self._caller_buckets.get(caller)
+            if bucket is None:
+                bucket = TokenBucket(self.caller_rate, self.caller_burst)
+                self._caller_buckets[caller] = bucket
+                while len(self._caller_buckets) > MAX_CALLER_BUCKETS:
+                    self._caller_buckets.popitem(last=False)
+            else:
+                self._caller_buckets.move_to_end(caller)
+            return bucket
+
+
+class AdmissionController:
+    """
+    Gate的准入控制，在指令构建完成后、执行任何Pipe之前调用
+    超限的请求立即以 CommandResponseCode.FAIL 返回，并附带建议的重试间隔
+    未配置 limits 的指令只参与全局过载判断
+    """
+
+    def __init__(self):
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._max_in_flight = None
+
+    @property
+    def max_in_flight(self) -> int:
+        if self._max_in_flight is None:
+            self._max_in_flight = int(PROJ.get("admission.max_in_flight", 0) or 0)
+        return self._max_in_flight
+
+    def admit(self, command_id, param) -> Ticket:
+        limiter = self._limiter(command_id)
+        rejected = self._check_overload(command_id, limiter)
+        if rejected is not None:
+            return rejected
+        if limiter is None:
+            return self._enter(None)
+
+        reason, retry_after = limiter.check_rate(param)
+        if reason is not None:
+            return self._reject(command_id, reason, retry_after)
+        if limiter.try_acquire():
+            return self._enter(limiter)
+        if limiter.queue_timeout > 0 and not _in_event_loop() and limiter.acquire(limiter.queue_timeout):
+            return self._enter(limiter)
+        return self._reject(command_id, REASON_CONCURRENCY, limiter.retry_after)
+
+    async def async_admit(self, command_id, param) -> Ticket:
+        limiter = self._limiter(command_id)
+        rejected = self._check_overload(command_id, limiter)
+        if rejected is not None:
+            return rejected
+        if limiter is None:
+            return self._enter(None)
+
+        reason, retry_after = limiter.check_rate(param)
+        if reason is not None:
+            return self._reject(command_id, reason, retry_after)
+        if limiter.try_acquire():
+            return self._enter(limiter)
+        if limiter.queue_timeout > 0 and await limiter.async_acquire(limiter.queue_timeout):
+            return self._enter(limiter)
+        return self._reject(command_id, REASON_CONCURRENCY, limiter.retry_after)
+
+    def _limiter(self, command_id):
+        if command_id in self._limiters:
+            return self._limiters[command_id]
+        limits = command_config.get(f"{command_id}.limits")
+        limiter = CommandLimiter(command_id, limits) if isinstance(limits, dict) else None
+        with self._lock:
+            self._limiters[command_id] = limiter
+        return limiter
+
+    def _check_overload(self, command_id, limiter):
+        max_in_flight = self.max_in_flight
+        if max_in_flight <= 0:
+            return None
+        priority = limiter.priority if limiter is not None else PRIORITY_NORMAL
+        threshold = PRIORITY_THRESHOLDS.get(priority, PRIORITY_THRESHOLDS[PRIORITY_NORMAL])
+        if self._in_flight >= max_in_flight * threshold:
+            return self._reject(command_id, REASON_OVERLOAD, DEFAULT_RETRY_AFTER)
+        return None
+
+    def _enter(self, limiter) -> Ticket:
+        with self._lock:
+            self._in_flight += 1
+        return Ticket(_Release(self, limiter))
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    @staticmethod
+    def _reject(command_id, reason, retry_after) -> Ticket:
+        REJECTED.inc((command_id, reason))
+        return Ticket(admitted=False, reason=reason, retry_after=max(0.001, retry_after))
+
+
+class _ThreadWaiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+    def wake(self):
+        self.event.set()
+
+
+class _AsyncWaiter:
+    """
+    release 可能在其他线程（执行通道）中调用，通过 call_soon_threadsafe 唤醒事件循环中的等待者
+    """
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(_set_done, self.future)
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class _Release:
+    def __init__(self, controller, limiter):
+        self._controller = controller
+        self._limiter = limiter
+
+    def release(self):
+        if self._limiter is not None:
+            self._limiter.release()
+        self._controller._leave()  # noqa
+
+
+def retry_after_header(retry_after) -> str:
+    """
+    Retry-After 响应头只支持整数秒，向上取整
+    """
+    return str(max(1, math.ceil(retry_after)))
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+# 全局准入控制
+ADMISSION = AdmissionController()
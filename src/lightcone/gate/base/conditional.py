@@ -0,0 +1,113 @@
+import hashlib
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from lightcone.utils.config import lazy_config
+
+command_config = lazy_config("commands.json")
+
+# 支持条件请求的HTTP方法
+CONDITIONAL_METHODS = ("GET", "HEAD")
+# 压缩中间件为不同编码的响应追加的 ETag 后缀
+ENCODING_SUFFIXES = ("-gzip", "-deflate", "-br", "-zstd")
+# MessagePack 响应的 ETag 后缀，同一内容的JSON和MessagePack表示使用不同的 ETag
+MSGPACK_SUFFIX = "-msgpack"
+
+_CONDITIONAL: ContextVar = ContextVar("lightcone_conditional", default=None)
+_ETAG_COMMANDS = {}
+
+
+class ConditionalRequest:
+    """
+    当前请求的条件信息，只有 GET/HEAD 请求会创建
+    binary 为True时响应以 MessagePack 返回，ETag 带上 MSGPACK_SUFFIX
+    """
+    __slots__ = ("if_none_match", "binary")
+
+    def __init__(self, if_none_match=None, binary=False):
+        self.if_none_match = if_none_match
+        self.binary = binary
+
+    def matches(self, etag) -> bool:
+        return etag_matches(self.if_none_match, self.representation_etag(etag))
+
+    def representation_etag(self, etag) -> str:
+        """
+        按响应格式区分的 ETag，返回给客户端的 ETag 都需要经过这里
+        """
+        if not self.binary or not etag:
+            return etag
+        prefix = "W/" if etag.startswith("W/") else ""
+        value = etag[len(prefix):].strip('"')
+        return f'{prefix}"{value}{MSGPACK_SUFFIX}"'
+
+
+@contextmanager
+def conditional_scope(request, binary=False):
+    """
+    在当前上下文中记录请求的 If-None-Match，供 Gate 判断客户端缓存是否仍然有效
+    binary 为True时（客户端的 Accept 优先 MessagePack）按 MessagePack 表示比较 ETag
+    """
+    conditional = None
+    if getattr(request, "method", None) in CONDITIONAL_METHODS:
+        headers = getattr(request, "headers", None)
+        conditional = ConditionalRequest(headers.get("if-none-match") if headers is not None else None, binary)
+    token = _CONDITIONAL.set(conditional)
+    try:
+        yield conditional
+    finally:
+        _CONDITIONAL.reset(token)
+
+
+def current_conditional():
+    return _CONDITIONAL.get()
+
+
+def etag_enabled(command_id) -> bool:
+    """
+    指令是否在 commands.json 中配置了 "etag": true
+    """
+    enabled = _ETAG_COMMANDS.get(command_id)
+    if enabled is None:
+        if not isinstance(command_id, str) or command_config.get(f"{command_id}.module") is None:
+            return False
+        enabled = command_config.get(f"{command_id}.etag") is True
+        _ETAG_COMMANDS[command_id] = enabled
+    return enabled
+
+
+def version_etag(command_id, method, param, version) -> str:
+    """
+    由指令提供的版本标识和请求参数生成 ETag
+    """
+    serialized = json.dumps(param, sort_keys=True, default=str, separators=(",", ":"), ensure_ascii=False)
+    source = f"{command_id}\0{method}\0{version}\0{serialized}".encode("utf-8")
+    return f'"v{hashlib.blake2b(source, digest_size=12).hexdigest()}"'
+
+
+def body_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag) -> bool:
+    """
+    If-None-Match 使用弱比较：忽略 W/ 前缀和压缩中间件追加的编码后缀
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    expected = _normalize(etag)
+    return any(_normalize(candidate) == expected for candidate in if_none_match.split(","))
+
+
+def _normalize(etag) -> str:
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    etag = etag.strip('"')
+    for suffix in ENCODING_SUFFIXES:
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)]
+    return etag
@@ -1,18 +1,45 @@
+import asyncio
+import time
 from typing import cast, Any
 
 from gramai.utils import load_class, concat
-from gramai.utils.config import Config
 
 from lightcone.core import Command
 from lightcone.gate import build_no_command_response, build_fail_response, build_bad_request_response
-from lightcone.gate import build_success_response, CommandResponse, build_error_response
+from lightcone.gate import build_success_response, CommandResponse, build_error_response, build_overload_response
+from lightcone.gate import build_timeout_response, build_busy_response, build_not_modified_response
+from lightcone.gate.base.conditional import current_conditional, etag_enabled, version_etag
+from lightcone.gate.base.admission import ADMISSION
+from lightcone.gate.base.lane import LANES, LANE_RETRY_AFTER
 from lightcone.gate.base.pipe import Pipe, PipeReturnStatus
+from lightcone.gate.base.pipememo import PIPE_MEMO
+from lightcone.gate.base.resultcache import RESULT_CACHE, MISSING
+from lightcone.gate.base.schema import SCHEMAS
+from lightcone.utils.config import lazy_config
+from lightcone.utils.deadline import deadline_scope, deadline_exceeded, remaining, parse_timeout, DeadlineExceeded
+from lightcone.utils.log import log_scope
+from lightcone.utils.tracing import span
+from lightcone.utils.memory import MEMORY
+from lightcone.utils.metrics import METRICS
+from lightcone.utils.profiler import PROFILER, KIND_COMMAND
 from lightcone.utils.tools import logging
 
-PROJ = Config("proj.ini")
-pipe_module_prefix = PROJ.get("web.pipe")
-pipe_config = Config("pipes.json")
-command_config = Config("commands.json")
+PROJ = lazy_config("proj.ini")
+pipe_config = lazy_config("pipes.json")
+command_config = lazy_config("commands.json")
+
+# 指标中找不到指令时使用的command_id，避免任意输入的command_id导致标签无限增长
+UNKNOWN_COMMAND_ID = "__unknown__"
+# 指令执行的各个阶段
+STAGE_BUILD = "build"
+STAGE_BEFORE = "before"
+STAGE_RUN = "run"
+STAGE_AFTER = "after"
+STAGE_SERIALIZE = "serialize"
+
+STAGE_SECONDS = METRICS.histogram("lightcone_gate_stage_seconds", "Gate各阶段耗时（秒）", ("command_id", "stage"))
+RESPONSES = METRICS.counter("lightcone_gate_responses_total", "按返回码统计的指令返回数", ("command_id", "code"))
+IN_FLIGHT = METRICS.gauge("lightcone_gate_in_flight", "正在执行的指令数", ("command_id",))
 
 
 class Gate:
@@ -25,7 +52,7 @@ class Gate:
                                            default=pipe_config.get("default.before", []))
             current_pipe = None
             for pipe in before_pipes:
-                module_name = concat(pipe_module_prefix, pipe.lower(), ".")
+                module_name = concat(PROJ.get("web.pipe"), pipe.lower(), ".")
                 class_name = pipe
                 pipe_class = load_class(module_name, class_name, Pipe)
                 if pipe_class is None:
@@ -33,7 +60,10 @@ class Gate:
 
                 # 创建类的实例（假设类没有初始化参数，或你需要添加参数）
                 current_pipe = cast(Pipe, pipe_class())
-                pipe_status = current_pipe.run(cmd)
+                with span(f"pipe {class_name}") as pipe_span:
+                    pipe_status = PIPE_MEMO.run(current_pipe, cmd)
+                    if pipe_span is not None:
+                        pipe_span.set_attribute("lightcone.pipe.status", getattr(pipe_status, "name", str(pipe_status)))
                 if isinstance(pipe_status, PipeReturnStatus):
                     if pipe_status == PipeReturnStatus.INTERRUPT:
                         break
@@ -60,7 +90,7 @@ class Gate:
                                           default=pipe_config.get("default.after", []))
             current_pipe = None
             for pipe in after_pipes:
-                module_name = concat(pipe_module_prefix, pipe.lower(), ".")
+                module_name = concat(PROJ.get("web.pipe"), pipe.lower(), ".")
                 class_name = pipe.split(".")[-1]
                 pipe_class = load_class(module_name, class_name, Pipe)
                 if pipe_class is None:
@@ -68,7 +98,10 @@ class Gate:
 
                 # 创建类的实例（假设类没有初始化参数，或你需要添加参数）
                 current_pipe = cast(Pipe, pipe_class())
-                pipe_status = current_pipe.run(cmd)
+                with span(f"pipe {class_name}") as pipe_span:
+                    pipe_status = PIPE_MEMO.run(current_pipe, cmd)
+                    if pipe_span is not None:
+                        pipe_span.set_attribute("lightcone.pipe.status", getattr(pipe_status, "name", str(pipe_status)))
                 if isinstance(pipe_status, PipeReturnStatus):
                     if pipe_status == PipeReturnStatus.INTERRUPT.value:
                         break
@@ -90,29 +123,76 @@ class Gate:
 
     @classmethod
     def call(cls, command_id: str, param: Any, method: str) -> CommandResponse:
+        started = time.perf_counter()
+        param, param_error = SCHEMAS.validate(command_id, param)
         cmd = cls._build_command(command_id, method)
         if cmd is None:
-            return build_no_command_response(command_id)
-        else:
-            return Gate._eval(cmd, param, method)
+            cls._observe_stage(UNKNOWN_COMMAND_ID, STAGE_BUILD, started)
+            return cls._count_response(UNKNOWN_COMMAND_ID, build_no_command_response(command_id))
+        cls._observe_stage(cmd.command_id, STAGE_BUILD, started)
+        if param_error is not None:
+            return cls._count_response(cmd.command_id, build_bad_request_response(cmd, param_error))
+
+        METRICS.ensure_exporter()
+        ticket = ADMISSION.admit(cmd.command_id, param)
+        if not ticket.admitted:
+            return cls._count_response(cmd.command_id, build_overload_response(cmd, ticket.retry_after))
+
+        IN_FLIGHT.inc((cmd.command_id,))
+        try:
+            with deadline_scope(cls._command_timeout(cmd.command_id)), log_scope(command_id=cmd.command_id), \
+                    span(f"gate {cmd.command_id}", attributes={"lightcone.method": method}) as gate_span, \
+                    PROFILER.profile(KIND_COMMAND, cmd.command_id), MEMORY.track(KIND_COMMAND, cmd.command_id):
+                response = Gate._eval(cmd, param, method)
+                _trace_response(gate_span, response)
+        finally:
+            IN_FLIGHT.dec((cmd.command_id,))
+            ticket.release()
+        return cls._count_response(cmd.command_id, response)
 
     @classmethod
     def _eval(cls, cmd: Command, param, method):
+        started = time.perf_counter()
         before_response = cls.__before_method(cmd)
+        started = cls._observe_stage(cmd.command_id, STAGE_BEFORE, started)
         if before_response is not None:
             return before_response
+        if deadline_exceeded():
+            return build_timeout_response(cmd)
+        etag = cls._version_etag(cmd, param, method)
+        if etag is not None and current_conditional().matches(etag):
+            return build_not_modified_response(cmd, etag)
 
         try:
-            # 调用run方法，执行指令
-            if cmd.run(param, method):
+            cached, cache_key = RESULT_CACHE.lookup(cmd, param, method)
+            if cached is not MISSING:
+                # 命中指令结果缓存，跳过run
+                cmd.result = cached
                 response = build_success_response(cmd)
+            # 调用run方法，执行指令
             else:
-                return build_fail_response(cmd)
+                with span("command.run"):
+                    succeeded = cmd.run(param, method)
+                if succeeded:
+                    response = build_success_response(cmd)
+                    RESULT_CACHE.store(cmd, cache_key)
+                elif deadline_exceeded():
+                    # 指令检查到截止时间已过而提前返回
+                    return build_timeout_response(cmd)
+                else:
+                    return build_fail_response(cmd)
+        except DeadlineExceeded:
+            return build_timeout_response(cmd)
         except Exception as e:
             logging.error(f"：{e}")
             return build_error_response(cmd)
+        finally:
+            started = cls._observe_stage(cmd.command_id, STAGE_RUN, started)
 
+        if response is not None:
+            response.etag = etag
         after_response = cls.__after_method(cmd, response)
+        cls._observe_stage(cmd.command_id, STAGE_AFTER, started)
         if after_response is not None:
             return after_response
 
@@ -120,33 +200,158 @@ class Gate:
 
     @classmethod
     async def async_call(cls, command_id: str, param: Any, method: str, callback=None, header_call=None):
+        started = time.perf_counter()
+        param, param_error = SCHEMAS.validate(command_id, param)
         cmd = cls._build_command(command_id, method, callback, header_call)
         if cmd is None:
-            return build_no_command_response(command_id)
-        else:
+            cls._observe_stage(UNKNOWN_COMMAND_ID, STAGE_BUILD, started)
+            return cls._count_response(UNKNOWN_COMMAND_ID, build_no_command_response(command_id))
+        cls._observe_stage(cmd.command_id, STAGE_BUILD, started)
+        if param_error is not None:
+            return cls._count_response(cmd.command_id, build_bad_request_response(cmd, param_error))
+
+        METRICS.ensure_exporter()
+        ticket = await ADMISSION.async_admit(cmd.command_id, param)
+        if not ticket.admitted:
+            return cls._count_response(cmd.command_id, build_overload_response(cmd, ticket.retry_after))
+        if deadline_exceeded():
+            # 准入排队已用完请求的截止时间
+            ticket.release()
+            return cls._count_response(cmd.command_id, build_timeout_response(cmd))
+        lane = LANES.lane_for(cmd.command_id)
+
+        IN_FLIGHT.inc((cmd.command_id,))
+        try:
+            with deadline_scope(cls._command_timeout(cmd.command_id)), log_scope(command_id=cmd.command_id), \
+                    span(f"gate {cmd.command_id}", attributes={"lightcone.method": method}) as gate_span, \
+                    PROFILER.profile(KIND_COMMAND, cmd.command_id, loop_wide=True), \
+                    MEMORY.track(KIND_COMMAND, cmd.command_id):
+                timeout = remaining()
+                if timeout is None:
+                    response = await cls._async_eval_in_lane(lane, cmd, param, method)
+                elif timeout <= 0:
+                    response = build_timeout_response(cmd)
+                else:
+                    try:
+                        # 截止时间到达时取消指令（包括仍在通道中排队的），客户端断开时sanic会直接取消整个请求任务
+                        response = await asyncio.wait_for(cls._async_eval_in_lane(lane, cmd, param, method),
+                                                          max(0.0, timeout))
+                    except asyncio.TimeoutError:
+                        logging.warning(f"指令{cmd.command_id}执行超时，已取消")
+                        response = build_timeout_response(cmd)
+                _trace_response(gate_span, response)
+        finally:
+            IN_FLIGHT.dec((cmd.command_id,))
+            ticket.release()
+        return cls._count_response(cmd.command_id, response)
+
+    @classmethod
+    async def dispatch(cls, command_id: str, param: Any, method: str) -> CommandResponse:
+        """
+        在指令所属的执行通道中执行同步指令，不阻塞事件循环，也不会被其他通道的指令阻塞
+        指令没有配置执行通道时，与 call 相同，在当前线程中执行
+        """
+        lane = LANES.lane_for(command_id)
+        if lane is None:
+            return cls.call(command_id, param, method)
+        if not lane.try_enqueue():
+            return build_busy_response(command_id, LANE_RETRY_AFTER)
+        return await lane.run_sync(cls.call, command_id, param, method)
+
+    @classmethod
+    async def _async_eval_in_lane(cls, lane, cmd: Command, param, method):
+        if lane is None:
+            return await cls._async_eval(cmd, param, method)
+        # 在协程内部进入排队：协程在开始执行前被取消（如 wait_for 超时）时不会留下排队计数
+        # try_enqueue 与 slot 之间没有 await，slot 获取名额失败时负责退出排队
+        if not lane.try_enqueue():
+            return build_overload_response(cmd, LANE_RETRY_AFTER)
+        async with lane.slot():
             return await cls._async_eval(cmd, param, method)
 
     @classmethod
     async def _async_eval(cls, cmd: Command, param, method):
+        started = time.perf_counter()
         before_response = cls.__before_method(cmd)
+        started = cls._observe_stage(cmd.command_id, STAGE_BEFORE, started)
         if before_response is not None:
             return before_response
+        if deadline_exceeded():
+            return build_timeout_response(cmd)
+        etag = cls._version_etag(cmd, param, method)
+        if etag is not None and current_conditional().matches(etag):
+            return build_not_modified_response(cmd, etag)
 
         response = None
         try:
-            # 调用run方法，执行指令
-            if await cmd.async_run(param, method):
+            cached, cache_key = RESULT_CACHE.lookup(cmd, param, method)
+            if cached is not MISSING:
+                # 命中指令结果缓存，跳过run
+                cmd.result = cached
                 response = build_success_response(cmd)
+            # 调用run方法，执行指令
+            else:
+                with span("command.async_run"):
+                    succeeded = await cmd.async_run(param, method)
+                if succeeded:
+                    response = build_success_response(cmd)
+                    RESULT_CACHE.store(cmd, cache_key)
+        except DeadlineExceeded:
+            return build_timeout_response(cmd)
         except Exception as e:
             logging.error(f"指令执行异常：{e}")
             return build_error_response(cmd)
+        finally:
+            started = cls._observe_stage(cmd.command_id, STAGE_RUN, started)
 
-        after_response = cls.__before_method(cmd)
+        if response is not None:
+            response.etag = etag
+        after_response = cls.__after_method(cmd, response)
+        cls._observe_stage(cmd.command_id, STAGE_AFTER, started)
         if after_response is not None:
             return after_response
 
         return response or build_error_response(cmd)
 
+    @staticmethod
+    def _observe_stage(command_id, stage, started) -> float:
+        """
+        记录从 started 到当前的阶段耗时，返回当前时间，供下一阶段作为起点
+        """
+        now = time.perf_counter()
+        STAGE_SECONDS.observe((command_id, stage), now - started)
+        return now
+
+    @staticmethod
+    def _version_etag(cmd: Command, param, method):
+        """
+        GET/HEAD 请求且指令配置了 etag 时，由指令的 version_key 生成 ETag
+        """
+        if current_conditional() is None or not etag_enabled(cmd.command_id):
+            return None
+        try:
+            version = cmd.version_key(param, method)
+        except Exception as e:
+            logging.warning(f"指令{cmd.command_id}获取版本标识失败：{e}")
+            return None
+        return version_etag(cmd.command_id, method, param, version) if version is not None else None
+
+    @staticmethod
+    def _command_timeout(command_id):
+        """
+        指令的超时秒数，commands.json 中指令的 timeout 优先，其次为 proj.ini 中的 gate.timeout
+        """
+        timeout = parse_timeout(command_config.get(f"{command_id}.timeout"))
+        if timeout is None:
+            timeout = parse_timeout(PROJ.get("gate.timeout"))
+        return timeout
+
+    @staticmethod
+    def _count_response(command_id, response):
+        if isinstance(response, CommandResponse):
+            RESPONSES.inc((command_id, response.code.name))
+        return response
+
     @classmethod
     def _build_command(cls, command_id: str, method: str, callback=None, header_call=None):
         command_class = None
@@ -184,3 +389,14 @@ class Gate:
         cmd.stream_callback = callback if callable(callback) else None
         cmd.header_callback = header_call if callable(header_call) else None
         return cmd
+
+
+def _trace_response(gate_span, response):
+    """
+    在指令的span上记录返回码，服务端错误标记为失败
+    """
+    if gate_span is None or not isinstance(response, CommandResponse):
+        return
+    gate_span.set_attribute("lightcone.code", response.code.value)
+    if response.code.value >= 500:
+        gate_span.set_error(response.message)
@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.metrics import METRICS
+
+PROJ = lazy_config("proj.ini")
+command_config = lazy_config("commands.json")
+
+# 未在 commands.json 中指定 lane 的指令使用的执行通道
+DEFAULT_LANE = "default"
+# 通道排队已满时建议的重试间隔（秒）
+LANE_RETRY_AFTER = 1.0
+
+QUEUE_DEPTH = METRICS.gauge("lightcone_lane_queue_depth", "执行通道中等待执行的指令数", ("lane",))
+RUNNING = METRICS.gauge("lightcone_lane_running", "执行通道中正在执行的指令数", ("lane",))
+WAIT_SECONDS = METRICS.histogram("lightcone_lane_wait_seconds", "指令在执行通道中排队等待的时间（秒）", ("lane",))
+LANE_REJECTED = METRICS.counter("lightcone_lane_rejected_total", "执行通道排队已满被拒绝的指令数", ("lane",))
+
+
+class Lane:
+    """
+    指令的执行通道，每个通道有独立的线程池（同步指令）和并发上限（异步指令），互不阻塞
+    workers 为线程池大小及异步指令的并发上限，max_queue 为最多排队的指令数，None 表示不限制
+    """
+
+    def __init__(self, name, workers, max_queue=None):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._waiting = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._semaphore = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # fork 之后在worker中第一次使用时才创建线程池
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix=f"lightcone-lane-{self.name}")
+        return self._executor
+
+    def try_enqueue(self) -> bool:
+        """
+        进入排队，排队已满时返回False
+        """
+        with self._lock:
+            # 空闲的执行名额可以直接接收，不占用排队名额
+            idle = max(0, self.workers - self._running)
+            if self.max_queue is not None and self._waiting >= self.max_queue + idle:
+                LANE_REJECTED.inc((self.name,))
+                return False
+            self._waiting += 1
+        QUEUE_DEPTH.inc((self.name,))
+        return True
+
+    async def run_sync(self, func, *args):
+        """
+        在通道的线程池中执行同步函数，调用前需要 try_enqueue 成功
+        当前上下文（截止时间等 contextvars）会传递到线程中
+        """
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def task():
+            self._start(submitted)
+            try:
+                return context.run(func, *args)
+            finally:
+                self._finish()
+
+        future = self.executor.submit(task)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 请求被取消时，尚未开始执行的任务不再执行，需要退出排队
+            if future.cancel():
+                self._abandon()
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        异步指令获取通道的执行名额，调用前需要 try_enqueue 成功，且两者之间不能有 await
+        获取名额前被取消时退出排队
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        submitted = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self._abandon()
+            raise
+        self._start(submitted)
+        try:
+            yield
+        finally:
+            self._finish()
+            self._semaphore.release()
+
+    def _start(self, submitted):
+        WAIT_SECONDS.observe((self.name,), time.perf_counter() - submitted)
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+        QUEUE_DEPTH.dec((self.name,))
+        RUNNING.inc((self.name,))
+
+    def _finish(self):
+        with self._lock:
+            self._running -= 1
+        RUNNING.dec((self.name,))
+
+    def _abandon(self):
+        with self._lock:
+            self._waiting -= 1
+        QUEUE_DEPTH.dec((self.name,))
+
+
+class LaneRegistry:
+    """
+    执行通道在 proj.ini 的 [lanes] 中配置，格式为 "workers, max_queue"，如：
+        [lanes]
+        interactive = 16, 64
+        export = 2, 8
+    指令在 commands.json 中通过 "lane" 指定通道，未指定时使用 default 通道
+    没有配置的通道（包括未配置的 default）返回None，指令按原方式在当前线程执行
+    """
+
+    def __init__(self):
+        self._lanes = {}
+        self._command_lanes = {}
+        self._lock = threading.Lock()
+
+    def lane_for(self, command_id):
+        if command_id in self._command_lanes:
+            return self._command_lanes[command_id]
+        if not isinstance(command_id, str) or command_config.get(f"{command_id}.module") is None:
+            # 不存在的指令不缓存，避免任意输入的command_id占用内存
+            return self.get(DEFAULT_LANE)
+        lane = self.get(command_config.get(f"{command_id}.lane") or DEFAULT_LANE)
+        self._command_lanes[command_id] = lane
+        return lane
+
+    def get(self, name):
+        if name in self._lanes:
+            return self._lanes[name]
+        with self._lock:
+            if name not in self._lanes:
+                self._lanes[name] = _parse_lane(name, PROJ.get(f"lanes.{name}"))
+            return self._lanes[name]
+
+
+def _parse_lane(name, value):
+    if value is None or value == "":
+        return None
+    parts = [part.strip() for part in str(value).split(",")]
+    workers = int(parts[0])
+    if workers <= 0:
+        return None
+    max_queue = int(parts[1]) if len(parts) > 1 and parts[1] else None
+    return Lane(name, workers, max_queue)
+
+
+# 全局执行通道
+LANES = LaneRegistry()
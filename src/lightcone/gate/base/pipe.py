@@ -22,7 +22,11 @@ class Pipe(ABC):
     若需要传低Pipe运行的返回结果，需要构造 gate.vo.Response 实例，并存入 self.response
     当run返回的code为 PipeReturnStatus.INTERRUPT 时，则指令执行器将以该Pipe构造的response作为指令执行返回值
     可以把处理结果以外的信息通过 self.message 传递
+    鉴权等开销大、结果只取决于少数参数的Pipe可以缓存执行结果：设置 memo_ttl 并重写 memo_key，见 memo_key
     """
+    # 执行结果的缓存时间（秒），0 表示不缓存
+    memo_ttl = 0
+
     def __init__(self):
         # 运行后的信息
         self._message = None
@@ -50,3 +54,38 @@ class Pipe(ABC):
     @response.setter
     def response(self, value):
         self._response = value
+
+    def memo_key(self, cmd: Command):
+        """
+        memo_ttl 大于0时，返回结果缓存的key（如 令牌 + command_id），相同key的请求在有效期内直接复用上次的执行结果，不再调用run
+        返回None表示本次不使用缓存；默认返回None
+        缓存 run 的返回状态、message 和 response 的 code/message；response 带有 result 或其他附加属性时不缓存
+        """
+        return None
+
+    def memo_scope(self, cmd: Command):
+        """
+        缓存结果所属的作用域（如令牌、用户id），invalidate_memo(scope) 只失效该作用域的结果；默认没有作用域
+        """
+        return None
+
+    def memo_state(self, cmd: Command):
+        """
+        run 除返回值、message、response 外对 cmd 做的修改（如写入的用户信息），需要与结果一起缓存时重写
+        返回值需要可以被 pickle
+        """
+        return None
+
+    def restore_memo_state(self, cmd: Command, state):
+        """
+        命中缓存时把 memo_state 缓存的内容重新应用到 cmd 上
+        """
+
+    @classmethod
+    def invalidate_memo(cls, scope=None):
+        """
+        使该Pipe缓存的执行结果失效，对所有worker生效
+        登出、权限变更时调用：指定 scope 时只失效该作用域的结果，否则失效全部结果
+        """
+        from lightcone.gate.base.pipememo import PIPE_MEMO
+        PIPE_MEMO.invalidate(cls, scope)
@@ -0,0 +1,133 @@
+import hashlib
+import uuid
+
+from lightcone.core import Command
+from lightcone.gate.base.pipe import Pipe, PipeReturnStatus
+from lightcone.gate.base.response import CommandResponse, CommandResponseCode
+from lightcone.utils.metrics import METRICS
+from lightcone.utils.sharedcache import get_shared_cache
+from lightcone.utils.tools import logging
+from lightcone.utils.tracing import current_span
+
+# Pipe结果使用的共享缓存
+CACHE_NAME = "pipe"
+# 失效代数的有效期（秒），过期后自动换成新的代数，旧的缓存结果随之失效
+GENERATION_TTL = 86400
+
+REQUESTS = METRICS.counter("lightcone_pipe_memo_requests_total", "Pipe结果缓存的查询次数", ("pipe", "result"))
+
+
+class PipeMemo:
+    """
+    Pipe结果的跨worker缓存，Pipe设置 memo_ttl 并实现 memo_key 后启用，见 Pipe.memo_key
+    缓存的内容为 run 的返回状态、message 和 response 的 code/message，命中时不执行 run，把缓存的结果还原到Pipe上
+    response 带有 result、retry_after、etag 或其他附加属性时不缓存（命中时无法完整还原），每次都执行 run
+    缓存key中包含Pipe和作用域（memo_scope）的失效代数，invalidate 换成新的代数，旧的缓存结果不再可见
+    key 和作用域在写入共享内存前做哈希，不会以明文保存令牌
+    """
+
+    def run(self, pipe: Pipe, cmd: Command):
+        ttl = pipe.memo_ttl
+        if not ttl:
+            return pipe.run(cmd)
+        name = type(pipe).__name__
+        try:
+            key = pipe.memo_key(cmd)
+            cache_key = self._cache_key(name, pipe.memo_scope(cmd), key) if key is not None else None
+        except Exception as e:
+            logging.warning(f"计算Pipe{name}的缓存key失败：{e}")
+            cache_key = None
+        if cache_key is None:
+            return pipe.run(cmd)
+
+        cache = get_shared_cache(CACHE_NAME)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            REQUESTS.inc((name, "hit"))
+            _mark_span("hit")
+            return self._restore(pipe, cmd, cached)
+
+        REQUESTS.inc((name, "miss"))
+        _mark_span("miss")
+        status = pipe.run(cmd)
+        if isinstance(status, PipeReturnStatus) and _memoizable(pipe.response):
+            try:
+                cache.set(cache_key, self._snapshot(pipe, cmd, status), ttl)
+            except Exception as e:
+                logging.warning(f"缓存Pipe{name}的结果失败：{e}")
+        return status
+
+    def invalidate(self, pipe_class, scope=None):
+        """
+        使 pipe_class 的缓存结果失效：指定 scope 时只失效该作用域（如某个令牌）的结果，否则失效全部结果
+        """
+        cache = get_shared_cache(CACHE_NAME)
+        cache.set(self._generation_key(pipe_class.__name__, scope), uuid.uuid4().hex, GENERATION_TTL)
+
+    def _cache_key(self, name, scope, key) -> str:
+        generations = self._generation(name, None)
+        if scope is not None:
+            generations = f"{generations}:{self._generation(name, scope)}"
+        digest = _digest(f"{scope}\0{key}")
+        return f"pipe:{name}:{generations}:{digest}"
+
+    def _generation(self, name, scope) -> str:
+        cache = get_shared_cache(CACHE_NAME)
+        generation_key = self._generation_key(name, scope)
+        generation = cache.get(generation_key)
+        if generation is None:
+            # 代数不存在（首次使用或已被淘汰）时生成新的代数，不会读到淘汰前写入的结果
+            generation = uuid.uuid4().hex
+            cache.set(generation_key, generation, GENERATION_TTL)
+        return generation
+
+    @staticmethod
+    def _generation_key(name, scope) -> str:
+        return f"pipe-gen:{name}:{_digest(str(scope)) if scope is not None else '*'}"
+
+    @staticmethod
+    def _snapshot(pipe: Pipe, cmd: Command, status: PipeReturnStatus) -> tuple:
+        response = pipe.response
+        if isinstance(response, CommandResponse):
+            response = (response.code.value, response.message)
+        else:
+            response = None
+        return status.value, pipe.message, response, pipe.memo_state(cmd)
+
+    @staticmethod
+    def _restore(pipe: Pipe, cmd: Command, cached):
+        status, message, response, state = cached
+        pipe.message = message
+        if response is not None:
+            code, response_message = response
+            pipe.response = CommandResponse(code=CommandResponseCode(code), message=response_message, command=cmd)
+        if state is not None:
+            pipe.restore_memo_state(cmd, state)
+        return PipeReturnStatus(status)
+
+
+# CommandResponse 自带的属性，超出这些属性的 response 不缓存
+_RESPONSE_FIELDS = frozenset(vars(CommandResponse(CommandResponseCode.SUCCESS)))
+
+
+def _memoizable(response) -> bool:
+    if response is None:
+        return True
+    if not isinstance(response, CommandResponse):
+        return False
+    return (response.result is None and response.retry_after is None and response.etag is None
+            and _RESPONSE_FIELDS.issuperset(vars(response)))
+
+
+def _mark_span(result):
+    pipe_span = current_span()
+    if pipe_span is not None:
+        pipe_span.set_attribute("lightcone.pipe.memo", result)
+
+
+def _digest(value: str) -> str:
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=12).hexdigest()
+
+
+# 全局Pipe结果缓存
+PIPE_MEMO = PipeMemo()
@@ -5,12 +5,15 @@ from lightcone.core import Command
 
 class CommandResponseCode(Enum):
     SUCCESS = 200
+    NOT_MODIFIED = 304
     FAIL = 503
     ERROR = 500
     BAD_REQUEST = 400
     NOT_LOGIN = 401
     NO_RIGHT = 403
     NO_COMMAND = 404
+    TOO_LARGE = 413
+    TIMEOUT = 504
 
 
 # 返回信息模版
@@ -20,6 +23,9 @@ MESSAGE_SUCCESS = "执行成功"
 MESSAGE_ERROR = "操作执行失败"
 MESSAGE_NO_COMMAND = "找不到您要执行的操作"
 MESSAGE_BAD_PROTOCOL = "无法执行这个操作"
+MESSAGE_OVERLOAD = "系统繁忙，请稍后重试"
+MESSAGE_TIMEOUT = "操作超时，请稍后重试"
+MESSAGE_NOT_MODIFIED = "数据未变化"
 
 
 def build_not_login_response(cmd: Command):
@@ -57,13 +63,36 @@ def build_fail_response(cmd: Command):
     return response
 
 
-def build_bad_request_response(cmd: Command):
+def build_bad_request_response(cmd: Command, message=None):
     response = CommandResponse(code=CommandResponseCode.BAD_REQUEST,
-                               message=MESSAGE_ERROR.format(cmd.command_id),
+                               message=message or MESSAGE_ERROR.format(cmd.command_id),
+                               command=cmd)
+    return response
+
+
+def build_overload_response(cmd: Command, retry_after=None):
+    response = CommandResponse(code=CommandResponseCode.FAIL,
+                               message=MESSAGE_OVERLOAD.format(cmd.command_id),
+                               command=cmd)
+    response.retry_after = retry_after
+    return response
+
+
+def build_timeout_response(cmd: Command):
+    response = CommandResponse(code=CommandResponseCode.TIMEOUT,
+                               message=MESSAGE_TIMEOUT.format(cmd.command_id),
                                command=cmd)
     return response
 
 
+def build_not_modified_response(cmd: Command, etag):
+    response = CommandResponse(code=CommandResponseCode.NOT_MODIFIED,
+                               message=MESSAGE_NOT_MODIFIED.format(cmd.command_id),
+                               command=cmd)
+    response.etag = etag
+    return response
+
+
 def build_protocol_not_support_response(command_id):
     response = CommandResponse(code=CommandResponseCode.NO_COMMAND,
                                message=MESSAGE_BAD_PROTOCOL.format(command_id))
@@ -71,6 +100,14 @@ def build_protocol_not_support_response(command_id):
     return response
 
 
+def build_busy_response(command_id, retry_after=None):
+    response = CommandResponse(code=CommandResponseCode.FAIL,
+                               message=MESSAGE_OVERLOAD.format(command_id))
+    response.command_id = command_id
+    response.retry_after = retry_after
+    return response
+
+
 def build_no_command_response(command_id):
     response = CommandResponse(code=CommandResponseCode.NO_COMMAND,
                                message=MESSAGE_NO_COMMAND.format(command_id))
@@ -84,6 +121,10 @@ class CommandResponse:
         self._result = None
         self._message = message
         self._command = command
+        # 被准入控制拒绝时，建议客户端重试的间隔（秒）
+        self.retry_after = None
+        # 支持条件请求的指令的 ETag
+        self.etag = None
         if command and isinstance(command, Command):
             self._command_id = command.command_id
             self._method = command.method
@@ -94,12 +135,15 @@ class CommandResponse:
             self._result = None
 
     def to_dict(self):
-        return {"code": self.code.value,
-                "message": self.message,
-                "result": self.result,
-                "command_id": self.command_id,
-                "method": self.method
-                }
+        ret = {"code": self.code.value,
+               "message": self.message,
+               "result": self.result,
+               "command_id": self.command_id,
+               "method": self.method
+               }
+        if self.retry_after is not None:
+            ret["retry_after"] = round(self.retry_after, 3)
+        return ret
 
     @property
     def result(self):
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import threading
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.sharedcache import get_shared_cache
+from lightcone.utils.tools import logging
+
+command_config = lazy_config("commands.json")
+
+# 指令结果默认使用的共享缓存
+DEFAULT_CACHE_NAME = "gate"
+DEFAULT_TTL = 30
+# 缓存未命中
+MISSING = object()
+
+
+class ResultCacheOptions:
+    __slots__ = ("cache", "ttl", "key_fields")
+
+    def __init__(self, cache, ttl, key_fields):
+        self.cache = cache
+        self.ttl = ttl
+        self.key_fields = key_fields
+
+
+class ResultCache:
+    """
+    指令结果的跨worker缓存，指令在 commands.json 中配置 cache 后启用：
+        "cache": {"ttl": 30, "key": ["page", "size"], "name": "gate"}
+    key 为参与缓存key的参数名，未配置时使用全部参数；结果与登录用户相关时，key 中必须包含标识用户的参数
+    前置Pipe（鉴权等）照常执行，命中缓存时跳过 run，把缓存的结果作为 cmd.result 继续执行后置Pipe
+    只缓存执行成功的结果
+    """
+
+    def __init__(self):
+        self._options = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, cmd, param, method):
+        """
+        返回 (缓存的结果或MISSING, 缓存key)，指令未启用缓存时缓存key为None
+        """
+        options = self._options_for(cmd.command_id)
+        if options is None:
+            return MISSING, None
+        key = _cache_key(cmd.command_id, method, param, options.key_fields)
+        return options.cache.get(key, MISSING), key
+
+    def store(self, cmd, key):
+        if key is None:
+            return
+        options = self._options_for(cmd.command_id)
+        try:
+            options.cache.set(key, cmd.result, options.ttl)
+        except Exception as e:
+            logging.warning(f"缓存指令{cmd.command_id}结果失败：{e}")
+
+    def invalidate(self, command_id, param, method):
+        """
+        主动删除指定参数的缓存结果
+        """
+        options = self._options_for(command_id)
+        if options is not None:
+            options.cache.delete(_cache_key(command_id, method, param, options.key_fields))
+
+    def _options_for(self, command_id):
+        if command_id in self._options:
+            return self._options[command_id]
+        config = command_config.get(f"{command_id}.cache")
+        options = None
+        if isinstance(config, dict):
+            try:
+                cache = get_shared_cache(config.get("name") or DEFAULT_CACHE_NAME)
+                key_fields = tuple(config["key"]) if config.get("key") is not None else None
+                options = ResultCacheOptions(cache, float(config.get("ttl", DEFAULT_TTL)), key_fields)
+            except Exception as e:
+                logging.error(f"指令{command_id}的缓存配置无效：{e}")
+        with self._lock:
+            self._options[command_id] = options
+        return options
+
+
+def _cache_key(command_id, method, param, key_fields) -> str:
+    if not isinstance(param, dict):
+        values = param
+    elif key_fields is None:
+        values = param
+    else:
+        values = {field: param.get(field) for field in key_fields}
+    serialized = json.dumps(values, sort_keys=True, default=str, separators=(",", ":"), ensure_ascii=False)
+    digest = hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{command_id}:{method}:{digest}"
+
+
+# 全局指令结果缓存
+RESULT_CACHE = ResultCache()
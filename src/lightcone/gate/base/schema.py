@@ -0,0 +1,289 @@
+import copy
+import threading
+from datetime import datetime
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.jsonencoder import dg_json_loads
+from lightcone.utils.tools import logging
+from lightcone.utils.upload import UploadedFile
+
+command_config = lazy_config("commands.json")
+
+# 不能声明 min/max、choices 的类型
+_NO_RANGE_TYPES = frozenset(("bool", "json", "any"))
+_NO_CHOICES_TYPES = frozenset(("json", "dict", "list", "file"))
+# 布尔参数可以接受的字符串
+_TRUE_STRINGS = frozenset(("1", "true", "yes", "on", "y", "t"))
+_FALSE_STRINGS = frozenset(("0", "false", "no", "off", "n", "f", ""))
+
+
+class SchemaError(ValueError):
+    """
+    参数不符合指令的参数声明
+    """
+
+
+def compile_schema(schema: dict, prefix=""):
+    """
+    把 commands.json 中指令的 params 声明编译为校验函数，校验函数接收参数字典，返回转换类型后的新字典
+    参数不合法时校验函数抛出 SchemaError
+    声明格式：
+        "params": {
+            "page": {"type": "int", "default": 1, "min": 1},
+            "uid": {"type": "str", "required": true},
+            "status": {"type": "str", "choices": ["open", "closed"]},
+            "ids": {"type": "list", "items": "int", "max": 100},
+            "filter": {"type": "json", "schema": {"start": "datetime", "end": "datetime"}},
+            "name": "str"
+        }
+    type 可以是 str/int/float/bool/datetime/json/dict/list/file/any，声明为字符串时等价于 {"type": 该字符串}
+    min/max 对数字限制取值范围，对 datetime 限制时间戳，对 str/list/dict 限制长度，对 file 限制文件字节数，
+    不能用于 bool/json/any；choices 不能用于 json/dict/list/file；未声明的参数原样保留
+    file 类型的参数只能通过流式上传路由（rest_upload_handler）传入
+    """
+    if not isinstance(schema, dict):
+        raise SchemaError(f"参数声明必须是字典：{prefix or schema}")
+    fields = tuple(_compile_field(f"{prefix}{name}", name, spec) for name, spec in schema.items())
+
+    def validate(params):
+        result = dict(params) if isinstance(params, dict) else {}
+        for name, label, convert, required, has_default, default, empty_is_missing in fields:
+            value = result.get(name)
+            if value is None or empty_is_missing and value == "":
+                if required:
+                    raise SchemaError(f"缺少参数{label}")
+                if has_default:
+                    result[name] = copy.copy(default)
+                elif name in result:
+                    result[name] = None
+                continue
+            result[name] = convert(value)
+        return result
+
+    return validate
+
+
+def _compile_field(label, name, spec):
+    if isinstance(spec, str):
+        spec = {"type": spec}
+    if not isinstance(spec, dict):
+        raise SchemaError(f"参数{label}的声明无效")
+    type_name = spec.get("type", "any")
+    if type_name in _NO_RANGE_TYPES and ("min" in spec or "max" in spec):
+        raise SchemaError(f"参数{label}的类型{type_name}不能声明 min/max")
+    if type_name in _NO_CHOICES_TYPES and "choices" in spec:
+        raise SchemaError(f"参数{label}的类型{type_name}不能声明 choices")
+    convert = _compile_type(label, type_name, spec)
+    convert = _with_constraints(label, convert, spec)
+    # 表单中未填写的字段为空字符串，除 str 外都视为未传
+    empty_is_missing = type_name != "str"
+    return name, label, convert, bool(spec.get("required")), "default" in spec, spec.get("default"), empty_is_missing
+
+
+def _compile_type(label, type_name, spec):
+    if type_name == "str":
+        return _to_str
+    if type_name == "int":
+        return _named(label, _to_int, "整数")
+    if type_name == "float":
+        return _named(label, _to_float, "数字")
+    if type_name == "bool":
+        return _named(label, _to_bool, "布尔值")
+    if type_name == "datetime":
+        return _named(label, _to_datetime, "时间戳")
+    if type_name in ("json", "dict"):
+        nested = compile_schema(spec["schema"], f"{label}.") if "schema" in spec else None
+        return _json_converter(label, type_name, nested)
+    if type_name == "list":
+        items = spec.get("items")
+        item_convert = _compile_field(f"{label}[]", None, items)[2] if items is not None else None
+        return _list_converter(label, item_convert)
+    if type_name == "file":
+        return _to_file(label)
+    if type_name == "any":
+        return _identity
+    raise SchemaError(f"参数{label}的类型{type_name}不存在")
+
+
+def _with_constraints(label, convert, spec):
+    minimum = spec.get("min")
+    maximum = spec.get("max")
+    choices = spec.get("choices")
+    if minimum is None and maximum is None and choices is None:
+        return convert
+    try:
+        choices = frozenset(choices) if choices is not None else None
+    except TypeError:
+        raise SchemaError(f"参数{label}的 choices 只能包含字符串、数字等简单值") from None
+
+    def constrained(value):
+        value = convert(value)
+        if isinstance(value, UploadedFile):
+            measure = value.size
+        elif isinstance(value, datetime):
+            measure = value.timestamp()
+        else:
+            measure = len(value) if isinstance(value, (str, list, dict)) else value
+        try:
+            if minimum is not None and measure < minimum:
+                raise SchemaError(f"参数{label}不能小于{minimum}")
+            if maximum is not None and measure > maximum:
+                raise SchemaError(f"参数{label}不能大于{maximum}")
+            if choices is not None and value not in choices:
+                raise SchemaError(f"参数{label}的取值无效")
+        except TypeError:
+            # any 等类型的取值可能无法比较或不可哈希（如列表、对象）
+            raise SchemaError(f"参数{label}的取值无效") from None
+        return value
+
+    return constrained
+
+
+def _named(label, convert, type_text):
+    def named(value):
+        try:
+            return convert(value)
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise SchemaError(f"参数{label}必须为{type_text}") from None
+
+    return named
+
+
+def _json_converter(label, type_name, nested):
+    def convert(value):
+        if isinstance(value, (str, bytes)):
+            try:
+                value = dg_json_loads(value)
+            except ValueError:
+                raise SchemaError(f"参数{label}不是有效的JSON") from None
+        if type_name == "dict" or nested is not None:
+            if not isinstance(value, dict):
+                raise SchemaError(f"参数{label}必须为对象")
+            if nested is not None:
+                value = nested(value)
+        return value
+
+    return convert
+
+
+def _list_converter(label, item_convert):
+    def convert(value):
+        if isinstance(value, str):
+            text = value.strip()
+            if text.startswith("["):
+                try:
+                    value = dg_json_loads(text)
+                except ValueError:
+                    raise SchemaError(f"参数{label}不是有效的JSON") from None
+            else:
+                # 表单或查询参数中用逗号分隔的列表
+                value = [item.strip() for item in text.split(",")] if text else []
+        if not isinstance(value, (list, tuple)):
+            raise SchemaError(f"参数{label}必须为列表")
+        if item_convert is None:
+            return list(value)
+        return [item_convert(item) for item in value]
+
+    return convert
+
+
+def _to_file(label):
+    def convert(value):
+        if not isinstance(value, UploadedFile):
+            raise SchemaError(f"参数{label}必须为上传的文件")
+        return value
+
+    return convert
+
+
+def _identity(value):
+    return value
+
+
+def _to_str(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    return int(str(value).strip())
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).strip())
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value != 0
+    text = str(value).strip().lower()
+    if text in _TRUE_STRINGS:
+        return True
+    if text in _FALSE_STRINGS:
+        return False
+    raise ValueError(value)
+
+
+def _to_datetime(value):
+    # 与 DGJSONEncoder 一致，时间以秒级时间戳传递
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return datetime.fromtimestamp(float(value))
+
+
+class SchemaRegistry:
+    """
+    按 command_id 缓存编译好的参数校验函数，没有声明 params 的指令返回None
+    """
+
+    def __init__(self):
+        self._validators = {}
+        self._lock = threading.Lock()
+
+    def validator_for(self, command_id):
+        if command_id in self._validators:
+            return self._validators[command_id]
+        if not isinstance(command_id, str) or command_config.get(f"{command_id}.module") is None:
+            return None
+        schema = command_config.get(f"{command_id}.params")
+        validator = None
+        if schema is not None:
+            try:
+                validator = compile_schema(schema)
+            except (SchemaError, KeyError, TypeError) as e:
+                # 声明有误时不校验，避免配置错误导致指令完全不可用
+                logging.error(f"指令{command_id}的参数声明无效：{e}")
+        with self._lock:
+            self._validators[command_id] = validator
+        return validator
+
+    def validate(self, command_id, params):
+        """
+        返回 (转换后的参数, 错误信息)，指令没有参数声明时原样返回参数
+        """
+        validator = self.validator_for(command_id)
+        if validator is None:
+            return params, None
+        try:
+            return validator(params), None
+        except SchemaError as e:
+            return params, str(e)
+
+
+# 全局参数校验
+SCHEMAS = SchemaRegistry()
@@ -1,20 +1,46 @@
+import time
 from abc import ABC
 from enum import Enum
 
 from sanic.request import Request
+from sanic.response import HTTPResponse
 
+from lightcone.utils.config import lazy_config
+from lightcone.utils.deadline import deadline_scope, request_timeout
+from lightcone.utils.log import log_scope
+from lightcone.utils.tracing import trace_request
 from lightcone.utils.tools import logging, params_dict_from_request
-from lightcone.utils.jsonencoder import r_json
-from .base.gate import Gate
+from lightcone.utils.jsonencoder import r_json, dg_json_dumps
+from lightcone.utils.msgpackencoder import accepts_msgpack, msgpack_available, r_msgpack, dg_msgpack_dumps, \
+    MSGPACK_CONTENT_TYPE
+from lightcone.utils.recorder import RECORDER, KIND_REST
+from lightcone.utils.upload import UploadError, UploadTooLarge, UploadLimits, params_from_stream, close_uploads
+from .base.admission import retry_after_header
+from .base.conditional import conditional_scope, etag_enabled, body_etag
+from .base.gate import Gate, STAGE_SERIALIZE, UNKNOWN_COMMAND_ID
 from .base.response import CommandResponse, CommandResponseCode
 
 # 请求中的参数名
 REST_PARAM_KEY_COMMAND_ID = "__command_id"
 REST_PARAM_KEY_METHOD = "__method"
 
+command_config = lazy_config("commands.json")
 
-def rest_call_command(request: Request):
-    return REST.call_from_reqeust(request)
+
+async def rest_call_command(request: Request):
+    with RECORDER.record(KIND_REST, request, REST_PARAM_KEY_COMMAND_ID, REST_PARAM_KEY_METHOD), \
+            log_scope(request_id=request.id), trace_request(request):
+        return await REST.async_call_from_request(request)
+
+
+async def rest_upload_command(request: Request):
+    """
+    流式上传入口，需要注册为 stream=True 的路由：
+        app.add_route(rest_upload_handler, "/upload", methods=["POST", "PUT"], stream=True)
+    """
+    with RECORDER.record(KIND_REST, request, REST_PARAM_KEY_COMMAND_ID, REST_PARAM_KEY_METHOD), \
+            log_scope(request_id=request.id), trace_request(request):
+        return await REST.async_upload_from_request(request)
 
 
 class ParamType(Enum):
@@ -32,48 +58,168 @@ class REST(Gate, ABC):
                         自动识别params是否可被JSON反序列化，并反序列化为字典
         :return:
         """
+        param, error = cls._param_from_request(request)
+        if error is not None:
+            return error
+
+        command_id = param.pop(REST_PARAM_KEY_COMMAND_ID)
+        method = param.pop(REST_PARAM_KEY_METHOD)
+
+        binary = accepts_msgpack(request)
+        with deadline_scope(request_timeout(request), request), conditional_scope(request, binary) as conditional:
+            response = cls.call(command_id, param, method)
+            return cls._to_http_response(command_id, method, response, conditional, binary)
+
+    @classmethod
+    async def async_call_from_request(cls, request: Request):
+        """
+        与 call_from_reqeust 相同，指令在 commands.json 中配置的执行通道中执行，不阻塞事件循环
+        """
+        param, error = cls._param_from_request(request)
+        if error is not None:
+            return error
+
+        command_id = param.pop(REST_PARAM_KEY_COMMAND_ID)
+        method = param.pop(REST_PARAM_KEY_METHOD)
+
+        binary = accepts_msgpack(request)
+        with deadline_scope(request_timeout(request), request), conditional_scope(request, binary) as conditional:
+            response = await cls.dispatch(command_id, param, method)
+            return cls._to_http_response(command_id, method, response, conditional, binary)
+
+    @classmethod
+    async def async_upload_from_request(cls, request: Request):
+        """
+        边接收边解析 multipart 请求体，文件写入临时文件（小文件在内存中），以 UploadedFile 传给指令
+        __command_id 和 __method 必须放在查询参数中，以便在接收请求体之前确定指令的上传限制
+        上传限制读取 commands.json 中指令的 upload 配置，未配置的项使用 proj.ini 中 upload 的默认值：
+            "upload": {"max_file_size": 10485760, "max_total_size": 20971520, "max_files": 4}
+        """
+        command_id = request.args.get(REST_PARAM_KEY_COMMAND_ID)
+        method = request.args.get(REST_PARAM_KEY_METHOD)
+        if not command_id or not method:
+            return cls._bad_upload("上传请求的查询参数中缺少指令", binary=accepts_msgpack(request))
+
+        limits = UploadLimits.from_options(command_config.get(f"{command_id}.upload"))
         try:
-            param = params_dict_from_request(request)
+            param = await params_from_stream(request, limits)
+        except UploadTooLarge as e:
+            logging.warning(f"指令{command_id}上传内容超过限制：{e}")
+            return cls._bad_upload(str(e), command_id, method, CommandResponseCode.TOO_LARGE,
+                                   accepts_msgpack(request))
+        except UploadError as e:
+            logging.error(f"解析上传内容出错：{e}")
+            return cls._bad_upload(str(e), command_id, method, binary=accepts_msgpack(request))
+
+        try:
+            param.pop(REST_PARAM_KEY_COMMAND_ID, None)
+            param.pop(REST_PARAM_KEY_METHOD, None)
+            binary = accepts_msgpack(request)
+            with deadline_scope(request_timeout(request), request), conditional_scope(request, binary) as conditional:
+                response = await cls.dispatch(command_id, param, method)
+                return cls._to_http_response(command_id, method, response, conditional, binary)
+        finally:
+            close_uploads(param)
+
+    @classmethod
+    def _bad_upload(cls, message, command_id="", method="", code=CommandResponseCode.BAD_REQUEST, binary=False):
+        # 请求体可能还没有接收完，使用对应的HTTP状态码，让sanic关闭连接而不是继续读取
+        return cls._render({"code": code.value,
+                            "message": message,
+                            "result": "",
+                            "command_id": command_id,
+                            "method": method,
+                            "success": False
+                            }, status=code.value, binary=binary)
+
+    @classmethod
+    def _param_from_request(cls, request: Request):
+        try:
+            return params_dict_from_request(request), None
         except Exception as e:
             logging.error(f"解析参数列表出错：{e}")
-            return r_json(
+            return None, cls._render(
                 {"code": CommandResponseCode.BAD_REQUEST.value,
                  "message": "参数异常",
                  "result": "",
                  "command_id": "",
                  "method": "",
                  "success": False
-                 })
-
-        command_id = param.pop(REST_PARAM_KEY_COMMAND_ID)
-        method = param.pop(REST_PARAM_KEY_METHOD)
+                 }, binary=accepts_msgpack(request))
 
-        response = cls.call(command_id, param, method)
+    @classmethod
+    def _to_http_response(cls, command_id, method, response, conditional=None, binary=False):
+        """
+        binary 为True时（客户端的 Accept 优先 MessagePack）以 MessagePack 返回，否则返回JSON
+        """
+        if isinstance(response, CommandResponse) and response.code == CommandResponseCode.NOT_MODIFIED:
+            etag = conditional.representation_etag(response.etag) if conditional is not None else response.etag
+            headers = {"ETag": etag}
+            if msgpack_available():
+                headers["Vary"] = "Accept"
+            return HTTPResponse(status=304, headers=headers)
         if response and isinstance(response, CommandResponse):
+            started = time.perf_counter()
             try:
                 response_json = response.to_dict()
                 if CommandResponseCode.SUCCESS.value == response.code.value:
                     response_json["success"] = True
                 else:
                     response_json["success"] = False
-                ret = r_json(body=response_json)
+                headers = None
+                if response.retry_after is not None:
+                    headers = {"Retry-After": retry_after_header(response.retry_after)}
+                if conditional is not None and response.code == CommandResponseCode.SUCCESS \
+                        and (response.etag is not None or etag_enabled(command_id)):
+                    ret = cls._conditional_response(response_json, response.etag, conditional, binary)
+                else:
+                    ret = cls._render(response_json, headers, binary=binary)
             except Exception as e:
                 logging.error(f"序列化失败: {e}")
-                ret = r_json(
+                ret = cls._render(
                     {"code": CommandResponseCode.ERROR.value,
                      "message": "序列化失败",
                      "result": "",
                      "command_id": command_id,
                      "method": method,
                      "success": False
-                     })
+                     }, binary=binary)
+            metric_command_id = command_id if response.command is not None else UNKNOWN_COMMAND_ID
+            cls._observe_stage(metric_command_id, STAGE_SERIALIZE, started)
         else:
-            ret = r_json(
+            ret = cls._render(
                 {"code": CommandResponseCode.ERROR.value,
                  "message": "指令执行错误",
                  "result": "",
                  "command_id": command_id,
                  "method": method,
                  "success": False
-                 })
+                 }, binary=binary)
         return ret
+
+    @staticmethod
+    def _render(body, headers=None, status=200, binary=False):
+        response = r_msgpack(body, headers, status) if binary else r_json(body, headers, status)
+        if msgpack_available():
+            # 同一个URL按 Accept 返回不同格式，缓存需要区分
+            response.headers["Vary"] = "Accept"
+        return response
+
+    @staticmethod
+    def _conditional_response(response_json, etag, conditional, binary=False):
+        """
+        支持条件请求的指令：没有版本标识时按序列化后的内容计算 ETag，与客户端缓存一致时返回304
+        """
+        if binary:
+            body = dg_msgpack_dumps(response_json)
+            content_type = MSGPACK_CONTENT_TYPE
+        else:
+            body = dg_json_dumps(response_json).encode("utf-8")
+            content_type = "application/json"
+        etag = conditional.representation_etag(etag or body_etag(body))
+        headers = {"ETag": etag}
+        if msgpack_available():
+            headers["Vary"] = "Accept"
+        if conditional.matches(etag):
+            return HTTPResponse(status=304, headers=headers)
+        return HTTPResponse(body, headers=headers, content_type=content_type)
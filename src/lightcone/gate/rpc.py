@@ -1,5 +1,6 @@
 from typing import Any
 
+from lightcone.utils.tracing import TRACER, SPAN_KIND_SERVER
 from .base.gate import Gate
 from .base.response import CommandResponse
 
@@ -7,5 +8,11 @@ from .base.response import CommandResponse
 class RPC(Gate):
     # 一定要实现这个方法，否则在调用协议检测可能会出错
     @classmethod
-    def call(cls, command_id: str, param: Any, method: str) -> CommandResponse:
-        return Gate.call(command_id, param, method)
+    def call(cls, command_id: str, param: Any, method: str, traceparent: str = None) -> CommandResponse:
+        """
+        :param traceparent: 调用方的 W3C traceparent，通过消息队列等非HTTP方式调用时传入，使指令加入调用方的trace
+                            在已有trace的请求中调用时，自动作为当前trace的子span
+        """
+        with TRACER.start_trace(f"rpc {command_id}", traceparent, SPAN_KIND_SERVER,
+                                {"rpc.system": "lightcone", "rpc.method": method}):
+            return Gate.call(command_id, param, method)
@@ -7,6 +7,11 @@ from sanic import Request
 from lightcone.gate.base.gate import Gate
 from lightcone.utils import logging
 from lightcone.utils import params_dict_from_request
+from lightcone.utils.compression import StreamCompressor, stream_encoding
+from lightcone.utils.deadline import deadline_scope, request_timeout
+from lightcone.utils.log import log_scope
+from lightcone.utils.tracing import trace_request
+from lightcone.utils.recorder import RECORDER, KIND_STREAM
 
 STREAM_PARAM_KEY_COMMAND_ID = "command_id"
 STREAM_PARAM_KEY_METHOD = "method"
@@ -15,6 +20,7 @@ STREAM_PARAM_KEY_METHOD = "method"
 class StreamContext:
     def __init__(self, request):
         self._response = None
+        self._compressor = None
         self.request = request
 
     async def rebuild_response(self, status: int = None, headers=None):
@@ -38,33 +44,47 @@ class StreamContext:
         try:
             response = await self._build_response()
             event_message = f"data: {message}\n\n"
-            await response.send(event_message)
+            if self._compressor is not None:
+                # 每个事件单独刷新，客户端可以立即解压
+                await response.send(self._compressor.compress(event_message.encode("utf-8")))
+            else:
+                await response.send(event_message)
         except Exception as e:
             logging.warning(f"steam response发送消息异常：{e}")
 
     async def eof(self):
         try:
             response = await self._build_response()
+            if self._compressor is not None:
+                await response.send(self._compressor.finish())
             await response.eof()
         except Exception as e:
             logging.warning(f"steam response eof异常：{e}")
 
     async def _build_response(self):
         if self._response is None and self.request is not None:
-            self._response = await self.request.respond(content_type="text/event-stream;charset=UTF-8")
+            headers = None
+            encoding = stream_encoding(self.request)
+            if encoding is not None:
+                self._compressor = StreamCompressor(encoding)
+                headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+            self._response = await self.request.respond(content_type="text/event-stream;charset=UTF-8",
+                                                        headers=headers)
         return self._response
 
 
 async def stream_call_command(request: Request):
-    try:
-        stream_context = StreamContext(request)
-        await STREAM.call_from_request(request=request,
-                                       callback=stream_context.send_event_message,
-                                       header_call=stream_context.rebuild_response
-                                       )
-        await stream_context.eof()
-    except Exception as e:
-        logging.error(f"Error during calling streaming command : {e}")
+    with RECORDER.record(KIND_STREAM, request, STREAM_PARAM_KEY_COMMAND_ID, STREAM_PARAM_KEY_METHOD), \
+            log_scope(request_id=request.id), trace_request(request):
+        try:
+            stream_context = StreamContext(request)
+            await STREAM.call_from_request(request=request,
+                                           callback=stream_context.send_event_message,
+                                           header_call=stream_context.rebuild_response
+                                           )
+            await stream_context.eof()
+        except Exception as e:
+            logging.error(f"Error during calling streaming command : {e}")
 
 
 class ParamType(Enum):
@@ -80,4 +100,5 @@ class STREAM(Gate, ABC):
         command_id = param.pop(STREAM_PARAM_KEY_COMMAND_ID)
         method = param.pop(STREAM_PARAM_KEY_METHOD)
 
-        await cls.async_call(command_id, param, method, callback, header_call)
+        with deadline_scope(request_timeout(request), request):
+            await cls.async_call(command_id, param, method, callback, header_call)
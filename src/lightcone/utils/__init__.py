@@ -1,3 +1,7 @@
 from .jsonencoder import *
+from .msgpackencoder import dg_msgpack_dumps, dg_msgpack_loads, r_msgpack
 from .tools import *
-from .url import URL
+from .log import log_scope, LOG_WRITER
+from .tracing import TRACER, span, current_traceparent, inject_headers
+from .metrics import METRICS, metrics_handler
+from .url import URL, URLTemplate
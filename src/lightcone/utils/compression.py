@@ -0,0 +1,224 @@
+import asyncio
+import time
+import zlib
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.metrics import METRICS
+from lightcone.utils.tools import logging
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+PROJ = lazy_config("proj.ini")
+
+ENCODING_ZSTD = "zstd"
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+ENCODING_DEFLATE = "deflate"
+
+DEFAULT_MIN_SIZE = 1024  # 小于该字节数的响应不压缩
+DEFAULT_OFFLOAD_SIZE = 256 * 1024  # 不小于该字节数的响应放到线程池中压缩
+DEFAULT_LEVEL = 6
+
+# 值得压缩的响应类型
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+RATIO = METRICS.histogram("lightcone_compression_ratio", "压缩后与压缩前的字节数之比", ("encoding",),
+                          buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 1.0))
+BYTES_IN = METRICS.counter("lightcone_compression_in_bytes_total", "压缩前的字节数", ("encoding",))
+BYTES_OUT = METRICS.counter("lightcone_compression_out_bytes_total", "压缩后的字节数", ("encoding",))
+CPU_SECONDS = METRICS.counter("lightcone_compression_cpu_seconds_total", "压缩消耗的CPU时间（秒）", ("encoding",))
+
+
+def available_encodings() -> tuple:
+    """
+    按优先级排列的可用编码，zstd 和 br 只在安装了对应模块时可用
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append(ENCODING_ZSTD)
+    if brotli is not None:
+        encodings.append(ENCODING_BROTLI)
+    encodings.extend((ENCODING_GZIP, ENCODING_DEFLATE))
+    return tuple(encodings)
+
+
+_AVAILABLE = available_encodings()
+
+
+def negotiate(accept_encoding) -> str:
+    """
+    根据 Accept-Encoding 选择编码，没有可接受的编码时返回None
+    q 值相同时按服务端的优先级（zstd > br > gzip > deflate）选择
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    wildcard = accepted.get("*")
+    best = None
+    best_q = 0.0
+    for encoding in _AVAILABLE:
+        q = accepted.get(encoding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.lower()
+    return any(content_type.startswith(prefix) for prefix in _COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding, level=None) -> bytes:
+    level = _level() if level is None else level
+    started = time.thread_time()
+    if encoding == ENCODING_GZIP:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        result = compressor.compress(data) + compressor.flush()
+    elif encoding == ENCODING_DEFLATE:
+        result = zlib.compress(data, level)
+    elif encoding == ENCODING_ZSTD:
+        result = zstandard.ZstdCompressor(level=min(level, 19)).compress(data)
+    elif encoding == ENCODING_BROTLI:
+        result = brotli.compress(data, quality=min(level, 11))
+    else:
+        raise ValueError(f"不支持的编码：{encoding}")
+    _observe(encoding, len(data), len(result), time.thread_time() - started)
+    return result
+
+
+class StreamCompressor:
+    """
+    流式压缩，用于 SSE 等长连接，每次 compress 都在事件边界刷新，客户端能立即解压出完整的事件
+    """
+
+    def __init__(self, encoding, level=None):
+        self.encoding = encoding
+        level = _level() if level is None else level
+        if encoding == ENCODING_GZIP:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == ENCODING_DEFLATE:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 15)
+        elif encoding == ENCODING_ZSTD:
+            self._compressor = zstandard.ZstdCompressor(level=min(level, 19)).compressobj()
+        elif encoding == ENCODING_BROTLI:
+            self._compressor = brotli.Compressor(quality=min(level, 11))
+        else:
+            raise ValueError(f"不支持的编码：{encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        started = time.thread_time()
+        if self.encoding == ENCODING_BROTLI:
+            result = self._compressor.process(data) + self._compressor.flush()
+        elif self.encoding == ENCODING_ZSTD:
+            result = self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        else:
+            result = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        _observe(self.encoding, len(data), len(result), time.thread_time() - started)
+        return result
+
+    def finish(self) -> bytes:
+        if self.encoding == ENCODING_BROTLI:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def stream_encoding(request) -> str:
+    """
+    SSE 等流式响应使用的编码，未启用压缩时返回None
+    """
+    if not _enabled() or not _truthy(PROJ.get("compression.stream", True)):
+        return None
+    return negotiate(_header(request, "accept-encoding"))
+
+
+async def compression_middleware(request, response):
+    """
+    sanic 响应中间件，按 Accept-Encoding 压缩超过 compression.min_size 的文本类响应
+    超过 compression.offload_size 的响应在线程池中压缩，不阻塞事件循环
+    流式响应（没有body）和已经设置了 Content-Encoding 的响应不处理
+    """
+    try:
+        body = getattr(response, "body", None)
+        if not body or not _enabled() or response.headers.get("content-encoding"):
+            return
+        if len(body) < int(PROJ.get("compression.min_size", DEFAULT_MIN_SIZE)):
+            return
+        if not is_compressible(response.content_type):
+            return
+        encoding = negotiate(_header(request, "accept-encoding"))
+        if encoding is None:
+            return
+        if len(body) >= int(PROJ.get("compression.offload_size", DEFAULT_OFFLOAD_SIZE)):
+            compressed = await asyncio.to_thread(compress, body, encoding)
+        else:
+            compressed = compress(body, encoding)
+        if len(compressed) >= len(body):
+            return
+        response.body = compressed
+        etag = response.headers.get("etag")
+        if etag and etag.endswith('"') and not etag.startswith("W/"):
+            # 不同编码的响应内容不同，强 ETag 也要区分
+            response.headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+        response.headers["Content-Encoding"] = encoding
+        response.headers["Content-Length"] = str(len(compressed))
+        add_vary(response.headers)
+    except Exception as e:
+        logging.warning(f"压缩响应失败：{e}")
+
+
+def add_vary(headers):
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+
+
+def _observe(encoding, size_in, size_out, cpu_seconds):
+    BYTES_IN.inc((encoding,), size_in)
+    BYTES_OUT.inc((encoding,), size_out)
+    CPU_SECONDS.inc((encoding,), cpu_seconds)
+    if size_in:
+        RATIO.observe((encoding,), size_out / size_in)
+
+
+def _header(request, name):
+    headers = getattr(request, "headers", None)
+    return headers.get(name) if headers is not None else None
+
+
+def _enabled() -> bool:
+    return _truthy(PROJ.get("compression.enable", True))
+
+
+def _level() -> int:
+    return int(PROJ.get("compression.level", DEFAULT_LEVEL))
+
+
+def _truthy(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off", "")
+    return bool(value)
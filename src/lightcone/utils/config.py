@@ -0,0 +1,79 @@
+import json
+import threading
+
+from gramai.utils.config import Config
+
+_CONFIGS = {}
+_CONFIGS_LOCK = threading.Lock()
+
+
+class ConfigError(ValueError):
+    """
+    配置文件无法读取或内容不正确
+    """
+
+
+class LazyConfig:
+    """
+    延迟读取的配置，第一次访问时才读取文件，导入模块时不再依赖配置文件存在
+    同名配置在进程内共享一个实例
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._config = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def loaded(self) -> bool:
+        return self._config is not None
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def load(self) -> Config:
+        config = self._config
+        if config is None:
+            with self._lock:
+                if self._config is None:
+                    self._config = Config(self._name)
+                config = self._config
+        return config
+
+    def to_dict(self) -> dict:
+        """
+        读取JSON配置的全部内容，用于需要遍历配置项的场景（如启动时预加载全部指令）
+        Config 没有提供读取全部内容的接口，这里读取同名文件，再通过 Config.get 逐项核对，确保与 get 读到的是同一份配置
+        文件无法读取、不是JSON对象或与 Config 加载的内容不一致时抛出 ConfigError，不会返回空字典
+        """
+        config = self.load()
+        try:
+            with open(self._name, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"读取配置 {self._name} 失败：{e}") from e
+        if not isinstance(data, dict):
+            raise ConfigError(f"配置 {self._name} 的内容不是JSON对象")
+        for key, value in data.items():
+            # get 按 . 拆分key，含 . 的key无法核对
+            if "." not in key and config.get(key) != value:
+                raise ConfigError(f"配置 {self._name} 与 Config 加载的内容不一致：{key}")
+        return data
+
+    def __getattr__(self, item):
+        return getattr(self.load(), item)
+
+
+def lazy_config(name) -> LazyConfig:
+    config = _CONFIGS.get(name)
+    if config is None:
+        with _CONFIGS_LOCK:
+            config = _CONFIGS.get(name)
+            if config is None:
+                config = LazyConfig(name)
+                _CONFIGS[name] = config
+    return config
@@ -0,0 +1,114 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 客户端可以通过请求头声明愿意等待的秒数
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class DeadlineExceeded(Exception):
+    """
+    请求的截止时间已过，继续执行没有意义
+    """
+
+
+class Deadline:
+    """
+    请求的截止时间（time.monotonic），以及用于判断客户端是否已断开的request
+    """
+    __slots__ = ("at", "request")
+
+    def __init__(self, at=None, request=None):
+        self.at = at
+        self.request = request
+
+    def remaining(self):
+        if self.at is None:
+            return None
+        return self.at - time.monotonic()
+
+    def exceeded(self) -> bool:
+        if self.at is not None and time.monotonic() >= self.at:
+            return True
+        return _client_disconnected(self.request)
+
+
+_DEADLINE: ContextVar = ContextVar("lightcone_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds=None, request=None):
+    """
+    在当前上下文中设置截止时间，嵌套时取更早的截止时间，request 未指定时沿用外层的 request
+    上下文通过 contextvars 传递，asyncio 任务和 asyncio.to_thread 中同样可见
+    :param seconds: 剩余秒数，None 表示不限制
+    :param request: sanic request，用于判断客户端是否已断开
+    """
+    parent = _DEADLINE.get()
+    at = time.monotonic() + seconds if seconds is not None else None
+    if parent is not None:
+        if parent.at is not None and (at is None or parent.at < at):
+            at = parent.at
+        if request is None:
+            request = parent.request
+    token = _DEADLINE.set(Deadline(at, request))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def current_deadline():
+    return _DEADLINE.get()
+
+
+def remaining():
+    """
+    距离截止时间的秒数，没有截止时间时返回None，已超时返回值小于等于0
+    """
+    deadline = _DEADLINE.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def deadline_exceeded() -> bool:
+    """
+    截止时间已过或客户端已断开
+    """
+    deadline = _DEADLINE.get()
+    return deadline is not None and deadline.exceeded()
+
+
+def check_deadline():
+    """
+    截止时间已过时抛出 DeadlineExceeded，供长循环或逐条处理的代码调用
+    """
+    if deadline_exceeded():
+        raise DeadlineExceeded()
+
+
+def parse_timeout(value):
+    """
+    把配置或请求头中的秒数转换为float，无效值和非正数返回None
+    """
+    if value is None or value == "":
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds > 0 else None
+
+
+def request_timeout(request):
+    """
+    读取请求头中声明的超时秒数
+    """
+    headers = getattr(request, "headers", None)
+    if headers is None:
+        return None
+    return parse_timeout(headers.get(DEADLINE_HEADER))
+
+
+def _client_disconnected(request) -> bool:
+    conn_info = getattr(request, "conn_info", None) if request is not None else None
+    return bool(getattr(conn_info, "lost", False))
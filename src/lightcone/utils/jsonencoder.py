@@ -25,6 +25,18 @@ def dg_json_dumps(data, ensure_ascii=False):
     return json.dumps(data, default=encode, ensure_ascii=ensure_ascii)
 
 
+def dg_json_value(obj):
+    """
+    把单个值转换为 dg_json_dumps 的输出形式，供不经过 default 回调的场景（如行投影）提前转换
+    datetime -> 秒级时间戳，UUID -> hex，其余原样返回
+    """
+    if isinstance(obj, datetime):
+        return int(obj.timestamp())
+    elif isinstance(obj, uuid.UUID):
+        return obj.hex
+    return obj
+
+
 def dg_json_loads(string):
     """
     反序列化为对象
@@ -43,5 +55,5 @@ class DGJSONEncoder(json.JSONEncoder):
         return super().default(o)
 
 
-def r_json(body):
-    return sanic_json(body=body, dumps=dg_json_dumps)
+def r_json(body, headers=None, status=200):
+    return sanic_json(body=body, status=status, headers=headers, dumps=dg_json_dumps)
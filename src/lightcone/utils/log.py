@@ -0,0 +1,260 @@
+import logging as std_logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from sanic.log import logger as sanic_logger
+from sanic.logging.formatter import JSONFormatter, JSONAccessFormatter
+
+from lightcone.utils.config import lazy_config
+
+PROJ = lazy_config("proj.ini")
+
+DEFAULT_QUEUE_SIZE = 10000
+# 由后台线程写出的 sanic 日志
+ASYNC_LOGGERS = ("sanic.root", "sanic.error", "sanic.access", "sanic.server", "sanic.websockets")
+
+_FIELDS: ContextVar = ContextVar("lightcone_log_fields", default=None)
+# LogRecord 自带的属性，结构化字段不能与之重名
+_RESERVED = frozenset(std_logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+class LogScope:
+    """
+    log_scope 在当前上下文中记录的结构化字段，started 用于计算日志的 elapsed_ms
+    """
+    __slots__ = ("fields", "started")
+
+    def __init__(self, fields, started):
+        self.fields = fields
+        self.started = started
+
+
+@contextmanager
+def log_scope(**fields):
+    """
+    在当前上下文（请求、指令）中附加结构化字段，范围内的日志都会带上这些字段和距范围开始的耗时 elapsed_ms
+    嵌套使用时合并外层字段，耗时从最外层开始计算
+        with log_scope(request_id=request.id):
+            with log_scope(command_id=command_id):
+                logging.info("...")  # 日志带有 request_id、command_id、elapsed_ms 字段
+    """
+    parent = _FIELDS.get()
+    if parent is None:
+        scope = LogScope(fields, time.perf_counter())
+    else:
+        scope = LogScope({**parent.fields, **fields}, parent.started)
+    token = _FIELDS.set(scope)
+    try:
+        yield scope
+    finally:
+        _FIELDS.reset(token)
+
+
+class RateLimiter:
+    """
+    按日志key限制每秒写出的条数，被丢弃的条数在下一条写出的日志中以 suppressed 字段报告
+    每个key的上限读取 proj.ini 中 [log_rate] 的同名配置，未配置时使用 logging.rate_limit，0 表示不限制
+    """
+
+    def __init__(self):
+        self._limits = {}
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """
+        返回None表示丢弃，否则返回此前被丢弃的条数
+        """
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = int(PROJ.get(f"log_rate.{key}", PROJ.get("logging.rate_limit", 0)) or 0)
+            self._limits[key] = limit
+        if limit <= 0:
+            return 0
+        now = int(time.monotonic())
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or window[0] != now:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                return suppressed
+            if window[1] >= limit:
+                window[2] += 1
+                _count_dropped(key)
+                return None
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+            return suppressed
+
+
+class StructuredLogger:
+    """
+    lightcone 的日志入口，兼容原来 logging.info(f"...") 的用法，同时支持：
+        延迟格式化：logging.info("update: %s", query)，日志级别未开启时直接返回，参数在后台线程写出时才渲染
+        结构化字段：logging.info("指令完成", rows=12)，与 log_scope 中的字段合并后作为 record 的 extra，
+                   由 sanic 的 formatter 输出（JSON格式时为顶层字段）
+        限流：logging.info("...", key="model_update")，按 key 限制每秒写出的条数
+    """
+
+    def __init__(self, logger: std_logging.Logger):
+        self._logger = logger
+
+    def debug(self, msg, *args, **kwargs):
+        if self._logger.isEnabledFor(std_logging.DEBUG):
+            self._log(std_logging.DEBUG, msg, args, kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        if self._logger.isEnabledFor(std_logging.INFO):
+            self._log(std_logging.INFO, msg, args, kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        if self._logger.isEnabledFor(std_logging.WARNING):
+            self._log(std_logging.WARNING, msg, args, kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        if self._logger.isEnabledFor(std_logging.ERROR):
+            self._log(std_logging.ERROR, msg, args, kwargs)
+
+    def exception(self, msg, *args, **kwargs):
+        if self._logger.isEnabledFor(std_logging.ERROR):
+            kwargs.setdefault("exc_info", True)
+            self._log(std_logging.ERROR, msg, args, kwargs)
+
+    def critical(self, msg, *args, **kwargs):
+        if self._logger.isEnabledFor(std_logging.CRITICAL):
+            self._log(std_logging.CRITICAL, msg, args, kwargs)
+
+    def log(self, level, msg, *args, **kwargs):
+        if self._logger.isEnabledFor(level):
+            self._log(level, msg, args, kwargs)
+
+    def _log(self, level, msg, args, fields):
+        exc_info = fields.pop("exc_info", None)
+        stack_info = fields.pop("stack_info", False)
+        key = fields.pop("key", None)
+        if key is not None:
+            suppressed = RATE_LIMITER.allow(key)
+            if suppressed is None:
+                return
+            fields["log_key"] = key
+            if suppressed:
+                fields["suppressed"] = suppressed
+        scope = _FIELDS.get()
+        if scope is not None:
+            fields = {**scope.fields, **fields,
+                      "elapsed_ms": round((time.perf_counter() - scope.started) * 1000, 1)}
+        if fields:
+            fields = {(f"field_{name}" if name in _RESERVED else name): value for name, value in fields.items()}
+        self._logger._log(level, msg, args, exc_info=exc_info, stack_info=stack_info, stacklevel=3,  # noqa
+                          extra=fields or None)
+
+    def isEnabledFor(self, level) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def __getattr__(self, item):
+        # setLevel、handlers 等其他属性交给 sanic 的 logger
+        return getattr(self._logger, item)
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    标准 QueueHandler 在调用线程中格式化消息，这里直接把 record 放入队列，格式化留给后台线程
+    队列满时丢弃日志，不阻塞事件循环
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count_dropped("queue_full")
+
+
+class _DispatchHandler(std_logging.Handler):
+    """
+    后台线程中把日志交给其所属 logger 原来的 handler
+    """
+
+    def __init__(self, handlers):
+        super().__init__()
+        self._handlers = handlers
+
+    def handle(self, record):
+        for handler in self._handlers.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+
+class AsyncLogWriter:
+    """
+    把 sanic 各个 logger 的 handler 移到后台线程：请求处理中只把 record 放入队列，格式化和写出在后台线程完成
+    """
+
+    def __init__(self):
+        self._listener = None
+        self._original = {}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    def start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            handlers = {}
+            records = queue.Queue(int(PROJ.get("logging.queue_size", DEFAULT_QUEUE_SIZE)))
+            queue_handler = _LazyQueueHandler(records)
+            json_format = str(PROJ.get("logging.format", "")).lower() == "json"
+            for name in ASYNC_LOGGERS:
+                logger = std_logging.getLogger(name)
+                if not logger.handlers:
+                    continue
+                self._original[name] = list(logger.handlers)
+                handlers[name] = list(logger.handlers)
+                if json_format:
+                    formatter = JSONAccessFormatter() if name == "sanic.access" else JSONFormatter()
+                    for handler in handlers[name]:
+                        handler.setFormatter(formatter)
+                for handler in self._original[name]:
+                    logger.removeHandler(handler)
+                logger.addHandler(queue_handler)
+            self._listener = QueueListener(records, _DispatchHandler(handlers))
+            self._listener.start()
+
+    def stop(self):
+        """
+        写出队列中剩余的日志，恢复原来的 handler
+        """
+        with self._lock:
+            if self._listener is None:
+                return
+            for name, handlers in self._original.items():
+                logger = std_logging.getLogger(name)
+                for handler in list(logger.handlers):
+                    if isinstance(handler, _LazyQueueHandler):
+                        logger.removeHandler(handler)
+                for handler in handlers:
+                    logger.addHandler(handler)
+            self._original = {}
+            self._listener.stop()
+            self._listener = None
+
+
+def _count_dropped(key):
+    from lightcone.utils.metrics import METRICS
+    METRICS.counter("lightcone_log_dropped_total", "被限流或队列已满而丢弃的日志条数", ("key",)).inc((key,))
+
+
+RATE_LIMITER = RateLimiter()
+LOG_WRITER = AsyncLogWriter()
+# 全局日志入口，通过 lightcone.utils.tools.logging 使用
+LOGGER = StructuredLogger(sanic_logger)
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from lightcone.utils import metrics
+from lightcone.utils.config import lazy_config
+from lightcone.utils.metrics import METRICS
+from lightcone.utils.tools import logging
+
+PROJ = lazy_config("proj.ini")
+
+# 默认配置，可通过 proj.ini 的 [memory] 段覆盖
+DEFAULT_SAMPLE_RATE = 100  # 每 N 次调用采样一次
+DEFAULT_TOP_SITES = 10  # 每次采样记录的分配位置数量
+DEFAULT_FRAMES = 1  # tracemalloc 记录的调用栈深度
+DEFAULT_LEAK_DELAY = 30  # 采样结束多久后检查分配是否仍然存活（秒）
+MAX_SITES_PER_TARGET = 50  # 每个指令最多记录的分配位置数量，防止标签无限增长
+
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600, 1073741824)
+
+NET_BYTES = METRICS.histogram("lightcone_memory_net_bytes", "采样调用结束时净增的内存（字节）",
+                              ("kind", "name"), buckets=BYTES_BUCKETS)
+PEAK_BYTES = METRICS.histogram("lightcone_memory_peak_bytes", "采样调用期间的峰值内存增量（字节）",
+                               ("kind", "name"), buckets=BYTES_BUCKETS)
+SITE_BYTES = METRICS.counter("lightcone_memory_site_bytes_total", "采样调用中按分配位置累计的净增内存（字节）",
+                             ("kind", "name", "site"))
+LEAK_SUSPECT_BYTES = METRICS.gauge("lightcone_memory_leak_suspect_bytes",
+                                   "采样调用结束一段时间后仍然存活的分配（字节）", ("kind", "name", "site"))
+
+# 排除 tracemalloc 和统计本身产生的分配
+_SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                     tracemalloc.Filter(False, __file__),
+                     tracemalloc.Filter(False, metrics.__file__),
+                     tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                     tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                     tracemalloc.Filter(False, "<unknown>"))
+
+
+class MemoryAccounting:
+    """
+    基于 tracemalloc 的按指令内存统计，默认关闭，proj.ini 中 memory.enable = true 开启
+    每 sample_rate 次调用采样一次，记录净增/峰值内存，以及净增最多的分配位置
+    采样结束 leak_delay 秒后再次快照，仍然存活的增长记为泄漏嫌疑
+    tracemalloc 只在采样期间开启：采样开始时启动，泄漏检查完成后停止（leak_delay = 0 时采样结束即停止），
+    泄漏检查完成前不会开始新的采样；enable(keep_tracing=True) 或进程启动前已开启 tracemalloc 时保持开启
+    快照的比较和泄漏检查在后台线程中进行，请求中只有结束时的一次快照
+    同一事件循环上并发执行的调用会互相影响统计结果，采样率越低越准确
+    """
+
+    def __init__(self):
+        self._enabled = None
+        self._sample_rate = DEFAULT_SAMPLE_RATE
+        self._top_sites = DEFAULT_TOP_SITES
+        self._frames = DEFAULT_FRAMES
+        self._leak_delay = DEFAULT_LEAK_DELAY
+        self._keep_tracing = False
+        self._counter = 0
+        self._sampling = False
+        self._lock = threading.Lock()
+        self._leak_check = threading.Event()
+        self._sites = {}
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._load_config()
+        return self._enabled
+
+    def enable(self, sample_rate=None, top_sites=None, frames=None, leak_delay=None, keep_tracing=False):
+        """
+        运行时开启统计，keep_tracing=True 时 tracemalloc 在采样之间也保持开启（所有分配都会被追踪，开销较大）
+        """
+        if self._enabled is None:
+            self._load_config()
+        self._sample_rate = max(1, int(sample_rate or self._sample_rate))
+        self._top_sites = int(top_sites or self._top_sites)
+        self._frames = int(frames or self._frames)
+        self._leak_delay = float(leak_delay if leak_delay is not None else self._leak_delay)
+        self._keep_tracing = keep_tracing
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+        self._keep_tracing = False
+        # 等待中的泄漏检查立即执行，完成后停止 tracemalloc
+        self._leak_check.set()
+        if not self._sampling and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def track(self, kind, name):
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            self._counter += 1
+            # 同一时间只采样一个调用（包括等待泄漏检查的），避免 reset_peak 互相干扰
+            sampled = self._counter % self._sample_rate == 0 and not self._sampling
+            if sampled:
+                self._sampling = True
+        if not sampled:
+            yield
+            return
+
+        try:
+            if tracemalloc.is_tracing():
+                # tracemalloc 在采样前已开启，已有的分配需要通过开始时的快照排除
+                start_snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+                owned = False
+            else:
+                # 采样开始时才启动，之后的所有分配都发生在采样开始之后，不需要开始时的快照
+                tracemalloc.start(self._frames)
+                start_snapshot = None
+                owned = not self._keep_tracing
+            current_before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        except Exception as e:
+            logging.warning(f"内存采样开始失败：{e}")
+            self._sampling = False
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            try:
+                current_after, peak = tracemalloc.get_traced_memory()
+                end_snapshot = tracemalloc.take_snapshot()
+                NET_BYTES.observe((kind, name), current_after - current_before)
+                PEAK_BYTES.observe((kind, name), max(0, peak - current_before))
+                self._leak_check.clear()
+                threading.Thread(target=self._analyze,
+                                 args=(kind, name, start_snapshot, end_snapshot, owned),
+                                 name="memory-accounting", daemon=True).start()
+            except Exception as e:
+                logging.warning(f"内存采样记录失败：{e}")
+                self._finish_sample(owned)
+
+    def check_leaks(self, force=False):
+        """
+        force=True 时不再等待 leak_delay，立即执行等待中的泄漏检查
+        """
+        if force:
+            self._leak_check.set()
+
+    def _analyze(self, kind, name, start_snapshot, end_snapshot, owned):
+        try:
+            end_snapshot = end_snapshot.filter_traces(_SNAPSHOT_FILTERS)
+            known_sites = self._sites.setdefault((kind, name), set())
+            sites = set()
+            for stat in _compare(end_snapshot, start_snapshot)[:self._top_sites]:
+                if stat.size_diff <= 0:
+                    continue
+                site = _site_name(stat.traceback)
+                if site not in known_sites and len(known_sites) >= MAX_SITES_PER_TARGET:
+                    continue
+                known_sites.add(site)
+                sites.add(site)
+                SITE_BYTES.inc((kind, name, site), stat.size_diff)
+            del end_snapshot
+
+            if sites and self._leak_delay > 0 and tracemalloc.is_tracing():
+                self._leak_check.wait(self._leak_delay)
+                if tracemalloc.is_tracing():
+                    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+                    for stat in _compare(snapshot, start_snapshot):
+                        site = _site_name(stat.traceback)
+                        if site in sites:
+                            LEAK_SUSPECT_BYTES.set((kind, name, site), max(0, stat.size_diff))
+        except Exception as e:
+            logging.warning(f"内存采样分析失败：{e}")
+        finally:
+            self._finish_sample(owned)
+
+    def _finish_sample(self, owned):
+        if owned and not self._keep_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._sampling = False
+
+    def _load_config(self):
+        enabled = PROJ.get("memory.enable", False)
+        self._enabled = enabled is True or str(enabled).lower() in ("1", "true", "yes", "on")
+        self._sample_rate = max(1, int(PROJ.get("memory.sample_rate", DEFAULT_SAMPLE_RATE)))
+        self._top_sites = int(PROJ.get("memory.top_sites", DEFAULT_TOP_SITES))
+        self._frames = int(PROJ.get("memory.frames", DEFAULT_FRAMES))
+        self._leak_delay = float(PROJ.get("memory.leak_delay", DEFAULT_LEAK_DELAY))
+
+
+def _compare(snapshot, start_snapshot):
+    """
+    没有开始时的快照时（采样开始才启动 tracemalloc），快照中的全部分配都是采样开始后的增长
+    """
+    if start_snapshot is None:
+        start_snapshot = tracemalloc.Snapshot((), snapshot.traceback_limit)
+    return snapshot.compare_to(start_snapshot, "lineno")
+
+
+def _site_name(traceback) -> str:
+    frame = traceback[0]
+    parent, file_name = os.path.split(frame.filename)
+    return f"{os.path.basename(parent)}/{file_name}:{frame.lineno}"
+
+
+# 全局内存统计
+MEMORY = MemoryAccounting()
@@ -0,0 +1,354 @@
+import bisect
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+
+from sanic.request import Request
+from sanic.response import text
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.tools import logging, private_directory
+
+PROJ = lazy_config("proj.ini")
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 允许访问指标接口的地址
+LOCAL_ADDRESSES = ("127.0.0.1", "::1", "localhost")
+# 经过反向代理转发的请求带有的请求头，这类请求即使来自本机也不视为本机访问
+FORWARDED_HEADERS = ("forwarded", "x-forwarded-for", "x-real-ip")
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """
+    指标基类，samples 以标签值元组为key
+    只在单个进程内累加，跨进程汇总由 MetricsRegistry 通过快照文件完成
+    指标会在执行通道、to_thread 等线程中更新，所有读写都在 _lock 内进行
+    """
+    type_name = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[list(labels), self._copy_value(value)] for labels, value in self._samples.items()]
+        return {"type": self.type_name,
+                "doc": self.documentation,
+                "labelnames": list(self.labelnames),
+                "samples": samples,
+                }
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    @staticmethod
+    def _copy_value(value):
+        return value
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._samples[labels] = self._samples.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._samples[labels] = self._samples.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        with self._lock:
+            self._samples[labels] = self._samples.get(labels, 0) - amount
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._samples[labels] = value
+
+
+class Histogram(Metric):
+    """
+    固定分桶的直方图，每个样本为 [各桶计数, 总和, 总数]，桶计数不累积，输出时再累积
+    """
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels=(), value=0.0):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._samples.get(labels)
+            if sample is None:
+                sample = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._samples[labels] = sample
+            sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+    @staticmethod
+    def _copy_value(value):
+        return [list(value[0]), value[1], value[2]]
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表
+    每个worker进程由后台线程定期把快照写入共享目录（{metrics.dir}/{pid}.json），
+    任一worker响应指标请求时，合并自身实时数据与其他worker的快照，实现跨进程汇总
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._exporter_pid = None
+        self._directory = None
+        self._interval = None
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        """
+        注册采集函数，在每次生成快照前调用，用于把队列长度等瞬时值写入Gauge
+        """
+        if callable(collector) and collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logging.warning(f"指标采集异常：{e}")
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def ensure_exporter(self):
+        """
+        确保当前进程的快照导出线程已启动，fork后的子进程会按pid重新启动
+        """
+        pid = os.getpid()
+        if self._exporter_pid == pid:
+            return
+        with self._lock:
+            if self._exporter_pid == pid:
+                return
+            self._exporter_pid = pid
+            thread = threading.Thread(target=self._export_loop, name="metrics-exporter", daemon=True)
+            thread.start()
+
+    def dump(self):
+        directory = self.directory
+        private_directory(directory)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        temp_path = f"{path}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+
+    def collect(self) -> list:
+        """
+        返回当前进程的实时快照与其他存活worker的快照，已退出进程的快照文件会被清理
+        """
+        snapshots = [self.snapshot()]
+        directory = self.directory
+        if not os.path.isdir(directory):
+            return snapshots
+        try:
+            # 只读取当前用户私有目录中的快照
+            private_directory(directory)
+        except PermissionError as e:
+            logging.warning(f"忽略指标快照目录：{e}")
+            return snapshots
+        current_pid = os.getpid()
+        for file_name in os.listdir(directory):
+            if not file_name.endswith(".json"):
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                pid = int(file_name[:-5])
+            except ValueError:
+                continue
+            if pid == current_pid:
+                continue
+            if not _pid_alive(pid):
+                _remove_quietly(path)
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except Exception as e:
+                logging.warning(f"读取指标快照 {path} 失败：{e}")
+        return snapshots
+
+    def render(self) -> str:
+        return render_prometheus(merge_snapshots(self.collect()))
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            # 默认按用户和主进程（worker的父进程）区分目录，避免同一主机上的多个应用互相干扰
+            default = os.path.join(tempfile.gettempdir(), f"lightcone-metrics-{os.getuid()}-{os.getppid()}")
+            self._directory = PROJ.get("metrics.dir", default) or default
+        return self._directory
+
+    @property
+    def interval(self) -> float:
+        if self._interval is None:
+            self._interval = float(PROJ.get("metrics.interval", 5) or 5)
+        return self._interval
+
+    def _register(self, metric_class, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = metric_class(name, documentation, labelnames, **kwargs)
+                    self._metrics[name] = metric
+        return metric
+
+    def _export_loop(self):
+        pid = os.getpid()
+        while self._exporter_pid == pid:
+            try:
+                self.dump()
+            except Exception as e:
+                logging.warning(f"导出指标快照失败：{e}")
+            time.sleep(self.interval)
+
+
+def merge_snapshots(snapshots) -> dict:
+    """
+    合并多个进程的快照：counter、gauge按标签求和，histogram按桶求和
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, data in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                target = {key: value for key, value in data.items() if key != "samples"}
+                target["samples"] = {}
+                merged[name] = target
+            samples = target["samples"]
+            for labels, value in data.get("samples", []):
+                key = tuple(labels)
+                current = samples.get(key)
+                if data.get("type") == Histogram.type_name:
+                    if current is None:
+                        samples[key] = [list(value[0]), value[1], value[2]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                else:
+                    samples[key] = (current or 0) + value
+    return merged
+
+
+def render_prometheus(merged) -> str:
+    lines = []
+    for name in sorted(merged):
+        data = merged[name]
+        labelnames = data.get("labelnames", [])
+        lines.append(f"# HELP {name} {data.get('doc', '')}")
+        lines.append(f"# TYPE {name} {data.get('type')}")
+        for labels, value in sorted(data["samples"].items()):
+            pairs = list(zip(labelnames, labels))
+            if data.get("type") == Histogram.type_name:
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(data["buckets"]) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {total}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(pairs)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_handler(request: Request):
+    """
+    以Prometheus文本格式输出全部worker汇总后的指标
+    app.add_route(metrics_handler, "/metrics")
+    访问控制（默认拒绝所有请求）：
+        proj.ini 中配置 metrics.token 后，请求需要带 Authorization: Bearer {token}
+        未配置 token 时，metrics.allow_local = true 允许本机直接访问，经过反向代理转发（带 X-Forwarded-For 等请求头）的请求仍被拒绝
+    """
+    if not metrics_allowed(request):
+        return text("Forbidden", status=403)
+    return text(METRICS.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def metrics_allowed(request: Request) -> bool:
+    token = PROJ.get("metrics.token")
+    if token:
+        authorization = request.headers.get("authorization", "")
+        scheme, _, value = authorization.partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(value.strip().encode(), str(token).encode())
+    allow_local = PROJ.get("metrics.allow_local", False)
+    if not (allow_local is True or str(allow_local).lower() in ("1", "true", "yes", "on")):
+        return False
+    if any(request.headers.get(name) for name in FORWARDED_HEADERS):
+        return False
+    return request.ip in LOCAL_ADDRESSES
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = []
+    for key, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# 全局指标注册表
+METRICS = MetricsRegistry()
@@ -0,0 +1,107 @@
+import uuid
+from datetime import datetime
+
+from sanic.response import HTTPResponse
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+# 客户端可能使用的 MessagePack 媒体类型
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+# UUID 使用的扩展类型，内容为16字节的 UUID；时间使用 MessagePack 标准的 Timestamp 扩展（-1）
+EXT_UUID = 1
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def dg_msgpack_dumps(data) -> bytes:
+    """
+    序列化为 MessagePack
+    与 dg_json_dumps 的约定一致：datetime 为秒级时间戳，但以 Timestamp 扩展类型传递；UUID 以扩展类型 EXT_UUID 传递
+    """
+    return msgpack.packb(data, default=_encode, use_bin_type=True, datetime=False)
+
+
+def dg_msgpack_loads(data: bytes):
+    """
+    反序列化 MessagePack，扩展类型还原为与JSON请求相同的形式：Timestamp -> 秒级时间戳，EXT_UUID -> hex
+    指令无需区分参数来自JSON还是MessagePack
+    """
+    return msgpack.unpackb(data, raw=False, strict_map_key=False, timestamp=0, ext_hook=_decode_ext,
+                           object_hook=_decode_dict, list_hook=_decode_list)
+
+
+def is_msgpack(content_type) -> bool:
+    if not content_type or msgpack is None:
+        return False
+    return content_type.split(";", 1)[0].strip().lower() in MSGPACK_CONTENT_TYPES
+
+
+def accepts_msgpack(request) -> bool:
+    """
+    Accept 中明确列出 MessagePack，且优先级不低于JSON时返回True；默认仍然返回JSON
+    """
+    if msgpack is None:
+        return False
+    headers = getattr(request, "headers", None)
+    accept = headers.get("accept") if headers is not None else None
+    if not accept or "msgpack" not in accept:
+        return False
+    msgpack_q = 0.0
+    json_q = 0.0
+    for item in accept.split(","):
+        media_type, _, params = item.strip().partition(";")
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in MSGPACK_CONTENT_TYPES:
+            msgpack_q = max(msgpack_q, q)
+        elif media_type in ("application/json", "application/*", "*/*"):
+            json_q = max(json_q, q)
+    return msgpack_q > 0 and msgpack_q >= json_q
+
+
+def r_msgpack(body, headers=None, status=200):
+    return HTTPResponse(dg_msgpack_dumps(body), status=status, headers=headers, content_type=MSGPACK_CONTENT_TYPE)
+
+
+def _encode(obj):
+    if isinstance(obj, datetime):
+        return msgpack.Timestamp(int(obj.timestamp()))
+    elif isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, obj.bytes)
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def _decode_ext(code, data):
+    if code == EXT_UUID and len(data) == 16:
+        return uuid.UUID(bytes=data).hex
+    return msgpack.ExtType(code, data)
+
+
+def _decode_value(value):
+    if isinstance(value, msgpack.Timestamp):
+        return value.seconds
+    return value
+
+
+def _decode_dict(obj):
+    for key, value in obj.items():
+        if isinstance(value, msgpack.Timestamp):
+            obj[key] = value.seconds
+    return obj
+
+
+def _decode_list(obj):
+    return [_decode_value(value) for value in obj]
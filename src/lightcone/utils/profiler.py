@@ -0,0 +1,342 @@
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from sanic.request import Request
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.jsonencoder import r_json
+from lightcone.utils.tools import logging, params_dict_from_request, private_directory
+
+PROJ = lazy_config("proj.ini")
+
+# 剖析对象类型
+KIND_COMMAND = "command"
+KIND_ACTION = "action"
+
+CONTROL_FILE_NAME = "control.json"
+CONTROL_CHECK_INTERVAL = 1.0  # 各worker检查控制文件的间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005  # 调用栈采样间隔（秒）
+DEFAULT_SECONDS = 60  # 未指定请求数和时长时的默认剖析时长（秒）
+LOCAL_ADDRESSES = ("127.0.0.1", "::1", "localhost")
+
+# 当前线程是否已有 cProfile 在运行（同一线程只能有一个生效）
+_thread_state = threading.local()
+
+
+class ProfileSession:
+    """
+    一次剖析会话：对指定的 command_id 或 action，在接下来的 requests 次调用或 until 之前进行剖析
+    每次调用通过 cProfile 记录函数耗时，同时由采样线程记录调用栈
+    会话结束时把汇总结果写入目录：
+        {kind}-{name}-{session_id}-{pid}.pstats       可用 pstats / snakeviz 查看
+        {kind}-{name}-{session_id}-{pid}.collapsed    折叠调用栈，可用 flamegraph.pl / speedscope 生成火焰图
+    异步调用（loop_wide）在 await 期间事件循环会执行其他协程，cProfile 和栈采样无法区分，
+    这部分结果单独写入 {kind}-{name}-{session_id}-{pid}-loop.* ，内容为剖析期间整个事件循环的耗时
+    """
+
+    def __init__(self, session_id, kind, name, requests=None, until=None,
+                 sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        self.session_id = session_id
+        self.kind = kind
+        self.name = name
+        self.requests = requests
+        self.until = until
+        self._sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._started = 0
+        self._stats = {False: None, True: None}
+        self._stacks = {False: {}, True: {}}
+        self._active_threads = {}
+        self._loop_threads = {}
+        self._sampler = None
+        self._finished = False
+
+    @property
+    def expired(self) -> bool:
+        if self.until is not None and time.time() >= self.until:
+            return True
+        return self.requests is not None and self._started >= self.requests
+
+    def acquire(self, loop_wide=False) -> bool:
+        with self._lock:
+            if self._finished or self.expired:
+                return False
+            self._started += 1
+            thread_id = threading.get_ident()
+            self._active_threads[thread_id] = self._active_threads.get(thread_id, 0) + 1
+            if loop_wide:
+                self._loop_threads[thread_id] = self._loop_threads.get(thread_id, 0) + 1
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+        return True
+
+    def release(self, profile, loop_wide=False):
+        with self._lock:
+            thread_id = threading.get_ident()
+            _decrease(self._active_threads, thread_id)
+            if loop_wide:
+                _decrease(self._loop_threads, thread_id)
+            if profile is not None:
+                if self._stats[loop_wide] is None:
+                    self._stats[loop_wide] = pstats.Stats(profile)
+                else:
+                    self._stats[loop_wide].add(profile)
+
+    def finish(self, directory):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+            results = [(loop_wide, self._stats[loop_wide], dict(self._stacks[loop_wide]))
+                       for loop_wide in (False, True)]
+        base = os.path.join(directory, f"{self.kind}-{_safe_name(self.name)}-{self.session_id}-{os.getpid()}")
+        for loop_wide, stats, stacks in results:
+            if stats is None and not stacks:
+                continue
+            path = f"{base}-loop" if loop_wide else base
+            try:
+                private_directory(directory)
+                if stats is not None:
+                    # 与 pstats.Stats.dump_stats 相同的格式
+                    with _open_private(f"{path}.pstats", "wb") as f:
+                        marshal.dump(stats.stats, f)
+                with _open_private(f"{path}.collapsed", "w") as f:
+                    for stack, count in sorted(stacks.items()):
+                        f.write(f"{stack} {count}\n")
+                scope = "，包含同一事件循环中的其他协程" if loop_wide else ""
+                logging.info(f"剖析结果已写入：{path}.*（{self._started} 次调用{scope}）")
+            except Exception as e:
+                logging.error(f"写入剖析结果失败：{e}")
+
+    def _sample_loop(self):
+        while not self._finished:
+            time.sleep(self._sample_interval)
+            with self._lock:
+                thread_ids = [(thread_id, thread_id in self._loop_threads) for thread_id in self._active_threads]
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()  # noqa
+            samples = []
+            for thread_id, loop_wide in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples.append((loop_wide, _collapse(frame)))
+            del frames
+            with self._lock:
+                for loop_wide, stack in samples:
+                    stacks = self._stacks[loop_wide]
+                    stacks[stack] = stacks.get(stack, 0) + 1
+
+
+class Profiler:
+    """
+    按需剖析的控制器
+    start/stop 写入共享目录中的控制文件，各worker每秒最多检查一次，实现多进程同时开启/关闭
+    未开启任何会话时，profile() 只有一次字典查找和一次时间比较的开销
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._finished_ids = set()
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._control_mtime = None
+        self._directory = None
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            default = os.path.join(tempfile.gettempdir(), f"lightcone-profiles-{os.getuid()}")
+            self._directory = PROJ.get("profiler.dir", default) or default
+        return self._directory
+
+    def start(self, kind, name, requests=None, seconds=None) -> dict:
+        """
+        开启剖析：接下来 requests 次调用，或 seconds 秒内的调用；都未指定时默认剖析 60 秒
+        每个worker各自计数
+        """
+        if requests is None and seconds is None:
+            seconds = DEFAULT_SECONDS
+        session = {"id": uuid.uuid4().hex[:12],
+                   "kind": kind,
+                   "name": name,
+                   "requests": int(requests) if requests is not None else None,
+                   "until": time.time() + float(seconds) if seconds is not None else None,
+                   }
+        control = self._read_control()
+        control = [item for item in control if not (item["kind"] == kind and item["name"] == name)]
+        control.append(session)
+        self._write_control(control)
+        self._reload(force=True)
+        return session
+
+    def stop(self, kind, name):
+        control = [item for item in self._read_control() if not (item["kind"] == kind and item["name"] == name)]
+        self._write_control(control)
+        self._reload(force=True)
+
+    def sessions(self) -> list:
+        return self._read_control()
+
+    @contextmanager
+    def profile(self, kind, name, loop_wide=False):
+        """
+        剖析 with 语句范围内的调用
+        范围内有 await 时（异步指令、异步Action）需要传 loop_wide=True，结果会与同步调用分开保存并标明为事件循环范围
+        """
+        session = self._active_session(kind, name)
+        if session is None or not session.acquire(loop_wide):
+            yield
+            return
+
+        profile = None
+        if not getattr(_thread_state, "profiling", False):
+            # 同一线程（如事件循环）上并发的调用只启用一个 cProfile，其余只做栈采样
+            profile = cProfile.Profile()
+            _thread_state.profiling = True
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                _thread_state.profiling = False
+            session.release(profile, loop_wide)
+            if session.expired:
+                self._finish(kind, name, session)
+
+    def _active_session(self, kind, name):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + CONTROL_CHECK_INTERVAL
+            self._reload()
+        if not self._sessions:
+            return None
+        return self._sessions.get((kind, name))
+
+    def _reload(self, force=False):
+        path = os.path.join(self.directory, CONTROL_FILE_NAME)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        expired = [(key, session) for key, session in list(self._sessions.items()) if session.expired]
+        for key, session in expired:
+            self._finish(key[0], key[1], session)
+        if not force and mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+
+        control = {(item["kind"], item["name"]): item for item in self._read_control()}
+        with self._lock:
+            sessions = dict(self._sessions)
+        for key, session in sessions.items():
+            item = control.get(key)
+            if item is None or item["id"] != session.session_id:
+                self._finish(key[0], key[1], session)
+        for key, item in control.items():
+            current = self._sessions.get(key)
+            if item["id"] in self._finished_ids or (current is not None and current.session_id == item["id"]):
+                continue
+            session = ProfileSession(item["id"], item["kind"], item["name"], item.get("requests"), item.get("until"))
+            if not session.expired:
+                with self._lock:
+                    self._sessions[key] = session
+
+    def _finish(self, kind, name, session):
+        with self._lock:
+            if self._sessions.get((kind, name)) is session:
+                self._sessions.pop((kind, name))
+            self._finished_ids.add(session.session_id)
+        session.finish(self.directory)
+
+    def _read_control(self) -> list:
+        path = os.path.join(self.directory, CONTROL_FILE_NAME)
+        try:
+            # 控制文件决定是否开启剖析，只读取当前用户私有目录中的文件
+            private_directory(self.directory)
+            with os.fdopen(os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))) as f:
+                control = json.load(f)
+        except (OSError, ValueError):
+            return []
+        now = time.time()
+        return [item for item in control if item.get("until") is None or item["until"] > now]
+
+    def _write_control(self, control):
+        private_directory(self.directory)
+        path = os.path.join(self.directory, CONTROL_FILE_NAME)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with _open_private(temp_path, "w") as f:
+            json.dump(control, f)
+        os.replace(temp_path, path)
+
+
+async def profiler_handler(request: Request):
+    """
+    剖析控制接口，只允许本机访问
+        开启：?op=start&kind=command&name=user.list&requests=100 （或 seconds=30）
+        关闭：?op=stop&kind=command&name=user.list
+        查询：?op=list
+    app.add_route(profiler_handler, "/admin/profiler", methods=["GET", "POST"])
+    """
+    if request.ip not in LOCAL_ADDRESSES:
+        return r_json({"code": 403, "success": False, "message": "Forbidden", "result": None})
+    params = params_dict_from_request(request)
+    op = params.get("op", "list")
+    kind = params.get("kind", KIND_COMMAND)
+    name = params.get("name")
+    if op in ("start", "stop") and (kind not in (KIND_COMMAND, KIND_ACTION) or not name):
+        return r_json({"code": 400, "success": False, "message": "kind或name参数错误", "result": None})
+    try:
+        if op == "start":
+            result = PROFILER.start(kind, name, params.get("requests"), params.get("seconds"))
+        elif op == "stop":
+            PROFILER.stop(kind, name)
+            result = None
+        else:
+            result = PROFILER.sessions()
+    except Exception as e:
+        logging.error(f"剖析控制失败：{e}")
+        return r_json({"code": 500, "success": False, "message": str(e), "result": None})
+    return r_json({"code": 200, "success": True, "message": PROFILER.directory, "result": result})
+
+
+def _decrease(counts, key):
+    count = counts.get(key, 0) - 1
+    if count > 0:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _safe_name(name) -> str:
+    return "".join(c if c.isalnum() or c in "._-" else "_" for c in str(name))
+
+
+def _open_private(path, mode):
+    # 不跟随符号链接，文件只允许当前用户读写
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    return os.fdopen(fd, mode)
+
+
+# 全局剖析控制器
+PROFILER = Profiler()
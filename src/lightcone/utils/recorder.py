@@ -0,0 +1,247 @@
+import atexit
+import base64
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode
+
+from gramai.utils import is_bytes, is_dict, nest_dict, to_string
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.jsonencoder import dg_json_dumps, dg_json_loads
+from lightcone.utils.msgpackencoder import is_msgpack, dg_msgpack_dumps, dg_msgpack_loads
+from lightcone.utils.tools import logging, private_directory
+
+PROJ = lazy_config("proj.ini")
+
+# 记录的请求类型
+KIND_REST = "rest"
+KIND_STREAM = "stream"
+KIND_ACTION = "action"
+
+DEFAULT_SAMPLE_RATE = 1.0  # 采样比例，0~1
+DEFAULT_MAX_BODY = 65536  # 单条记录保存的最大请求体长度，超出的请求只记录元信息，回放时跳过
+BUFFER_SIZE = 65536  # 写文件的缓冲大小
+FLUSH_INTERVAL = 1.0  # 缓冲写入文件的最长间隔（秒）
+# 默认脱敏的参数名，可通过 recorder.redact 配置（逗号分隔）
+DEFAULT_REDACT = "password,passwd,pwd,token,access_token,refresh_token,secret,authorization"
+REDACTED = "***"
+
+
+class TrafficRecorder:
+    """
+    请求录制，默认关闭，proj.ini 中 recorder.enable = true 开启
+    按 recorder.sample_rate 比例采样，每个worker写入各自的文件 {recorder.dir}/traffic-{pid}.jsonl
+    每行一条记录：
+        ts:     请求开始时间（秒）
+        kind:   rest / stream / action
+        path:   请求路径
+        http:   HTTP方法
+        qs:     query string
+        ct:     Content-Type
+        body:   请求体，文本请求体原样保存，二进制请求体（MessagePack、multipart 等）以 base64 保存
+        b64:    body 为 base64 时为 true
+        id:     command_id 或 action 名称
+        method: 指令的 method 参数
+        ms:     处理耗时（毫秒）
+    记录文件可以用 python -m lightcone.utils.replay 回放
+    请求中可能有密码、令牌，目录以 0700、文件以 0600 权限创建；
+    query string 以及 JSON、MessagePack、urlencoded 请求体中名称在 recorder.redact 中的参数（含嵌套）替换为 ***，
+    multipart 等其他格式的请求体不做脱敏，原样保存
+    """
+
+    def __init__(self):
+        self._enabled = None
+        self._sample_rate = DEFAULT_SAMPLE_RATE
+        self._max_body = DEFAULT_MAX_BODY
+        self._redact = frozenset(DEFAULT_REDACT.split(","))
+        self._directory = None
+        self._file = None
+        self._pid = None
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._load_config()
+        return self._enabled
+
+    def enable(self, sample_rate=None, directory=None):
+        if self._enabled is None:
+            self._load_config()
+        if sample_rate is not None:
+            self._sample_rate = float(sample_rate)
+        if directory is not None:
+            self.close()
+            self._directory = directory
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+        self.close()
+
+    @contextmanager
+    def record(self, kind, request, id_key, method_key=None):
+        if not self.enabled or random.random() >= self._sample_rate:
+            yield
+            return
+        started = time.time()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            try:
+                self._write(kind, request, id_key, method_key, started, time.perf_counter() - begin)
+            except Exception as e:
+                logging.warning(f"录制请求失败：{e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+    def _write(self, kind, request, id_key, method_key, started, elapsed):
+        body = request.body if is_bytes(request.body) else b""
+        content_type = request.headers.get("content-type", "")
+        # 请求体只解析一次，同时用于取 id/method 和脱敏
+        body_params = _decode_body(body, content_type)
+        body_text, binary = self._body_text(body, content_type, body_params)
+        entry = {"ts": round(started, 6),
+                 "kind": kind,
+                 "path": request.path,
+                 "http": request.method,
+                 "qs": self._redact_query(request.query_string),
+                 "ct": content_type,
+                 "body": body_text,
+                 "id": _param(request, body_params, id_key),
+                 "method": _param(request, body_params, method_key) if method_key else None,
+                 "ms": round(elapsed * 1000, 3),
+                 }
+        if binary:
+            entry["b64"] = True
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            file = self._open()
+            file.write(line)
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                file.flush()
+                self._last_flush = now
+
+    def _body_text(self, body, content_type, body_params):
+        """
+        返回 (保存的请求体, 是否为base64)，超过 max_body 时请求体为None
+        """
+        if not body:
+            return "", False
+        if len(body) > self._max_body:
+            return None, False
+        if body_params is not None and self._redact and _has_keys(body_params, self._redact):
+            redacted = _redact(body_params, self._redact)
+            if is_msgpack(content_type):
+                body = dg_msgpack_dumps(redacted)
+            else:
+                return dg_json_dumps(redacted), False
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            return self._redact_query(to_string(body)), False
+        if is_msgpack(content_type):
+            return base64.b64encode(body).decode("ascii"), True
+        try:
+            return body.decode("utf-8"), False
+        except UnicodeDecodeError:
+            return base64.b64encode(body).decode("ascii"), True
+
+    def _redact_query(self, query_string):
+        if not query_string or not self._redact:
+            return query_string
+        pairs = parse_qsl(query_string, keep_blank_values=True)
+        if not any(key in self._redact for key, _ in pairs):
+            return query_string
+        return urlencode([(key, REDACTED if key in self._redact else value) for key, value in pairs],
+                         safe="*")
+
+    def _open(self):
+        pid = os.getpid()
+        if self._file is None or self._pid != pid:
+            private_directory(self.directory)
+            path = os.path.join(self.directory, f"traffic-{pid}.jsonl")
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+            self._file = os.fdopen(fd, "a", buffering=BUFFER_SIZE, encoding="utf-8")
+            self._pid = pid
+        return self._file
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            default = os.path.join(tempfile.gettempdir(), "lightcone-traffic")
+            self._directory = PROJ.get("recorder.dir", default) or default
+        return self._directory
+
+    def _load_config(self):
+        enabled = PROJ.get("recorder.enable", False)
+        self._enabled = enabled is True or str(enabled).lower() in ("1", "true", "yes", "on")
+        self._sample_rate = float(PROJ.get("recorder.sample_rate", DEFAULT_SAMPLE_RATE))
+        self._max_body = int(PROJ.get("recorder.max_body", DEFAULT_MAX_BODY))
+        redact = PROJ.get("recorder.redact", DEFAULT_REDACT)
+        self._redact = frozenset(name.strip() for name in str(redact or "").split(",") if name.strip())
+
+
+def _decode_body(body, content_type):
+    """
+    把 JSON / MessagePack 请求体解析为字典，表单请求体由 request.form 解析，其他格式返回None
+    """
+    if not body or content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        return None
+    try:
+        if is_msgpack(content_type):
+            data = dg_msgpack_loads(body)
+        elif len(body) > 8:
+            data = dg_json_loads(to_string(body))
+        else:
+            return None
+    except Exception as e:
+        _ = e
+        return None
+    return data if is_dict(data) else None
+
+
+def _param(request, body_params, key):
+    # 与 get_param_from_request 的优先级一致：body > form > args
+    if body_params is not None and key in body_params:
+        return body_params[key]
+    request_form = nest_dict(request.form)
+    if is_dict(request_form) and key in request_form:
+        return request_form.get(key)
+    if is_dict(request.args) and key in request.args:
+        return request.args.get(key)
+    return None
+
+
+def _has_keys(data, keys) -> bool:
+    if isinstance(data, dict):
+        return any(key in keys or _has_keys(value, keys) for key, value in data.items())
+    if isinstance(data, list):
+        return any(_has_keys(item, keys) for item in data)
+    return False
+
+
+def _redact(data, keys):
+    if isinstance(data, dict):
+        return {key: REDACTED if key in keys else _redact(value, keys) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_redact(item, keys) for item in data]
+    return data
+
+
+# 全局请求录制
+RECORDER = TrafficRecorder()
+atexit.register(RECORDER.close)
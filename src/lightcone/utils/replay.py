@@ -0,0 +1,183 @@
+"""
+回放 TrafficRecorder 录制的请求，统计各指令的吞吐和耗时分位数
+
+    按录制节奏回放（2倍速）：
+        python -m lightcone.utils.replay traffic-*.jsonl --base-url http://127.0.0.1:8000 --speed 2
+    固定并发、尽快回放：
+        python -m lightcone.utils.replay traffic-*.jsonl --base-url http://127.0.0.1:8000 --concurrency 64
+"""
+import argparse
+import base64
+import json
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_WORKERS = 256  # 按节奏回放时的最大并发
+
+_local = threading.local()
+
+
+def load_entries(paths, kinds=None, limit=None) -> list:
+    """
+    读取录制文件，按请求时间排序；请求体过大未录制的记录会被跳过
+    """
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("body") is None:
+                    continue
+                if kinds and entry.get("kind") not in kinds:
+                    continue
+                entries.append(entry)
+    entries.sort(key=lambda item: item["ts"])
+    return entries[:limit] if limit else entries
+
+
+def send(base_url, entry, timeout=DEFAULT_TIMEOUT):
+    """
+    发送一条录制的请求，返回 (标签, 是否成功, 耗时秒)
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+
+    url = f"{base_url.rstrip('/')}{entry['path']}"
+    if entry.get("qs"):
+        url = f"{url}?{entry['qs']}"
+    headers = {"Content-Type": entry["ct"]} if entry.get("ct") else {}
+    label = f"{entry.get('kind')}:{entry.get('id')}"
+    begin = time.perf_counter()
+    try:
+        response = session.request(entry.get("http") or "GET", url,
+                                   data=_body_bytes(entry),
+                                   headers=headers, timeout=timeout)
+        _ = response.content  # 读完响应体（含流式响应）
+        ok = response.status_code < 400
+    except requests.RequestException:
+        ok = False
+    return label, ok, time.perf_counter() - begin
+
+
+def _body_bytes(entry):
+    body = entry.get("body")
+    if not body:
+        return None
+    if entry.get("b64"):
+        return base64.b64decode(body)
+    return body.encode("utf-8")
+
+
+def replay_timed(entries, base_url, speed=1.0, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT):
+    """
+    按录制时的时间间隔回放，speed 为倍速
+    """
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        start = time.perf_counter()
+        first_ts = entries[0]["ts"] if entries else 0
+        for entry in entries:
+            delay = (entry["ts"] - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(send, base_url, entry, timeout))
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def replay_concurrent(entries, base_url, concurrency, timeout=DEFAULT_TIMEOUT):
+    """
+    以固定并发尽快回放
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda entry: send(base_url, entry, timeout), entries))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed) -> dict:
+    groups = {"__all__": []}
+    errors = {"__all__": 0}
+    for label, ok, latency in results:
+        groups.setdefault(label, []).append(latency)
+        groups["__all__"].append(latency)
+        if not ok:
+            errors[label] = errors.get(label, 0) + 1
+            errors["__all__"] += 1
+
+    summary = {}
+    for label, latencies in groups.items():
+        latencies.sort()
+        summary[label] = {"count": len(latencies),
+                          "errors": errors.get(label, 0),
+                          "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+                          "p50_ms": percentile(latencies, 50) * 1000,
+                          "p90_ms": percentile(latencies, 90) * 1000,
+                          "p99_ms": percentile(latencies, 99) * 1000,
+                          "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+                          }
+    return summary
+
+
+def percentile(sorted_values, p) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def print_summary(summary, elapsed):
+    print(f"elapsed: {elapsed:.2f}s")
+    print(f"{'command':<40}{'count':>8}{'errors':>8}{'req/s':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for label in sorted(summary, key=lambda item: (item != "__all__", item)):
+        item = summary[label]
+        print(f"{label:<40}{item['count']:>8}{item['errors']:>8}{item['throughput']:>10.1f}"
+              f"{item['p50_ms']:>10.1f}{item['p90_ms']:>10.1f}{item['p99_ms']:>10.1f}{item['max_ms']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回放 lightcone 录制的请求")
+    parser.add_argument("files", nargs="+", help="录制文件 traffic-*.jsonl")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="回放的目标地址")
+    parser.add_argument("--speed", type=float, default=1.0, help="按录制节奏回放的倍速，默认1")
+    parser.add_argument("--concurrency", type=int, help="固定并发尽快回放，指定后忽略 --speed")
+    parser.add_argument("--kind", action="append", help="只回放指定类型：rest / stream / action，可重复")
+    parser.add_argument("--limit", type=int, help="最多回放的请求数")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="单个请求的超时（秒）")
+    parser.add_argument("--json", help="把统计结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    entries = load_entries(args.files, args.kind, args.limit)
+    if not entries:
+        print("没有可回放的请求")
+        return 1
+    if args.concurrency:
+        results, elapsed = replay_concurrent(entries, args.base_url, args.concurrency, args.timeout)
+    else:
+        results, elapsed = replay_timed(entries, args.base_url, args.speed, timeout=args.timeout)
+
+    summary = summarize(results, elapsed)
+    print_summary(summary, elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"elapsed": elapsed, "commands": summary}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+import time
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.metrics import METRICS
+from lightcone.utils.tools import logging, private_directory
+
+PROJ = lazy_config("proj.ini")
+
+DEFAULT_SLOTS = 16384
+DEFAULT_SLOT_SIZE = 1024
+# 组相联：key 只会落在所属组的 WAYS 个槽位中，组内按 clock 淘汰
+WAYS = 8
+# 写操作的分段锁数量
+STRIPES = 64
+
+_MAGIC = b"LCCACHE1"
+# magic, 槽位数, 槽位大小, 组内槽位数
+_HEADER = struct.Struct("<8sIII")
+_HEADER_SIZE = 64
+# seq（奇数表示正在写入）, key哈希, 过期时间, value长度, key长度, clock访问位
+_SLOT = struct.Struct("<IQdIHB5x")
+_SEQ = struct.Struct("<I")
+_REF_OFFSET = 26
+
+REQUESTS = METRICS.counter("lightcone_shared_cache_requests_total", "共享缓存的查询次数", ("cache", "result"))
+EVICTIONS = METRICS.counter("lightcone_shared_cache_evictions_total", "共享缓存淘汰的未过期条目数", ("cache",))
+OVERSIZE = METRICS.counter("lightcone_shared_cache_oversize_total", "超过槽位大小未能写入共享缓存的条目数", ("cache",))
+
+
+class SharedCache:
+    """
+    基于 mmap 共享内存文件的跨进程缓存，同一台机器上的所有worker共享同一份数据，不依赖外部服务
+    固定大小的槽位组成组相联哈希表，每个key只会落在一个组的 WAYS 个槽位内，组满时按 clock 算法淘汰
+    读不加锁，通过槽位的 seq（seqlock）检测并发写入，读到正在写入的槽位视为未命中
+    写按组分段加锁：进程内用 threading.Lock，进程间用 fcntl 记录锁
+    值通过 pickle 序列化，序列化后 key + value 超过槽位容量的条目不缓存
+    文件位于只有当前用户可访问的目录中（默认 /dev/shm/lightcone-{uid}），打开时检查文件属主和权限，
+    文件名包含项目命名空间（sharedcache.namespace，默认为启动目录的哈希）和槽位配置：
+    同一台机器上的不同项目互不干扰，槽位配置变更后使用新文件，不会改动其他worker正在映射的文件
+    """
+
+    def __init__(self, name, slots=None, slot_size=None, directory=None):
+        self.name = name
+        slots = int(slots or PROJ.get("sharedcache.slots", DEFAULT_SLOTS))
+        self.slot_size = int(slot_size or PROJ.get("sharedcache.slot_size", DEFAULT_SLOT_SIZE))
+        self.sets = max(1, slots // WAYS)
+        self.slots = self.sets * WAYS
+        self.capacity = self.slot_size - _SLOT.size
+        if self.capacity <= 0:
+            raise ValueError(f"slot_size 至少为 {_SLOT.size + 1}")
+        directory = directory or PROJ.get("sharedcache.dir") or _default_directory()
+        private_directory(directory)
+        self.path = os.path.join(directory, f"lightcone-{_namespace()}-{name}-{self.slots}x{self.slot_size}.cache")
+        self._size = _HEADER_SIZE + self.slots * self.slot_size
+        self._fd = None
+        self._mm = None
+        self._locks = tuple(threading.Lock() for _ in range(STRIPES))
+        self._open()
+
+    def get(self, key, default=None):
+        key_bytes = _key_bytes(key)
+        key_hash = _hash(key_bytes)
+        found, value = self._read(key_bytes, key_hash)
+        REQUESTS.inc((self.name, "hit" if found else "miss"))
+        return value if found else default
+
+    def set(self, key, value, ttl) -> bool:
+        """
+        写入缓存，ttl 为有效期（秒），返回是否写入成功
+        """
+        key_bytes = _key_bytes(key)
+        value_bytes = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(key_bytes) + len(value_bytes) > self.capacity:
+            OVERSIZE.inc((self.name,))
+            return False
+        key_hash = _hash(key_bytes)
+        set_index = key_hash % self.sets
+        with self._stripe(set_index):
+            offset = self._choose_slot(set_index, key_bytes, key_hash)
+            self._write(offset, key_hash, time.time() + ttl, key_bytes, value_bytes)
+        return True
+
+    def delete(self, key):
+        key_bytes = _key_bytes(key)
+        key_hash = _hash(key_bytes)
+        set_index = key_hash % self.sets
+        with self._stripe(set_index):
+            offset = self._find(set_index, key_bytes, key_hash)
+            if offset is not None:
+                self._write(offset, 0, 0.0, b"", b"")
+
+    def clear(self):
+        empty = bytes(self.slot_size - _SEQ.size)
+        for stripe in range(STRIPES):
+            with self._stripe(stripe):
+                for set_index in range(stripe, self.sets, STRIPES):
+                    for way in range(WAYS):
+                        offset = self._offset(set_index, way)
+                        writing = _SEQ.unpack_from(self._mm, offset)[0] | 1
+                        _SEQ.pack_into(self._mm, offset, writing)
+                        self._mm[offset + _SEQ.size:offset + self.slot_size] = empty
+                        _SEQ.pack_into(self._mm, offset, (writing + 1) & 0xFFFFFFFF)
+
+    def stats(self) -> dict:
+        now = time.time()
+        used = 0
+        for set_index in range(self.sets):
+            for way in range(WAYS):
+                _, key_hash, expires, _, _, _ = _SLOT.unpack_from(self._mm, self._offset(set_index, way))
+                if key_hash and expires > now:
+                    used += 1
+        return {"name": self.name, "path": self.path, "slots": self.slots, "slot_size": self.slot_size, "used": used}
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _open(self):
+        for _ in range(3):
+            fd = _open_private(self.path)
+            try:
+                # 多个worker同时启动时，只有一个进程初始化文件
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+                try:
+                    ready = self._prepare(fd)
+                finally:
+                    fcntl.lockf(fd, fcntl.LOCK_UN)
+                if ready:
+                    self._mm = mmap.mmap(fd, self._size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+                    self._fd = fd
+                    return
+            except Exception:
+                os.close(fd)
+                raise
+            os.close(fd)
+        raise OSError(f"无法打开共享缓存文件{self.path}")
+
+    def _prepare(self, fd) -> bool:
+        """
+        初始化新文件，返回False表示需要重新打开
+        """
+        info = os.fstat(fd)
+        if info.st_nlink == 0:
+            # 打开后被其他进程删除重建
+            return False
+        expected = _HEADER.pack(_MAGIC, self.slots, self.slot_size, WAYS)
+        if info.st_size == 0:
+            os.ftruncate(fd, self._size)
+            os.pwrite(fd, expected, 0)
+            return True
+        if os.pread(fd, _HEADER.size, 0) != expected or info.st_size != self._size:
+            # 格式不符（如旧版本的文件）：其他进程可能已经映射该文件，原地截断会使其 SIGBUS，删除后重建
+            logging.warning(f"共享缓存文件{self.path}格式不符，重新创建")
+            os.unlink(self.path)
+            return False
+        return True
+
+    def _offset(self, set_index, way) -> int:
+        return _HEADER_SIZE + (set_index * WAYS + way) * self.slot_size
+
+    def _read(self, key_bytes, key_hash):
+        mm = self._mm
+        set_index = key_hash % self.sets
+        key_length = len(key_bytes)
+        for way in range(WAYS):
+            offset = self._offset(set_index, way)
+            seq, slot_hash, expires, value_length, slot_key_length, _ = _SLOT.unpack_from(mm, offset)
+            if slot_hash != key_hash or slot_key_length != key_length or seq & 1:
+                continue
+            start = offset + _SLOT.size
+            data = mm[start:start + key_length + value_length]
+            if _SEQ.unpack_from(mm, offset)[0] != seq or data[:key_length] != key_bytes:
+                # 读取过程中槽位被改写
+                return False, None
+            if expires <= time.time():
+                return False, None
+            mm[offset + _REF_OFFSET] = 1
+            try:
+                return True, pickle.loads(data[key_length:])
+            except Exception as e:
+                logging.warning(f"共享缓存{self.name}反序列化失败：{e}")
+                return False, None
+        return False, None
+
+    def _find(self, set_index, key_bytes, key_hash):
+        key_length = len(key_bytes)
+        for way in range(WAYS):
+            offset = self._offset(set_index, way)
+            _, slot_hash, _, _, slot_key_length, _ = _SLOT.unpack_from(self._mm, offset)
+            if slot_hash == key_hash and slot_key_length == key_length:
+                start = offset + _SLOT.size
+                if self._mm[start:start + key_length] == key_bytes:
+                    return offset
+        return None
+
+    def _choose_slot(self, set_index, key_bytes, key_hash) -> int:
+        offset = self._find(set_index, key_bytes, key_hash)
+        if offset is not None:
+            return offset
+        now = time.time()
+        for way in range(WAYS):
+            offset = self._offset(set_index, way)
+            _, slot_hash, expires, _, _, _ = _SLOT.unpack_from(self._mm, offset)
+            if slot_hash == 0 or expires <= now:
+                return offset
+        # clock：从随机位置开始扫描，跳过并清除最近被访问过的槽位
+        start = (key_hash >> 32) % WAYS
+        for step in range(WAYS * 2):
+            offset = self._offset(set_index, (start + step) % WAYS)
+            if self._mm[offset + _REF_OFFSET]:
+                self._mm[offset + _REF_OFFSET] = 0
+                continue
+            break
+        EVICTIONS.inc((self.name,))
+        return offset
+
+    def _write(self, offset, key_hash, expires, key_bytes, value_bytes):
+        mm = self._mm
+        writing = _SEQ.unpack_from(mm, offset)[0] | 1
+        _SEQ.pack_into(mm, offset, writing)
+        start = offset + _SLOT.size
+        mm[start:start + len(key_bytes) + len(value_bytes)] = key_bytes + value_bytes
+        _SLOT.pack_into(mm, offset, writing, key_hash, expires, len(value_bytes), len(key_bytes), 0)
+        _SEQ.pack_into(mm, offset, (writing + 1) & 0xFFFFFFFF)
+
+    def _stripe(self, index):
+        return _StripeLock(self._locks[index % STRIPES], self._fd, index % STRIPES)
+
+
+class _StripeLock:
+    __slots__ = ("_lock", "_fd", "_stripe")
+
+    def __init__(self, lock, fd, stripe):
+        self._lock = lock
+        self._fd = fd
+        self._stripe = stripe
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            # 锁定文件头中 stripe 对应的一个字节，fcntl 记录锁只在进程之间互斥
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._stripe)
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._stripe)
+        finally:
+            self._lock.release()
+
+
+def _key_bytes(key) -> bytes:
+    return key if isinstance(key, bytes) else str(key).encode("utf-8")
+
+
+def _hash(key_bytes) -> int:
+    # 不能使用内置 hash()，未 fork 的进程之间哈希种子不同
+    key_hash = int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), "little")
+    return key_hash or 1
+
+
+def _default_directory() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"lightcone-{os.getuid()}")
+
+
+def _namespace() -> str:
+    """
+    区分同一台机器上的不同项目，默认使用启动目录（配置文件所在目录）的哈希
+    """
+    namespace = PROJ.get("sharedcache.namespace")
+    if namespace:
+        return "".join(c if c.isalnum() or c in "._-" else "_" for c in str(namespace))
+    return hashlib.blake2b(os.path.realpath(os.getcwd()).encode("utf-8"), digest_size=6).hexdigest()
+
+
+def _open_private(path) -> int:
+    """
+    打开缓存文件，文件内容会被 pickle 反序列化，只接受当前用户创建、其他用户不可写的普通文件
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    info = os.fstat(fd)
+    if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+        os.close(fd)
+        raise PermissionError(f"共享缓存文件{path}不属于当前用户或可被其他用户写入")
+    return fd
+
+
+# 已打开的共享缓存，key为缓存名
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_shared_cache(name, **options) -> SharedCache:
+    """
+    按名称获取共享缓存，同一进程内同名缓存只打开一次
+    槽位配置默认读取 proj.ini 中的 sharedcache.slots / sharedcache.slot_size，
+    文件位置读取 sharedcache.dir / sharedcache.namespace
+    """
+    cache = _CACHES.get(name)
+    if cache is None:
+        with _CACHES_LOCK:
+            cache = _CACHES.get(name)
+            if cache is None:
+                cache = SharedCache(name, **options)
+                _CACHES[name] = cache
+    return cache
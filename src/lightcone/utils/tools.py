@@ -1,16 +1,21 @@
+import os
+import stat
+
 from gramai.utils import nest_dict, is_dict, is_bytes, to_string
-from sanic.log import logger
 from sanic.request import Request
 
 from lightcone.utils.jsonencoder import dg_json_loads
+from lightcone.utils.log import LOGGER
+from lightcone.utils.msgpackencoder import is_msgpack, dg_msgpack_loads
 
-# 声明一个logging，替代默认的logging
-logging = logger
+# 声明一个logging，替代默认的logging，基于 sanic 的 logger，支持延迟格式化、结构化字段和限流（见 utils/log.py）
+logging = LOGGER
 
 
 def params_dict_from_request(request: Request, parse_json=False):
     params = {}
     # 参数优先级：request.body > request.form > request.args
+    # request.body 按 Content-Type 解析为 MessagePack，其余按JSON解析
     if is_dict(request.args):
         for key in request.args:
             params[key] = request.args.get(key)
@@ -18,7 +23,16 @@ def params_dict_from_request(request: Request, parse_json=False):
     # 更新request.form的参数表
     params.update(nest_dict(request.form))
 
-    if is_bytes(request.body) and 8 < len(request.body):  # 作为JSON格式传递参数，至少需要9位长度{"a":"b"}
+    if is_bytes(request.body) and request.body and is_msgpack(request.headers.get("content-type")):
+        # MessagePack 格式的参数，解析失败时与JSON一样只记录警告
+        try:
+            body_dict = dg_msgpack_loads(request.body)
+            if is_dict(body_dict):
+                params.update(body_dict)
+        except Exception as e:
+            logging.warning(f"解析MessagePack请求body出错：{e}")
+    elif is_bytes(request.body) and 8 < len(request.body) \
+            and not _is_form_content(request):  # 作为JSON格式传递参数，至少需要9位长度{"a":"b"}
         try:
             json_string = to_string(request.body)
             body_dict = dg_json_loads(json_string)
@@ -40,6 +54,14 @@ def params_dict_from_request(request: Request, parse_json=False):
     return params
 
 
+def _is_form_content(request: Request) -> bool:
+    """
+    表单请求体已经由 request.form 解析，不再按JSON解析
+    """
+    content_type = request.headers.get("content-type", "")
+    return content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded"))
+
+
 def get_param_from_request(request: Request, key: str, default=None, parse_json=False):
     """
     从sanic request中解析参数
@@ -51,12 +73,22 @@ def get_param_from_request(request: Request, key: str, default=None, parse_json=
     """
     value = default
     # 参数优先级：request.body > request.form > request.args
+    # request.body 按 Content-Type 解析为 MessagePack，其余按JSON解析
     if is_dict(request.args) and key in request.args:
         value = request.args.get(key, default)
     request_form = nest_dict(request.form)
     if is_dict(request_form) and key in request_form:
         value = request_form.get(key, default)
-    if is_bytes(request.body) and 8 < len(request.body):  # 作为JSON格式传递参数，至少需要9位长度{"a":"b"}
+    if is_bytes(request.body) and request.body and is_msgpack(request.headers.get("content-type")):
+        # MessagePack 格式的参数，解析失败时与JSON一样只记录警告
+        try:
+            body_dict = dg_msgpack_loads(request.body)
+            if is_dict(body_dict) and key in body_dict:
+                value = body_dict[key]
+        except Exception as e:
+            logging.warning(f"解析MessagePack请求body出错：{e}")
+    elif is_bytes(request.body) and 8 < len(request.body) \
+            and not _is_form_content(request):  # 作为JSON格式传递参数，至少需要9位长度{"a":"b"}
         try:
             body_dict = dg_json_loads(to_string(request.body))
             if is_dict(body_dict) and key in body_dict:
@@ -81,12 +113,20 @@ def request_has_param(request: Request, key: str):
     """
     params = {}
     # 参数优先级：request.body > request.form > request.args
+    # request.body 按 Content-Type 解析为 MessagePack，其余按JSON解析
     if is_dict(request.args) and key in request.args:
         params.update(request.args)
     request_form = nest_dict(request.form)
     if is_dict(request_form) and key in request_form:
         params.update(request_form)
-    if is_bytes(request.body):
+    if is_bytes(request.body) and request.body and is_msgpack(request.headers.get("content-type")):
+        try:
+            body_dict = dg_msgpack_loads(request.body)
+            if is_dict(body_dict) and key in body_dict:
+                params.update(body_dict)
+        except Exception as e:
+            logging.warning(f"解析MessagePack请求body出错：{e}")
+    elif is_bytes(request.body):
         try:
             body_dict = dg_json_loads(to_string(request.body))
             if is_dict(body_dict) and key in body_dict:
@@ -99,3 +139,16 @@ def request_has_param(request: Request, key: str):
         value = key in params
 
     return value
+
+
+def private_directory(directory):
+    """
+    创建只有当前用户可以访问的目录（0700），用于保存请求内容、缓存等敏感文件
+    目录已存在时检查属主，并收紧权限；目录属于其他用户（如被预先创建在 /tmp、/dev/shm 中）时抛出 PermissionError
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"目录{directory}不属于当前用户")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(directory, 0o700)
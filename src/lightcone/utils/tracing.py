@@ -0,0 +1,425 @@
+import atexit
+import json
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.tools import logging, private_directory
+
+PROJ = lazy_config("proj.ini")
+
+# W3C Trace Context 请求头
+TRACEPARENT_HEADER = "traceparent"
+# OTLP 的 span 类型
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+# OTLP 的 span 状态
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+DEFAULT_SAMPLE_RATE = 0.01  # 没有上游采样决定时的采样比例，0~1
+DEFAULT_MAX_SPANS = 1000  # 单个trace最多记录的span数，超出的span丢弃
+MAX_ATTRIBUTE_LENGTH = 1024  # 字符串属性的最大长度，SQL等超长内容截断
+BUFFER_SIZE = 65536  # 写文件的缓冲大小
+FLUSH_INTERVAL = 1.0  # 缓冲写入文件的最长间隔（秒）
+DEFAULT_QUEUE_SIZE = 10000  # 等待写出的trace数，队列满时丢弃新的trace
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_CURRENT: ContextVar = ContextVar("lightcone_span", default=None)
+
+
+class SpanContext:
+    """
+    跨进程传递的trace信息；未被采样的请求只有 SpanContext，不记录span
+    """
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Trace:
+    """
+    一次请求中被采样的所有span，根span结束时整体导出
+    """
+    __slots__ = ("spans", "dropped")
+
+    def __init__(self):
+        self.spans = []
+        self.dropped = 0
+
+
+class Span(SpanContext):
+    __slots__ = ("trace", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "message")
+
+    def __init__(self, trace, trace_id, parent_id, name, kind, attributes):
+        super().__init__(trace_id, _new_span_id(), True)
+        self.trace = trace
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = None
+        self.message = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.message = str(message)[:MAX_ATTRIBUTE_LENGTH]
+
+    def to_otlp(self) -> dict:
+        span = {"traceId": self.trace_id,
+                "spanId": self.span_id,
+                "name": self.name,
+                "kind": self.kind,
+                "startTimeUnixNano": str(self.start_ns),
+                "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+                "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+                "status": {"code": self.status or STATUS_OK},
+                }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.message:
+            span["status"]["message"] = self.message
+        return span
+
+
+class _NoopScope:
+    """
+    未开启追踪或请求未被采样时使用，不产生任何记录
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOOP = _NoopScope()
+
+
+class _SpanScope:
+    __slots__ = ("_span", "_token", "_root")
+
+    def __init__(self, span, root):
+        self._span = span
+        self._root = root
+        self._token = None
+
+    def __enter__(self):
+        self._token = _CURRENT.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        span = self._span
+        span.end_ns = time.time_ns()
+        if exc_type is not None and span.status is None:
+            span.set_error(f"{exc_type.__name__}: {exc_val}")
+        _CURRENT.reset(self._token)
+        if self._root:
+            TRACER.export(span.trace)
+        return False
+
+
+class _ContextScope:
+    """
+    未被采样的请求：只记录 SpanContext，用于把 trace id 和采样决定传给下游
+    """
+    __slots__ = ("_context", "_token")
+
+    def __init__(self, context):
+        self._context = context
+        self._token = None
+
+    def __enter__(self):
+        self._token = _CURRENT.set(self._context)
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _CURRENT.reset(self._token)
+        return False
+
+
+class Tracer:
+    """
+    请求级追踪，默认关闭，proj.ini 中 tracing.enable = true 开启
+    入口（REST/STREAM/Action/RPC）调用 start_trace 创建根span，Gate、Pipe、指令和SQL在其中创建子span
+    头部采样：请求带有 traceparent 时沿用上游的采样决定，否则按 tracing.sample_rate 比例采样
+    被采样的trace在根span结束后，以 OTLP-JSON 格式（每行一个 ExportTraceServiceRequest）
+    写入 {tracing.dir}/traces-{pid}.jsonl，可以直接交给 OpenTelemetry Collector 的 otlpjsonfile receiver
+    请求处理中只把trace放入队列，序列化和写文件在后台线程完成；队列满（tracing.queue_size）时丢弃trace
+    """
+
+    def __init__(self):
+        self._enabled = None
+        self._sample_rate = DEFAULT_SAMPLE_RATE
+        self._max_spans = DEFAULT_MAX_SPANS
+        self._service = "lightcone"
+        self._directory = None
+        self._queue_size = DEFAULT_QUEUE_SIZE
+        self._file = None
+        self._file_pid = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._load_config()
+        return self._enabled
+
+    def enable(self, sample_rate=None, directory=None):
+        if self._enabled is None:
+            self._load_config()
+        if sample_rate is not None:
+            self._sample_rate = float(sample_rate)
+        if directory is not None:
+            self.close()
+            self._directory = directory
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+        self.close()
+
+    def start_trace(self, name, traceparent=None, kind=SPAN_KIND_SERVER, attributes=None):
+        """
+        开始一个请求的trace，traceparent 为上游传来的 W3C traceparent 请求头
+        已经在trace中时（如指令内部通过RPC调用其他指令）创建子span
+        """
+        if not self.enabled:
+            return _NOOP
+        current = _CURRENT.get()
+        if current is not None:
+            return self.span(name, kind, attributes)
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            trace_id, parent_id, sampled = _new_trace_id(), None, random.random() < self._sample_rate
+        if not sampled:
+            return _ContextScope(SpanContext(trace_id, _new_span_id(), False))
+        trace = Trace()
+        span = Span(trace, trace_id, parent_id, name, kind, dict(attributes) if attributes else {})
+        span.set_attribute("service.name", self._service)
+        trace.spans.append(span)
+        return _SpanScope(span, True)
+
+    def span(self, name, kind=SPAN_KIND_INTERNAL, attributes=None):
+        """
+        在当前span下创建子span，用于 with 语句；不在被采样的trace中时不做任何事，with 得到None
+        """
+        parent = _CURRENT.get()
+        if parent is None or not parent.sampled:
+            return _NOOP
+        trace = parent.trace
+        if len(trace.spans) >= self._max_spans:
+            trace.dropped += 1
+            return _NOOP
+        span = Span(trace, parent.trace_id, parent.span_id, name, kind, dict(attributes) if attributes else {})
+        trace.spans.append(span)
+        return _SpanScope(span, False)
+
+    def export(self, trace: Trace):
+        """
+        把trace交给后台线程写出，不阻塞请求
+        """
+        try:
+            self._ensure_thread().put_nowait(trace)
+        except queue.Full:
+            logging.warning("trace写出队列已满，丢弃trace", key="trace_queue_full")
+
+    def close(self):
+        """
+        写出队列中剩余的trace并关闭文件
+        """
+        with self._lock:
+            thread, traces = self._thread, self._queue
+            self._thread = None
+            self._queue = None
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            traces.put(None)
+            thread.join()
+        self._close_file()
+
+    def _ensure_thread(self) -> queue.Queue:
+        # fork之后子进程里的线程不存在，队列的锁也可能处于被持有的状态，需要按pid重新创建
+        pid = os.getpid()
+        traces, thread = self._queue, self._thread
+        if thread is not None and self._pid == pid and thread.is_alive():
+            return traces
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return self._queue
+            self._pid = pid
+            self._queue = queue.Queue(self._queue_size)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name="trace-writer", daemon=True)
+            self._thread.start()
+            return self._queue
+
+    def _run(self, traces: queue.Queue):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                trace = traces.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                trace = False
+            if trace is None:
+                break
+            try:
+                if trace:
+                    self._open().write(self._serialize(trace))
+                now = time.monotonic()
+                # 队列空闲或超过间隔时刷新到文件
+                if self._file is not None and (traces.empty() or now - last_flush >= FLUSH_INTERVAL):
+                    self._file.flush()
+                    last_flush = now
+            except Exception as e:
+                logging.warning(f"导出trace失败：{e}", key="trace_export")
+
+    def _serialize(self, trace: Trace) -> str:
+        if trace.dropped:
+            trace.spans[0].set_attribute("lightcone.dropped_spans", trace.dropped)
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self._service)]},
+            "scopeSpans": [{"scope": {"name": "lightcone"},
+                            "spans": [span.to_otlp() for span in trace.spans]}],
+        }]}
+        return json.dumps(request, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _open(self):
+        pid = os.getpid()
+        if self._file is None or self._file_pid != pid:
+            private_directory(self.directory)
+            path = os.path.join(self.directory, f"traces-{pid}.jsonl")
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0)
+            fd = os.open(path, flags, 0o600)
+            self._file = os.fdopen(fd, "a", buffering=BUFFER_SIZE, encoding="utf-8")
+            self._file_pid = pid
+        return self._file
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            default = os.path.join(tempfile.gettempdir(), f"lightcone-traces-{os.getuid()}")
+            self._directory = PROJ.get("tracing.dir", default) or default
+        return self._directory
+
+    def _load_config(self):
+        enabled = PROJ.get("tracing.enable", False)
+        self._enabled = enabled is True or str(enabled).lower() in ("1", "true", "yes", "on")
+        self._sample_rate = float(PROJ.get("tracing.sample_rate", DEFAULT_SAMPLE_RATE))
+        self._max_spans = int(PROJ.get("tracing.max_spans", DEFAULT_MAX_SPANS))
+        self._service = PROJ.get("tracing.service", "lightcone") or "lightcone"
+        self._queue_size = int(PROJ.get("tracing.queue_size", DEFAULT_QUEUE_SIZE))
+
+
+def parse_traceparent(value):
+    """
+    解析 W3C traceparent 请求头，格式不正确时返回None
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+def trace_request(request, name=None):
+    """
+    HTTP入口使用：读取请求的 traceparent 头并开始trace
+    """
+    if not TRACER.enabled:
+        return _NOOP
+    headers = getattr(request, "headers", None)
+    traceparent = headers.get(TRACEPARENT_HEADER) if headers is not None else None
+    return TRACER.start_trace(name or f"{request.method} {request.path}", traceparent,
+                              attributes={"http.method": request.method, "http.target": request.path})
+
+
+def span(name, kind=SPAN_KIND_INTERNAL, attributes=None):
+    return TRACER.span(name, kind, attributes)
+
+
+def current_span():
+    """
+    当前被采样的span，未开启追踪或未被采样时返回None
+    """
+    current = _CURRENT.get()
+    return current if current is not None and current.sampled else None
+
+
+def current_traceparent():
+    """
+    当前上下文的 traceparent，调用下游服务时放入请求头；不在trace中时返回None
+    """
+    current = _CURRENT.get()
+    return current.traceparent() if current is not None else None
+
+
+def inject_headers(headers: dict) -> dict:
+    """
+    把当前trace写入下游请求的请求头
+    """
+    traceparent = current_traceparent()
+    if traceparent is not None:
+        headers[TRACEPARENT_HEADER] = traceparent
+    return headers
+
+
+def _new_trace_id() -> str:
+    # random 模块在fork后会重新播种，不同worker不会生成相同的id
+    return f"{random.getrandbits(128) or 1:032x}"
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+
+def _otlp_attribute(key, value) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)[:MAX_ATTRIBUTE_LENGTH]}
+    return {"key": key, "value": typed}
+
+
+# 全局请求追踪
+TRACER = Tracer()
+atexit.register(TRACER.close)
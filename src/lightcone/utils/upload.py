@@ -0,0 +1,360 @@
+import asyncio
+import re
+import tempfile
+from urllib.parse import unquote, parse_qsl
+
+from gramai.utils import to_string
+
+from lightcone.utils.config import lazy_config
+from lightcone.utils.jsonencoder import dg_json_loads
+from lightcone.utils.msgpackencoder import is_msgpack, dg_msgpack_loads
+
+PROJ = lazy_config("proj.ini")
+
+DEFAULT_MAX_FILE_SIZE = 100 * 1024 * 1024  # 单个文件的大小上限
+DEFAULT_MAX_TOTAL_SIZE = 200 * 1024 * 1024  # 整个请求体的大小上限
+DEFAULT_MAX_FIELD_SIZE = 1024 * 1024  # 单个普通字段的大小上限
+DEFAULT_MAX_FILES = 16  # 文件数量上限
+DEFAULT_SPOOL_SIZE = 1024 * 1024  # 超过该大小的文件写入磁盘临时文件
+MAX_HEADER_SIZE = 16 * 1024  # 每个part的头部大小上限
+
+_PARAM_PATTERN = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+class UploadError(ValueError):
+    """
+    上传内容格式错误
+    """
+
+
+class UploadTooLarge(UploadError):
+    """
+    上传内容超过大小或数量限制
+    """
+
+
+class UploadedFile:
+    """
+    上传的文件，内容保存在 SpooledTemporaryFile 中，小文件在内存里，超过 spool_size 后自动写入磁盘
+    指令通过参数拿到该对象，读取 file 或调用 read()；请求结束后由框架关闭
+    接收时超过 spool_size 的数据先放在 pending 中，由 flush 在线程中写入磁盘，不阻塞事件循环
+    """
+
+    def __init__(self, name, filename, content_type, spool_size):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self._spool_size = spool_size
+        self._pending = []
+
+    def write(self, data):
+        if self._pending or self.size + len(data) > self._spool_size:
+            # 写入后会转存到磁盘（或已经在磁盘上），留给 flush
+            self._pending.append(data)
+        else:
+            self.file.write(data)
+        self.size += len(data)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._pending)
+
+    def flush(self):
+        """
+        写出 pending 中的数据，可能写磁盘，在事件循环中需要通过 asyncio.to_thread 调用
+        """
+        pending, self._pending = self._pending, []
+        for data in pending:
+            self.file.write(data)
+
+    def read(self, size=-1) -> bytes:
+        return self.file.read(size)
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    @property
+    def path(self) -> str:
+        """
+        磁盘上的临时文件路径，需要交给只接受路径的库（如图像处理）时使用，内存中的小文件会先写入磁盘
+        """
+        self.file.rollover()
+        return self.file.name
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self):
+        return f"<UploadedFile {self.name}={self.filename!r} {self.size} bytes>"
+
+
+class UploadLimits:
+    __slots__ = ("max_file_size", "max_total_size", "max_field_size", "max_files", "spool_size")
+
+    def __init__(self, max_file_size=None, max_total_size=None, max_field_size=None, max_files=None,
+                 spool_size=None):
+        self.max_file_size = int(max_file_size or PROJ.get("upload.max_file_size", DEFAULT_MAX_FILE_SIZE))
+        self.max_total_size = int(max_total_size or PROJ.get("upload.max_total_size", DEFAULT_MAX_TOTAL_SIZE))
+        self.max_field_size = int(max_field_size or PROJ.get("upload.max_field_size", DEFAULT_MAX_FIELD_SIZE))
+        self.max_files = int(max_files or PROJ.get("upload.max_files", DEFAULT_MAX_FILES))
+        self.spool_size = int(spool_size or PROJ.get("upload.spool_size", DEFAULT_SPOOL_SIZE))
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        options 为 commands.json 中指令的 upload 配置，未配置的项使用 proj.ini 中 upload 的默认值
+        """
+        options = options if isinstance(options, dict) else {}
+        return cls(**{key: options.get(key) for key in cls.__slots__})
+
+
+class MultipartParser:
+    """
+    增量解析 multipart/form-data，每次 feed 一段数据，已确定属于某个part的数据立即交给 handler，不缓存整个请求体
+    handler 需要实现 start_part(headers)、part_data(data)、end_part()
+    """
+    _PREAMBLE, _HEADERS, _BODY, _AFTER_DELIMITER, _END = range(5)
+
+    def __init__(self, boundary: bytes, handler):
+        self._delimiter = b"\r\n--" + boundary
+        self._handler = handler
+        self._buffer = bytearray(b"\r\n")  # 第一个分隔符前没有换行，补上后与其他分隔符统一处理
+        self._state = self._PREAMBLE
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        while True:
+            if self._state == self._PREAMBLE:
+                index = self._buffer.find(self._delimiter)
+                if index < 0:
+                    # 只保留可能是分隔符开头的部分
+                    del self._buffer[:max(0, len(self._buffer) - len(self._delimiter))]
+                    return
+                del self._buffer[:index + len(self._delimiter)]
+                self._state = self._AFTER_DELIMITER
+            elif self._state == self._AFTER_DELIMITER:
+                if len(self._buffer) < 2:
+                    return
+                if self._buffer[:2] == b"--":
+                    self._state = self._END
+                    return
+                if self._buffer[:2] != b"\r\n":
+                    raise UploadError("multipart 分隔符格式错误")
+                del self._buffer[:2]
+                self._state = self._HEADERS
+            elif self._state == self._HEADERS:
+                index = self._buffer.find(b"\r\n\r\n")
+                if index < 0:
+                    if len(self._buffer) > MAX_HEADER_SIZE:
+                        raise UploadError("multipart 头部过大")
+                    return
+                headers = _parse_headers(bytes(self._buffer[:index]))
+                del self._buffer[:index + 4]
+                self._handler.start_part(headers)
+                self._state = self._BODY
+            elif self._state == self._BODY:
+                index = self._buffer.find(self._delimiter)
+                if index < 0:
+                    # 末尾可能是不完整的分隔符，保留到下次再判断
+                    keep = len(self._delimiter) - 1
+                    if len(self._buffer) > keep:
+                        self._handler.part_data(bytes(self._buffer[:-keep]))
+                        del self._buffer[:-keep]
+                    return
+                if index:
+                    self._handler.part_data(bytes(self._buffer[:index]))
+                del self._buffer[:index + len(self._delimiter)]
+                self._handler.end_part()
+                self._state = self._AFTER_DELIMITER
+            else:
+                return
+
+    def close(self):
+        if self._state != self._END:
+            raise UploadError("multipart 内容不完整")
+
+
+class _FormCollector:
+    """
+    把 multipart 的各个part收集为参数字典，普通字段为字符串，文件为 UploadedFile，同名的多个值组成列表
+    """
+
+    def __init__(self, limits: UploadLimits):
+        self.limits = limits
+        self.params = {}
+        self.files = []
+        self._name = None
+        self._field = None
+        self._file = None
+
+    def start_part(self, headers):
+        disposition, options = _parse_option_header(headers.get("content-disposition", ""))
+        if disposition != "form-data" or "name" not in options:
+            raise UploadError("multipart 缺少字段名")
+        self._name = options["name"]
+        filename = options.get("filename")
+        if filename is None:
+            self._field = bytearray()
+            self._file = None
+            return
+        if len(self.files) >= self.limits.max_files:
+            raise UploadTooLarge(f"上传文件数量超过{self.limits.max_files}个")
+        self._file = UploadedFile(self._name, filename, headers.get("content-type"), self.limits.spool_size)
+        self.files.append(self._file)
+        self._field = None
+
+    def part_data(self, data):
+        if self._file is not None:
+            if self._file.size + len(data) > self.limits.max_file_size:
+                raise UploadTooLarge(f"文件{self._file.filename}超过大小限制")
+            self._file.write(data)
+        else:
+            if len(self._field) + len(data) > self.limits.max_field_size:
+                raise UploadTooLarge(f"字段{self._name}超过大小限制")
+            self._field += data
+
+    def end_part(self):
+        if self._file is not None:
+            # 文件可能还有未写出的数据，全部写出后由 params_from_stream 调用 seek(0)
+            value = self._file
+        else:
+            value = self._field.decode("utf-8", errors="replace")
+        self._add(self._name, value)
+        self._name = self._field = self._file = None
+
+    def _add(self, name, value):
+        if name not in self.params:
+            self.params[name] = value
+        elif isinstance(self.params[name], list):
+            self.params[name].append(value)
+        else:
+            self.params[name] = [self.params[name], value]
+
+
+async def params_from_stream(request, limits: UploadLimits = None) -> dict:
+    """
+    从 stream=True 的路由中边接收边解析请求体，返回参数字典（查询参数 + 表单字段 + 文件）
+    multipart 中的文件以 UploadedFile 返回，调用方负责在请求结束后调用 close_uploads 关闭
+    非 multipart 的请求体（JSON、MessagePack、urlencoded）按 max_field_size 限制大小后整体解析
+    超过限制时抛出 UploadTooLarge，格式错误时抛出 UploadError
+    """
+    limits = limits or UploadLimits()
+    params = {}
+    if isinstance(request.args, dict):
+        for key in request.args:
+            params[key] = request.args.get(key)
+
+    # stream=True 的路由允许在处理函数中调整请求体上限，由这里的限制代替 sanic 全局的 REQUEST_MAX_SIZE
+    request.stream.request_max_size = limits.max_total_size
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limits.max_total_size:
+        raise UploadTooLarge("请求体超过大小限制")
+
+    content_type, options = _parse_option_header(request.headers.get("content-type", ""))
+    if content_type == "multipart/form-data":
+        boundary = options.get("boundary")
+        if not boundary:
+            raise UploadError("multipart 缺少 boundary")
+        collector = _FormCollector(limits)
+        parser = MultipartParser(boundary.encode("latin-1"), collector)
+
+        async def feed(chunk):
+            parser.feed(chunk)
+            for uploaded in collector.files:
+                if uploaded.pending:
+                    await asyncio.to_thread(uploaded.flush)
+
+        try:
+            await _read_stream(request, limits.max_total_size, feed)
+            parser.close()
+            for uploaded in collector.files:
+                uploaded.seek(0)
+        except BaseException:
+            close_uploads(collector.params)
+            for uploaded in collector.files:
+                uploaded.close()
+            raise
+        params.update(collector.params)
+        return params
+
+    body = bytearray()
+
+    async def append(data):
+        if len(body) + len(data) > limits.max_field_size:
+            raise UploadTooLarge("请求体超过大小限制")
+        body.extend(data)
+
+    await _read_stream(request, limits.max_field_size, append)
+    if content_type == "application/x-www-form-urlencoded":
+        for key, value in parse_qsl(to_string(bytes(body)), keep_blank_values=True):
+            params[key] = value
+    elif body and is_msgpack(content_type):
+        try:
+            body_dict = dg_msgpack_loads(bytes(body))
+        except Exception:
+            raise UploadError("请求体不是有效的MessagePack") from None
+        if isinstance(body_dict, dict):
+            params.update(body_dict)
+    elif body:
+        try:
+            body_dict = dg_json_loads(to_string(bytes(body)))
+        except ValueError:
+            raise UploadError("请求体不是有效的JSON") from None
+        if isinstance(body_dict, dict):
+            params.update(body_dict)
+    return params
+
+
+def close_uploads(params):
+    """
+    关闭参数中的所有 UploadedFile，删除对应的临时文件
+    """
+    if not isinstance(params, dict):
+        return
+    for value in params.values():
+        for item in value if isinstance(value, list) else (value,):
+            if isinstance(item, UploadedFile):
+                item.close()
+
+
+async def _read_stream(request, max_size, consume):
+    received = 0
+    while True:
+        chunk = await request.stream.read()
+        if chunk is None:
+            return
+        received += len(chunk)
+        if received > max_size:
+            raise UploadTooLarge("请求体超过大小限制")
+        await consume(chunk)
+
+
+def _parse_headers(raw: bytes) -> dict:
+    headers = {}
+    for line in raw.decode("utf-8", errors="replace").split("\r\n"):
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def _parse_option_header(value):
+    """
+    解析 Content-Type / Content-Disposition 形式的头部，返回 (主值, 参数字典)
+    支持 RFC 5987 的 filename*=UTF-8''... 写法
+    """
+    main, _, rest = value.partition(";")
+    options = {}
+    for key, raw in _PARAM_PATTERN.findall(f";{rest}"):
+        key = key.lower()
+        raw = raw.strip()
+        if raw.startswith('"') and raw.endswith('"'):
+            raw = raw[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+        if key.endswith("*"):
+            charset, _, encoded = raw.partition("''")
+            key = key[:-1]
+            raw = unquote(encoded, encoding=charset or "utf-8", errors="replace")
+        options[key] = raw
+    return main.strip().lower(), options
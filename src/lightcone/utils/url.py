@@ -1,9 +1,14 @@
-from urllib.parse import urlparse, urlencode, parse_qs
+from urllib.parse import urlparse, urlencode, parse_qs, quote_plus
 
 from gramai.utils import is_str
 
 
 class URL(str):
+    """
+    URL只在构造时解析一次，序列化结果缓存到属性被修改或 set_param 为止
+    修改参数请使用 set_param，直接修改 query_dict 不会刷新缓存
+    """
+
     def __new__(cls, url=None, scheme=None, host=None, port=None, path=None, fragment=None):
         obj = super().__new__(cls, url)
         _parsed = urlparse(url)
@@ -12,19 +17,15 @@ class URL(str):
         obj._port = port if port is not None else _parsed.port
         obj._path = path if is_str(path) else _parsed.path
         obj._fragment = fragment if is_str(fragment) else _parsed.fragment
-
+        obj._query_dict = obj._parse_query_to_dict(_parsed.query)
+        # 缓存的 query 和完整URL，None表示需要重新生成
+        obj._query = None
+        obj._unparsed = None
         return obj
 
     def __init__(self, url=None, scheme=None, host=None, port=None, path=None, fragment=None):
+        # 已在 __new__ 中完成解析
         super().__init__()
-        _parsed = urlparse(url)
-        self._scheme = scheme if is_str(scheme) else _parsed.scheme
-        self._host = host if is_str(host) else _parsed.hostname
-        self._port = port if port is not None else _parsed.port
-        self._path = path if is_str(path) else _parsed.path
-        self._fragment = fragment if is_str(fragment) else _parsed.fragment
-        self._query = _parsed.query if _parsed is not None else ""
-        self._query_dict = self._parse_query_to_dict(self._query)
 
     def __str__(self):
         return self._unparse_url()
@@ -38,9 +39,15 @@ class URL(str):
                 self._query_dict[key] = value
             elif key in self.query_dict:
                 self._query_dict.pop(key)
-        self._query = urlencode(self.query_dict)
+        self._invalidate(query=True)
         return self
 
+    def template(self, *params) -> "URLTemplate":
+        """
+        以当前URL为模版，生成只有 params 中的参数不同的URL
+        """
+        return URLTemplate(self, params)
+
     def get_param(self, key) -> str:
         return self.query_dict.get(key, None)
 
@@ -60,6 +67,7 @@ class URL(str):
     @scheme.setter
     def scheme(self, value):
         self._scheme = value
+        self._invalidate()
 
     @property
     def host(self) -> str:
@@ -68,6 +76,7 @@ class URL(str):
     @host.setter
     def host(self, value):
         self._host = value
+        self._invalidate()
 
     @property
     def port(self) -> str:
@@ -76,6 +85,7 @@ class URL(str):
     @port.setter
     def port(self, value):
         self._port = value
+        self._invalidate()
 
     @property
     def path(self) -> str:
@@ -85,10 +95,13 @@ class URL(str):
     def path(self, value):
         _path = value.rstrip("/").strip("/")
         self._path = f"/{value}"
+        self._invalidate()
 
     @property
     def query(self) -> str:
-        return urlencode(self.query_dict)
+        if self._query is None:
+            self._query = urlencode(self.query_dict)
+        return self._query
 
     @query.setter
     def query(self, value):
@@ -101,13 +114,28 @@ class URL(str):
     @fragment.setter
     def fragment(self, value):
         self._fragment = value
+        self._invalidate()
 
     @staticmethod
     def _parse_query_to_dict(query):
         parsed_query = parse_qs(query)
         return {k: v[0] if len(v) == 1 else v for k, v in parsed_query.items()}
 
+    def _invalidate(self, query=False):
+        if query:
+            self._query = None
+        self._unparsed = None
+
     def _unparse_url(self):
+        if self._unparsed is None:
+            self._unparsed = self._unparse_url_without_query()
+            if is_str(self.query, False):
+                self._unparsed += f"?{self.query}"
+            if is_str(self._fragment, False):
+                self._unparsed += f"#{self._fragment}"
+        return self._unparsed
+
+    def _unparse_url_without_query(self):
         _parsed = ""
         if is_str(self._scheme, False):
             _parsed += self._scheme
@@ -117,8 +145,46 @@ class URL(str):
             _parsed += f":{str(self._port)}"
         if is_str(self._path, False):
             _parsed += f"/{self._path.strip('/').rstrip('/')}"
-        if is_str(self.query, False):
-            _parsed += f"?{self.query}"
-        if is_str(self._fragment, False):
-            _parsed += f"#{self._fragment}"
         return _parsed
+
+
+class URLTemplate:
+    """
+    编译好的URL模版，用于批量生成只有少数参数不同的URL（如分页链接）
+    除 params 外的部分只序列化一次，每次 build 只编码变化的参数，编码方式与 URL.query 相同
+    变化的参数按 params 的顺序追加在固定参数之后（原URL中已有的同名参数被替换），值为None的参数不输出
+        template = URL("https://example.com/list?size=20").template("page")
+        links = template.build_many({"page": page} for page in range(1, 100))
+    """
+
+    def __init__(self, url, params=()):
+        base = url if isinstance(url, URL) else URL(url)
+        self._params = tuple(params)
+        self._keys = tuple(f"{quote_plus(str(param))}=" for param in self._params)
+        static_query = urlencode({k: v for k, v in base.query_dict.items() if k not in self._params})
+        self._prefix = base._unparse_url_without_query()  # noqa
+        self._static_query = static_query
+        self._fragment = f"#{base.fragment}" if is_str(base.fragment, False) else ""
+
+    @property
+    def params(self) -> tuple:
+        return self._params
+
+    def build(self, **values) -> str:
+        query = self._static_query
+        for param, key in zip(self._params, self._keys):
+            value = values.get(param)
+            if value is None:
+                continue
+            pair = key + quote_plus(value if isinstance(value, str) else str(value))
+            query = f"{query}&{pair}" if query else pair
+        if query:
+            return f"{self._prefix}?{query}{self._fragment}"
+        return f"{self._prefix}{self._fragment}"
+
+    def build_many(self, rows) -> list:
+        """
+        rows 为参数字典的可迭代对象，返回URL字符串列表
+        """
+        build = self.build
+        return [build(**row) for row in rows]
@@ -0,0 +1,13 @@
+"""
+测试在 tests/config 目录下读取配置（lightcone 在第一次使用时按当前目录读取），lightcone 未安装时从 src 导入
+"""
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+os.chdir(os.path.join(TESTS_DIR, "config"))
+try:
+    import lightcone  # noqa
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "src"))
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+from lightcone.gate.base.admission import CommandLimiter, TokenBucket, REASON_RATE, REASON_CALLER_RATE
+
+
+def test_token_bucket_take_and_refund():
+    bucket = TokenBucket(rate=0.001, burst=1)
+    assert bucket.take() == 0
+    assert bucket.take() > 0
+    bucket.refund()
+    assert bucket.take() == 0
+
+
+def test_refund_is_capped_at_burst():
+    bucket = TokenBucket(rate=0.001, burst=1)
+    bucket.refund()
+    bucket.refund()
+    assert bucket.take() == 0
+    assert bucket.take() > 0
+
+
+def test_command_rate_rejection_refunds_caller_token():
+    limiter = CommandLimiter("rate", {"rate": 0.001, "burst": 1, "caller_key": "uid",
+                                      "caller_rate": 0.001, "caller_burst": 1})
+    assert limiter.check_rate({"uid": "a"}) == (None, None)
+    # 指令整体的令牌已用完，调用方 b 的令牌应归还
+    reason, retry_after = limiter.check_rate({"uid": "b"})
+    assert reason == REASON_RATE and retry_after > 0
+    limiter.bucket.refund()
+    assert limiter.check_rate({"uid": "b"}) == (None, None)
+    assert limiter.check_rate({"uid": "b"})[0] == REASON_CALLER_RATE
+
+
+def test_release_hands_slot_to_earliest_waiter():
+    limiter = CommandLimiter("fifo", {"concurrency": 1})
+    assert limiter.try_acquire()
+    order = []
+
+    def wait(name):
+        if limiter.acquire(5):
+            order.append(name)
+            time.sleep(0.01)
+            limiter.release()
+
+    threads = []
+    for name in ("first", "second", "third"):
+        thread = threading.Thread(target=wait, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # 等待线程进入排队，保证排队顺序
+        while len(limiter._waiters) < len(threads):
+            time.sleep(0.001)
+    # 有排队者时新的调用不能插队
+    assert not limiter.try_acquire()
+    limiter.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["first", "second", "third"]
+    assert limiter._in_flight == 0
+
+
+def test_acquire_timeout_leaves_queue():
+    limiter = CommandLimiter("timeout", {"concurrency": 1})
+    assert limiter.try_acquire()
+    assert not limiter.acquire(0.01)
+    assert not limiter._waiters
+    limiter.release()
+    assert limiter._in_flight == 0
+
+
+def test_async_acquire_cancelled_after_grant_releases_slot():
+    limiter = CommandLimiter("cancel", {"concurrency": 1})
+
+    async def main():
+        assert limiter.try_acquire()
+        waiter = asyncio.create_task(limiter.async_acquire(5))
+        await asyncio.sleep(0)
+        # 名额交给排队者后、排队者恢复执行前被取消，名额需要归还
+        limiter.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(main())
+    assert limiter._in_flight == 0
+    assert not limiter._waiters
+    assert limiter.try_acquire()
@@ -0,0 +1,55 @@
+import json
+import sys
+
+import pytest
+
+import lightcone  # noqa
+from lightcone.utils.config import ConfigError, LazyConfig
+
+bootstrap = sys.modules["lightcone.bootstrap"]
+
+COMMANDS = {
+    "valid": {"module": "lightcone.core", "class": "Command"},
+    "missing": {"module": "tests_missing_module", "class": "Missing"},
+    "not_class": {"module": "os", "class": "sep"},
+    "not_command": {"module": "json", "class": "JSONDecoder"},
+}
+
+
+@pytest.fixture
+def commands(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "commands.json").write_text(json.dumps(COMMANDS))
+    config = LazyConfig("commands.json")
+    monkeypatch.setattr(bootstrap, "command_config", config)
+    return config
+
+
+def test_to_dict_reads_config(commands):
+    assert commands.to_dict() == COMMANDS
+
+
+def test_to_dict_raises_when_unreadable(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ConfigError):
+        LazyConfig("missing.json").to_dict()
+    (tmp_path / "list.json").write_text("[1, 2]")
+    with pytest.raises(ConfigError):
+        LazyConfig("list.json").to_dict()
+
+
+def test_load_commands_reports_each_failure(commands):
+    errors = []
+    assert bootstrap._load_commands(errors) == 1
+    assert len(errors) == 3
+    assert all(error.startswith("command ") for error in errors)
+
+
+def test_load_commands_survives_loader_exceptions(commands, monkeypatch):
+    def broken(module, name, *args):
+        raise ImportError(f"cannot import {module}")
+
+    monkeypatch.setattr(bootstrap, "load_class", broken)
+    errors = []
+    assert bootstrap._load_commands(errors) == 0
+    assert len(errors) == len(COMMANDS)
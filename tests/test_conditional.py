@@ -0,0 +1,37 @@
+from lightcone.gate.base.conditional import ConditionalRequest, body_etag, etag_matches, version_etag
+from lightcone.gate.base.response import CommandResponse, CommandResponseCode
+from lightcone.gate.rest import REST
+from lightcone.utils.msgpackencoder import msgpack_available
+
+ETAG = version_etag("user.get", "get", {"id": 1}, 3)
+
+
+def test_etag_matches_weak_and_encoded_variants():
+    assert etag_matches(ETAG, ETAG)
+    assert etag_matches(f"W/{ETAG}", ETAG)
+    assert etag_matches(f'"other", {ETAG[:-1]}-gzip"', ETAG)
+    assert etag_matches("*", ETAG)
+    assert not etag_matches(body_etag(b"other"), ETAG)
+
+
+def test_msgpack_representation_has_its_own_etag():
+    json_request = ConditionalRequest(ETAG, binary=False)
+    msgpack_request = ConditionalRequest(ETAG, binary=True)
+    msgpack_etag = msgpack_request.representation_etag(ETAG)
+    assert msgpack_etag == f'{ETAG[:-1]}-msgpack"'
+    assert msgpack_request.representation_etag(f"W/{ETAG}") == f"W/{msgpack_etag}"
+    assert json_request.matches(ETAG)
+    assert not msgpack_request.matches(ETAG)
+    assert ConditionalRequest(msgpack_etag, binary=True).matches(ETAG)
+    assert not ConditionalRequest(msgpack_etag, binary=False).matches(ETAG)
+
+
+def test_not_modified_response_varies_on_accept():
+    response = CommandResponse(CommandResponseCode.NOT_MODIFIED)
+    response.etag = ETAG
+    conditional = ConditionalRequest(f'{ETAG[:-1]}-msgpack"', binary=True)
+    http_response = REST._to_http_response("user.get", "get", response, conditional, binary=True)
+    assert http_response.status == 304
+    assert http_response.headers["ETag"] == f'{ETAG[:-1]}-msgpack"'
+    if msgpack_available():
+        assert http_response.headers["Vary"] == "Accept"
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+from lightcone.gate.base.gate import Gate
+from lightcone.gate.base.lane import Lane
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_try_enqueue_accepts_idle_workers_and_queue():
+    lane = Lane("enqueue", workers=2, max_queue=1)
+    assert [lane.try_enqueue() for _ in range(4)] == [True, True, True, False]
+    assert lane._waiting == 3
+
+
+def test_slot_releases_running_count():
+    lane = Lane("slot", workers=1)
+
+    async def main():
+        assert lane.try_enqueue()
+        async with lane.slot():
+            assert (lane._waiting, lane._running) == (0, 1)
+
+    run(main())
+    assert (lane._waiting, lane._running) == (0, 0)
+
+
+def test_cancel_while_waiting_for_slot_leaves_queue():
+    lane = Lane("cancel-slot", workers=1, max_queue=2)
+
+    async def hold(started, release):
+        assert lane.try_enqueue()
+        async with lane.slot():
+            started.set()
+            await release.wait()
+
+    async def queued():
+        assert lane.try_enqueue()
+        async with lane.slot():
+            pass
+
+    async def main():
+        started, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(started, release))
+        await started.wait()
+        waiters = [asyncio.create_task(queued()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert lane._waiting == 2
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        release.set()
+        await holder
+
+    run(main())
+    assert (lane._waiting, lane._running) == (0, 0)
+
+
+def test_wait_for_zero_timeout_does_not_leak_queue_slots(monkeypatch):
+    # wait_for(..., 0) 可能在协程开始执行前就取消，Gate 必须在被执行的协程内部进入排队
+    lane = Lane("wait-for", workers=2, max_queue=1)
+
+    async def evaluate(cmd, param, method):
+        return "ok"
+
+    monkeypatch.setattr(Gate, "_async_eval", evaluate)
+
+    async def main():
+        for _ in range(3):
+            try:
+                await asyncio.wait_for(Gate._async_eval_in_lane(lane, None, {}, "get"), 0)
+            except asyncio.TimeoutError:
+                pass
+        return await Gate._async_eval_in_lane(lane, None, {}, "get")
+
+    assert run(main()) == "ok"
+    assert (lane._waiting, lane._running) == (0, 0)
+
+
+def test_run_sync_cancelled_before_start_leaves_queue():
+    lane = Lane("cancel-sync", workers=1, max_queue=1)
+
+    async def main():
+        gate = threading.Event()
+        assert lane.try_enqueue()
+        blocking = asyncio.ensure_future(lane.run_sync(gate.wait))
+        await asyncio.sleep(0.05)
+        assert lane.try_enqueue()
+        queued = asyncio.ensure_future(lane.run_sync(lambda: None))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert lane._waiting == 0
+        gate.set()
+        await blocking
+
+    run(main())
+    assert (lane._waiting, lane._running) == (0, 0)
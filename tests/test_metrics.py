@@ -0,0 +1,96 @@
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from lightcone.utils import metrics
+from lightcone.utils.metrics import MetricsRegistry, metrics_allowed
+
+
+class Config:
+    def __init__(self, **values):
+        self._values = {key.replace("_", ".", 1): value for key, value in values.items()}
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+
+class Request:
+    def __init__(self, headers=None, ip="127.0.0.1"):
+        self.headers = headers or {}
+        self.ip = ip
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = MetricsRegistry()
+    registry._directory = str(tmp_path / "metrics")
+    return registry
+
+
+def test_concurrent_updates_are_not_lost(registry):
+    counter = registry.counter("test_total", "test", ("kind",))
+    histogram = registry.histogram("test_seconds", "test", ("kind",))
+
+    def update():
+        for _ in range(20000):
+            counter.inc(("a",))
+            histogram.observe(("a",), 0.01)
+
+    threads = [threading.Thread(target=update) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter._samples[("a",)] == 160000
+    assert histogram._samples[("a",)][2] == 160000
+
+
+def test_snapshot_copies_histogram_samples(registry):
+    histogram = registry.histogram("copy_seconds", "test")
+    histogram.observe((), 0.01)
+    snapshot = registry.snapshot()
+    histogram.observe((), 0.01)
+    assert snapshot["copy_seconds"]["samples"][0][1][2] == 1
+
+
+def test_dump_writes_private_files(registry):
+    registry.counter("dump_total", "test").inc()
+    registry.dump()
+    directory = registry.directory
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    with open(path) as f:
+        assert json.load(f)["dump_total"]["samples"] == [[[], 1]]
+
+
+def test_dump_does_not_follow_symlink(registry, tmp_path):
+    os.makedirs(registry.directory, mode=0o700)
+    target = tmp_path / "target"
+    os.symlink(target, os.path.join(registry.directory, f"{os.getpid()}.json.tmp"))
+    with pytest.raises(OSError):
+        registry.dump()
+    assert not target.exists()
+
+
+def test_endpoint_denied_by_default(monkeypatch):
+    monkeypatch.setattr(metrics, "PROJ", Config())
+    assert not metrics_allowed(Request())
+
+
+def test_endpoint_allow_local(monkeypatch):
+    monkeypatch.setattr(metrics, "PROJ", Config(metrics_allow_local="true"))
+    assert metrics_allowed(Request())
+    assert not metrics_allowed(Request(ip="10.0.0.1"))
+    assert not metrics_allowed(Request({"x-forwarded-for": "10.0.0.1"}))
+
+
+def test_endpoint_token(monkeypatch):
+    monkeypatch.setattr(metrics, "PROJ", Config(metrics_token="secret", metrics_allow_local="true"))
+    assert metrics_allowed(Request({"authorization": "Bearer secret"}, ip="10.0.0.1"))
+    assert not metrics_allowed(Request({"authorization": "Bearer wrong"}))
+    # 配置了 token 后本机访问也需要 token
+    assert not metrics_allowed(Request())
@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+from lightcone.database.mysql import apply_execution_deadline
+from lightcone.utils.deadline import DeadlineExceeded, deadline_scope
+
+
+def test_select_gets_execution_hint():
+    with deadline_scope(5):
+        sql = apply_execution_deadline("SELECT id FROM user")
+    assert sql.startswith("SELECT /*+ MAX_EXECUTION_TIME(")
+    assert sql.endswith("*/ id FROM user")
+
+
+def test_without_deadline_sql_is_unchanged():
+    assert apply_execution_deadline("SELECT 1") == "SELECT 1"
+
+
+@pytest.mark.parametrize("sql", ["SELECT 1", "INSERT INTO t VALUES (1)", "UPDATE t SET a = 1", "DELETE FROM t"])
+def test_expired_deadline_refuses_statements(sql):
+    with deadline_scope(0.001):
+        time.sleep(0.01)
+        with pytest.raises(DeadlineExceeded):
+            apply_execution_deadline(sql)
+
+
+@pytest.mark.parametrize("sql", ["ROLLBACK", "rollback to savepoint s1", "RELEASE SAVEPOINT s1", "SAVEPOINT s1",
+                                 "COMMIT", "BEGIN", "START TRANSACTION", "SET autocommit = 1"])
+def test_expired_deadline_allows_transaction_control(sql):
+    with deadline_scope(0.001):
+        time.sleep(0.01)
+        assert apply_execution_deadline(sql) == sql
@@ -0,0 +1,68 @@
+import uuid
+
+from peewee import CharField, IntegerField, Model, MySQLDatabase, SqliteDatabase, UUIDField
+
+from lightcone.database.negativecache import AbsentCache, BloomFilter, _build_cache, fold_key, normalize_key
+
+
+class CaseInsensitive(Model):
+    name = CharField()
+    code = CharField(collation="utf8mb4_bin")
+    count = IntegerField()
+
+    class Meta:
+        database = MySQLDatabase(None)
+
+
+class Bytewise(Model):
+    name = CharField()
+    token = UUIDField()
+
+    class Meta:
+        database = SqliteDatabase(None)
+
+
+def test_normalize_key_unifies_equivalent_values():
+    assert normalize_key(CaseInsensitive.count, 1) == normalize_key(CaseInsensitive.count, "1")
+    value = uuid.uuid4()
+    assert normalize_key(Bytewise.token, value) == normalize_key(Bytewise.token, value.hex)
+
+
+def test_absent_cache_ttl_and_present():
+    cache = AbsentCache(ttl=60)
+    cache.record_absent("a")
+    assert cache.known_absent("a")
+    cache.record_present("a")
+    assert not cache.known_absent("a")
+    cache.record_absent("b")
+    cache.clear()
+    assert not cache.known_absent("b")
+
+
+def test_absent_cache_evicts_oldest():
+    cache = AbsentCache(ttl=60, max_size=2)
+    for value in ("a", "b", "c"):
+        cache.record_absent(value)
+    assert [cache.known_absent(value) for value in ("a", "b", "c")] == [False, True, True]
+
+
+def test_folded_absent_cache_invalidates_collation_equivalents():
+    cache = AbsentCache(ttl=60, fold=fold_key)
+    cache.record_absent("abc")
+    cache.record_absent("cafe")
+    cache.record_absent("other")
+    cache.record_present("ABC ")
+    cache.record_present("Café")
+    assert not cache.known_absent("abc")
+    assert not cache.known_absent("cafe")
+    assert cache.known_absent("other")
+    # 精确的值才命中，折叠只用于失效
+    assert not cache.known_absent("OTHER")
+
+
+def test_collation_selects_cache():
+    assert _build_cache(CaseInsensitive, "name", {})._fold is fold_key
+    assert _build_cache(CaseInsensitive, "code", {})._fold is None
+    assert _build_cache(CaseInsensitive, "count", {})._fold is None
+    assert isinstance(_build_cache(CaseInsensitive, "name", {"type": "bloom", "capacity": 100}), AbsentCache)
+    assert isinstance(_build_cache(Bytewise, "name", {"type": "bloom", "capacity": 100}), BloomFilter)
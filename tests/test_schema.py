@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+from lightcone.gate.base.schema import SchemaError, compile_schema
+from lightcone.utils.tools import params_dict_from_request
+
+SCHEMA = {
+    "page": {"type": "int", "default": 1, "min": 1},
+    "uid": {"type": "str", "required": True},
+    "status": {"type": "str", "choices": ["open", "closed"]},
+    "ids": {"type": "list", "items": "int", "max": 3},
+    "filter": {"type": "json", "schema": {"start": "datetime"}},
+    "name": "str",
+}
+
+
+def test_converts_and_fills_defaults():
+    validate = compile_schema(SCHEMA)
+    result = validate({"uid": "u1", "ids": ["1", 2], "filter": '{"start": 1704164645}', "extra": "x"})
+    assert result["page"] == 1
+    assert result["ids"] == [1, 2]
+    assert result["filter"]["start"] == datetime.fromtimestamp(1704164645)
+    assert result["extra"] == "x"
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"uid": "u1", "page": 0},
+    {"uid": "u1", "page": "abc"},
+    {"uid": "u1", "status": "deleted"},
+    {"uid": "u1", "ids": [1, 2, 3, 4]},
+    {"uid": "u1", "filter": "not json"},
+])
+def test_rejects_invalid_params(params):
+    with pytest.raises(SchemaError):
+        compile_schema(SCHEMA)(params)
+
+
+@pytest.mark.parametrize("schema", [
+    {"flag": {"type": "bool", "min": 1}},
+    {"data": {"type": "json", "max": 1}},
+    {"data": {"type": "dict", "choices": [{}]}},
+    {"value": {"type": "unknown"}},
+])
+def test_rejects_invalid_declarations(schema):
+    with pytest.raises(SchemaError):
+        compile_schema(schema)
+
+
+class Request:
+    def __init__(self, args):
+        self.args = args
+        self.form = {}
+        self.body = b""
+        self.headers = {}
+
+
+def test_parse_json_raises_on_invalid_json():
+    assert params_dict_from_request(Request({"a": '{"b": 1}'}), parse_json=True) == {"a": {"b": 1}}
+    with pytest.raises(ValueError):
+        params_dict_from_request(Request({"a": "plain"}), parse_json=True)
@@ -0,0 +1,87 @@
+import os
+import stat
+
+import pytest
+
+from lightcone.utils.sharedcache import SharedCache, WAYS
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SharedCache("test", slots=WAYS * 4, slot_size=256, directory=str(tmp_path / "cache"))
+    yield cache
+    cache.close()
+
+
+def test_set_get_delete(cache):
+    assert cache.get("missing", "default") == "default"
+    assert cache.set("key", {"a": [1, 2]}, 60)
+    assert cache.get("key") == {"a": [1, 2]}
+    assert cache.set("key", "replaced", 60)
+    assert cache.get("key") == "replaced"
+    cache.delete("key")
+    assert cache.get("key") is None
+
+
+def test_expired_entries_are_misses(cache):
+    cache.set("key", "value", -1)
+    assert cache.get("key") is None
+
+
+def test_oversize_value_is_not_cached(cache):
+    assert not cache.set("key", b"x" * 1024, 60)
+    assert cache.get("key") is None
+
+
+def test_full_set_evicts_within_capacity(cache):
+    keys = [f"key-{i}" for i in range(cache.slots * 3)]
+    for key in keys:
+        assert cache.set(key, key, 60)
+    cached = [key for key in keys if cache.get(key) == key]
+    assert 0 < len(cached) <= cache.slots
+    # 最后写入的key一定还在
+    assert cache.get(keys[-1]) == keys[-1]
+    assert cache.stats()["used"] == len(cached)
+
+
+def test_clear(cache):
+    cache.set("key", "value", 60)
+    cache.clear()
+    assert cache.get("key") is None
+    assert cache.stats()["used"] == 0
+
+
+def test_shared_between_instances(cache, tmp_path):
+    other = SharedCache("test", slots=WAYS * 4, slot_size=256, directory=str(tmp_path / "cache"))
+    try:
+        cache.set("key", "value", 60)
+        assert other.get("key") == "value"
+    finally:
+        other.close()
+
+
+def test_file_is_private(cache):
+    assert stat.S_IMODE(os.stat(os.path.dirname(cache.path)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache.path).st_mode) & 0o077 == 0
+
+
+def test_slot_layout_change_uses_new_file(cache, tmp_path):
+    cache.set("key", "value", 60)
+    other = SharedCache("test", slots=WAYS * 8, slot_size=256, directory=str(tmp_path / "cache"))
+    try:
+        assert other.path != cache.path
+        assert other.get("key") is None
+        assert cache.get("key") == "value"
+    finally:
+        other.close()
+
+
+def test_rejects_symlinked_file(tmp_path):
+    directory = tmp_path / "cache"
+    first = SharedCache("test", slots=WAYS, slot_size=256, directory=str(directory))
+    path = first.path
+    first.close()
+    os.unlink(path)
+    os.symlink(tmp_path / "target", path)
+    with pytest.raises(OSError):
+        SharedCache("test", slots=WAYS, slot_size=256, directory=str(directory))
@@ -0,0 +1,65 @@
+import json
+import os
+import stat
+
+import pytest
+
+from lightcone.utils.tracing import Tracer, parse_traceparent, span
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer()
+    tracer.enable(sample_rate=1, directory=str(tmp_path / "traces"))
+    monkeypatch.setattr("lightcone.utils.tracing.TRACER", tracer)
+    yield tracer
+    tracer.disable()
+
+
+def read_traces(tracer):
+    path = os.path.join(tracer.directory, f"traces-{os.getpid()}.jsonl")
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_parse_traceparent():
+    context = parse_traceparent(f"00-{'a' * 32}-{'b' * 16}-01")
+    assert (context.trace_id, context.span_id, context.sampled) == ("a" * 32, "b" * 16, True)
+    assert parse_traceparent(f"00-{'0' * 32}-{'b' * 16}-01") is None
+    assert parse_traceparent("garbage") is None
+
+
+def test_traces_are_written_in_background_to_private_file(tracer):
+    for index in range(20):
+        with tracer.start_trace(f"request {index}"):
+            with span("child"):
+                pass
+    tracer.close()
+    traces = read_traces(tracer)
+    assert len(traces) == 20
+    spans = traces[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [item["name"] for item in spans] == ["request 0", "child"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    path = os.path.join(tracer.directory, f"traces-{os.getpid()}.jsonl")
+    assert stat.S_IMODE(os.stat(tracer.directory).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_unsampled_upstream_is_not_recorded(tracer):
+    with tracer.start_trace("request", f"00-{'a' * 32}-{'b' * 16}-00") as root:
+        assert root is None
+    tracer.close()
+    assert not os.path.exists(os.path.join(tracer.directory, f"traces-{os.getpid()}.jsonl"))
+
+
+def test_full_queue_drops_traces(tracer):
+    tracer._queue_size = 1
+    tracer.close()
+    traces = tracer._ensure_thread()
+    # 写线程来不及取走时，队列满后的trace被丢弃而不是阻塞请求
+    for index in range(100):
+        with tracer.start_trace(f"request {index}"):
+            pass
+    assert traces.qsize() <= 1
+    tracer.close()
+    assert 1 <= len(read_traces(tracer)) <= 100
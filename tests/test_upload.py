@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from lightcone.utils.upload import (MultipartParser, UploadError, UploadLimits, UploadTooLarge, UploadedFile,
+                                    close_uploads, params_from_stream)
+
+BOUNDARY = "----lightcone-boundary"
+FILE_CONTENT = b"\r\n--" + b"x" * 300 + b"\r\n----lightcone-bound" + b"y" * 300
+
+
+def multipart_body():
+    return (f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="title"\r\n\r\n'
+            f"hello\r\n"
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + FILE_CONTENT + \
+        f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def limits(**options):
+    values = {"max_file_size": 4096, "max_total_size": 8192, "max_field_size": 1024, "max_files": 2,
+              "spool_size": 128}
+    values.update(options)
+    return UploadLimits(**values)
+
+
+class Recorder:
+    def __init__(self):
+        self.parts = []
+
+    def start_part(self, headers):
+        self.parts.append([headers, b""])
+
+    def part_data(self, data):
+        self.parts[-1][1] += data
+
+    def end_part(self):
+        pass
+
+
+class Stream:
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self.request_max_size = None
+
+    async def read(self):
+        return self._chunks.pop(0) if self._chunks else None
+
+
+class StreamRequest:
+    def __init__(self, body, chunk_size, headers=None):
+        self.args = {"__command_id": "upload"}
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        self.headers.update(headers or {})
+        self.stream = Stream(body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 23, 64, 1 << 16])
+def test_parser_handles_boundary_split_across_chunks(chunk_size):
+    body = multipart_body()
+    recorder = Recorder()
+    parser = MultipartParser(BOUNDARY.encode(), recorder)
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start:start + chunk_size])
+    parser.close()
+    assert [data for _, data in recorder.parts] == [b"hello", FILE_CONTENT]
+    assert recorder.parts[1][0]["content-type"] == "application/octet-stream"
+
+
+def test_parser_rejects_truncated_body():
+    body = multipart_body()
+    parser = MultipartParser(BOUNDARY.encode(), Recorder())
+    parser.feed(body[:-10])
+    with pytest.raises(UploadError):
+        parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [3, 100])
+def test_params_from_stream_spools_file(chunk_size):
+    params = asyncio.run(params_from_stream(StreamRequest(multipart_body(), chunk_size), limits()))
+    try:
+        assert params["title"] == "hello"
+        uploaded = params["file"]
+        assert isinstance(uploaded, UploadedFile)
+        assert (uploaded.filename, uploaded.size) == ("a.bin", len(FILE_CONTENT))
+        assert not uploaded.pending
+        assert uploaded.read() == FILE_CONTENT
+    finally:
+        close_uploads(params)
+
+
+def test_params_from_stream_enforces_file_size():
+    request = StreamRequest(multipart_body(), 64)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(params_from_stream(request, limits(max_file_size=100)))
+
+
+def test_uploaded_file_defers_spill_to_flush():
+    uploaded = UploadedFile("file", "a.bin", None, spool_size=4)
+    uploaded.write(b"ab")
+    assert not uploaded.pending
+    uploaded.write(b"cdef")
+    assert uploaded.pending
+    uploaded.flush()
+    uploaded.seek(0)
+    assert uploaded.read() == b"abcdef"
+    uploaded.close()
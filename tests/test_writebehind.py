@@ -0,0 +1,97 @@
+import os
+
+import pytest
+from peewee import IntegerField, Model, OperationalError, SqliteDatabase
+
+from lightcone.database.writebehind import WriteBehindBuffer
+
+DATABASE = SqliteDatabase(None)
+
+
+class Counter(Model):
+    value = IntegerField(default=0)
+
+    class Meta:
+        database = DATABASE
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    DATABASE.init(str(tmp_path / "writebehind.db"))
+    DATABASE.create_tables([Counter])
+    Counter.create(value=0)
+    buffer = WriteBehindBuffer(Counter, interval=60, max_retries=2)
+    yield buffer
+    DATABASE.close()
+
+
+def fail(times, flush):
+    remaining = [times]
+
+    def flaky(counters):
+        if remaining[0]:
+            remaining[0] -= 1
+            raise OperationalError("database is down")
+        return flush(counters)
+
+    return flaky
+
+
+def test_flush_merges_increments(buffer):
+    buffer.add_counter(1, {"value": 2})
+    buffer.add_counter(1, {"value": 3})
+    assert buffer.depth == 1
+    assert buffer.flush() == 1
+    assert Counter.get_by_id(1).value == 5
+
+
+def test_failed_flush_requeues_increments(buffer):
+    buffer._flush_counters = fail(2, buffer._flush_counters)
+    buffer.add_counter(1, {"value": 2})
+    assert buffer.flush() == 0
+    buffer.add_counter(1, {"value": 1})
+    assert buffer.flush() == 0
+    assert buffer.depth == 1
+    assert buffer.flush() == 1
+    assert Counter.get_by_id(1).value == 3
+
+
+def test_failed_flush_drops_after_max_retries(buffer):
+    buffer._flush_counters = fail(3, buffer._flush_counters)
+    buffer.add_counter(1, {"value": 2})
+    for _ in range(3):
+        buffer.flush()
+    assert buffer.depth == 0
+    # 丢弃后重新计数，新的数据仍可重试
+    buffer._flush_counters = fail(1, buffer._flush_counters)
+    buffer.add_counter(1, {"value": 1})
+    buffer.flush()
+    assert buffer.depth == 1
+    buffer.flush()
+    assert Counter.get_by_id(1).value == 1
+
+
+def test_requeue_is_bounded_by_max_pending(buffer):
+    buffer._max_pending = 1
+    buffer._flush_counters = fail(1, buffer._flush_counters)
+    buffer.add_counter(1, {"value": 2})
+    buffer.add_counter(2, {"value": 2})
+    assert buffer.depth == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="需要 fork")
+def test_child_recreates_locks_after_fork(buffer):
+    buffer.add_counter(1, {"value": 1})
+    buffer._lock.acquire()
+    pid = os.fork()
+    if pid == 0:
+        # 父进程的锁在子进程中处于被持有的状态，子进程不能因此阻塞
+        try:
+            buffer.add_counter(1, {"value": 1})
+            os._exit(0 if buffer.depth == 1 else 1)
+        except BaseException:
+            os._exit(1)
+    buffer._lock.release()
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert buffer.depth == 1